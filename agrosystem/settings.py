@@ -132,4 +132,122 @@ CELERY_BROKER_URL = 'redis://localhost:6379/0'
 # Опционально: использование Redis для результатов задач
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 
-DATA_UPLOAD_MAX_NUMBER_FILES = 10000
\ No newline at end of file
+DATA_UPLOAD_MAX_NUMBER_FILES = 10000
+
+# Размер блока (в пикселях, кратен 16) при потоковой записи мозаики.
+# None - собирать всю мозаику в памяти
+MOSAIC_BLOCK_SIZE = 1024
+
+# Параллельная привязка снимков: число потоков/процессов и тип пула ("thread" или "process").
+# В prefork-воркерах Celery пул процессов недоступен, там всегда используются потоки
+GEOREF_WORKERS = os.cpu_count() or 1
+GEOREF_EXECUTOR = "thread"
+
+# Кэш метаданных снимков (GPS, высота, размеры), ключ - SHA-256 содержимого файла
+IMAGE_METADATA_CACHE = os.path.join(BASE_DIR, "cache", "image_metadata.sqlite3")
+
+# Детекция объектов: число кадров в одном вызове модели (только без трекинга),
+# сколько кадров декодировать заранее в фоновом потоке и использовать ли трекер
+DETECTION_BATCH_SIZE = 8
+DETECTION_PREFETCH = 4
+DETECTION_TRACKING = True
+
+# Кэш моделей YOLO в процессе воркера: лимит памяти (LRU) и предзагрузка моделей
+# из static/models при старте процесса
+MODEL_CACHE_MAX_BYTES = 1024 ** 3
+MODEL_PRELOAD = True
+
+# Бэкенд инференса по умолчанию: "pytorch", "onnx" или "openvino".
+# ONNX/OpenVINO экспортируются из .pt один раз и лежат рядом с моделью в static/models
+INFERENCE_BACKEND = "pytorch"
+
+# Детекция по тайлам для кадров высокого разрешения: размер тайла (None - весь кадр),
+# перекрытие, число тайлов в одном вызове модели и порог слияния рамок между тайлами
+DETECTION_TILE_SIZE = None
+DETECTION_TILE_OVERLAP = 0.2
+DETECTION_TILE_BATCH = 8
+DETECTION_TILE_NMS_THRESHOLD = 0.5
+
+# Объединение детекций одного класса, попавших в перекрывающиеся снимки:
+# максимальное расстояние на земле в метрах (None - не объединять).
+# С дедупликацией трекер для снимков не нужен: DETECTION_TRACKING = False включает пакетную детекцию
+DEDUP_DISTANCE_M = None
+
+# Размер пакета при сохранении найденных объектов в базу (bulk_create)
+OBJECT_DETAIL_BATCH_SIZE = 1000
+
+# Мозаика в формате Cloud-Optimized GeoTIFF: тайлы 512x512, пирамида обзоров и сжатие
+# ("deflate", "jpeg", "webp" или "lzw"); качество используется для jpeg/webp
+MOSAIC_COG = True
+MOSAIC_COMPRESSION = "deflate"
+MOSAIC_COMPRESSION_QUALITY = 85
+
+# Кэш PNG-тайлов карты (XYZ) в памяти процесса веб-сервера, лимит в байтах
+TILE_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+# Пространственный индекс объектов: размер ячейки сетки в градусах (~100 м) и размер
+# страницы API объектов. При изменении ячейки индекс уже сохранённых объектов нужно пересчитать
+OBJECT_GRID_CELL_DEGREES = 0.001
+OBJECT_API_PAGE_SIZE = 1000
+OBJECT_API_MAX_PAGE_SIZE = 5000
+
+# Кластеры объектов для карты: уровни масштаба, для которых они строятся после сохранения
+# объектов, и размер ячейки в пикселях экрана. При большем масштабе карта показывает сами объекты
+CLUSTER_MIN_ZOOM = 0
+CLUSTER_MAX_ZOOM = 19
+CLUSTER_CELL_PIXELS = 64
+
+# Конвейер обработки проекта (Celery chord): число снимков в одной задаче детекции
+# и в одной задаче привязки снимков. Задачи выполняются параллельно на всех воркерах
+PIPELINE_CHUNK_SIZE = 50
+PIPELINE_GEOREF_CHUNK_SIZE = 200
+
+# Минимальный интервал между обновлениями прогресса задачи в бэкенде Celery, с
+PROGRESS_UPDATE_INTERVAL = 1.0
+# Как часто задачи измеряют память процесса для пикового RSS этапов, с (None - не измерять).
+# Измерение идёт в фоновом потоке; частые замеры (как в команде benchmark) отнимают CPU у обработки
+PROGRESS_MEMORY_INTERVAL = 0.1
+
+# Сколько секунд веб-сервер отдаёт прогресс проекта из кэша Django, не опрашивая бэкенд Celery:
+# страницы всех клиентов обновляют прогресс каждые 5 с, а чтение GroupResult стоит запроса на каждую часть
+# (кэш по умолчанию свой у каждого процесса; для нескольких процессов задайте общий CACHES, например Redis)
+PROGRESS_CACHE_TTL = 5
+
+# Long-poll списка проектов: сколько секунд держать запрос без изменений
+# и как часто проверять изменения в базе. Представление асинхронное: запускайте сайт через ASGI
+# (uvicorn/daphne, agrosystem.asgi), иначе каждая открытая вкладка занимает поток WSGI-воркера
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_INTERVAL = 1.0
+
+# Загрузка снимков по частям: размер части, который предлагается клиенту, в байтах
+UPLOAD_CHUNK_SIZE = 8 * 1024 ** 2
+# Снимки без ссылок удаляются вместе с проектами, но не раньше чем через столько секунд
+# после сохранения: новый проект мог ещё не связать их с собой
+UNUSED_BLOB_MIN_AGE = 600
+# Загрузки, которые не добавили в проект, и их .part-файлы удаляются, если не менялись столько секунд
+UPLOAD_MAX_AGE = 24 * 60 * 60
+
+# Кэш результатов обработки: проект с теми же снимками, моделью, hfov и настройками получает
+# готовую мозаику и объекты без повторной обработки. При превышении лимита (байт) удаляются
+# давно не использованные результаты; 0 - кэш отключён
+RESULT_CACHE_DIR = os.path.join(BASE_DIR, "cache", "results")
+RESULT_CACHE_MAX_BYTES = 10 * 1024 ** 3
+
+# Подсчёт объектов на видео: брать каждый N-й кадр (1 - все кадры), пропускать кадры, почти не отличающиеся
+# от последнего обработанного (средняя разница яркости 0..255, None - не проверять),
+# и число кадров в одном вызове модели
+VIDEO_FRAME_STRIDE = 1
+VIDEO_MOTION_THRESHOLD = None
+VIDEO_BATCH_SIZE = 8
+
+# Метрики Prometheus: веб-сервер отдаёт их по /metrics, воркер Celery - по HTTP на этом порту
+# (None - не запускать). Для нескольких процессов (gunicorn, prefork-пул Celery) задайте переменную
+# окружения PROMETHEUS_MULTIPROC_DIR - пустую директорию, общую для процессов одного сервиса.
+# Экспортер воркера запускается только вместе с ней: задачи выполняются в дочерних процессах пула,
+# и без общей директории их метрики до главного процесса не доходят. У каждого воркера на хосте
+# должен быть свой порт
+METRICS_WORKER_PORT = None
+
+# Предварительная мозаика (quicklook): снимки декодируются уменьшенными в 2, 4 или 8 раз
+# (JPEG draft mode), карта показывает её, пока строится полная мозаика. None - не строить
+QUICKLOOK_SCALE = 8
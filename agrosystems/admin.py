@@ -1,3 +1,27 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ProcessingRun, ProcessingStage
+
+
+class ProcessingStageInline(admin.TabularInline):
+    model = ProcessingStage
+    extra = 0
+    can_delete = False
+    fields = ("name", "task_id", "started_at", "duration", "items", "total", "peak_rss", "error")
+    readonly_fields = fields
+    ordering = ("started_at",)
+
+
+@admin.register(ProcessingRun)
+class ProcessingRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "project", "status", "cached", "image_count", "started_at", "duration")
+    list_filter = ("status", "cached")
+    search_fields = ("project__project_name", "task_id")
+    readonly_fields = [field.name for field in ProcessingRun._meta.fields]
+    inlines = [ProcessingStageInline]
+
+    @admin.display(description="Duration, s")
+    def duration(self, run):
+        if run.finished_at is None:
+            return None
+        return round((run.finished_at - run.started_at).total_seconds(), 1)
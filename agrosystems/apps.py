@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AgrosystemsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "agrosystems"
+
+    def ready(self):
+        from django.conf import settings
+        from .utils import tiles
+
+        tiles.configure(settings.TILE_CACHE_MAX_BYTES)
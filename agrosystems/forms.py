@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from .models import INFERENCE_BACKENDS
 
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField()
@@ -35,3 +36,6 @@ class AddProjectForm(forms.Form):
     model_type = forms.CharField()
     images = FileFieldForm()
     hfov = forms.FloatField()
+    inference_backend = forms.ChoiceField(choices=INFERENCE_BACKENDS, required=False)
+    # JSON-список {"sha256", "name"} снимков, загруженных заранее через /api/uploads/
+    image_blobs = forms.CharField(required=False)
@@ -0,0 +1,385 @@
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import uuid
+from unittest import mock
+
+import numpy as np
+import pyexiv2
+import rasterio
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import now
+from PIL import Image
+
+from agrosystems.models import Project
+from agrosystems.persistence import save_objects_to_db
+from agrosystems.tasks import get_detection_options, get_mosaic_options
+from agrosystems.utils import obj_counter as obj_counter_module
+from agrosystems.utils.create_map import start_processing
+from agrosystems.utils.map_creator import GeoTIFFCreator
+from agrosystems.utils.obj_counter import process_images
+from agrosystems.utils.profiling import measure
+
+STAGES = [
+    "process_image",
+    "create_geotiff",
+    "create_mosaic",
+    "calc_gps",
+    "save_objects_to_db",
+    "start_processing",
+]
+
+# Метров в градусе широты (для расстановки снимков по сетке)
+METERS_PER_DEGREE = 111320
+
+
+def to_dms(value):
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round(((value - degrees) * 60 - minutes) * 60 * 10000)
+    return f"{degrees}/1 {minutes}/1 {seconds}/10000"
+
+
+def make_synthetic_images(
+    directory, count, width, height, altitude=50, hfov=67, overlap=0.7, lat=55.75, lon=37.6, seed=0
+):
+    """
+    Writes geotagged JPEGs of a survey flight over a grid ("lawnmower" pattern).
+
+    Parameters:
+        - directory: str - Where to write the images.
+        - count: int - Number of images.
+        - width, height: int - Image size in pixels.
+        - altitude: float - RelativeAltitude of every image in meters.
+        - hfov: float - Horizontal field of view, used to place the images with the given overlap.
+        - overlap: float - Overlap of neighbouring images (0..1).
+        - lat, lon: float - Position of the first image.
+        - seed: int - Seed of the image content, so runs are reproducible.
+
+    Returns:
+        - list: Paths to the images in flight order.
+    """
+    try:
+        pyexiv2.registerNs("http://www.dji.com/drone-dji/1.0/", "drone-dji")
+    except Exception:
+        pass  # Пространство имён уже зарегистрировано
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    ground_width = 2 * math.tan(math.radians(hfov) / 2) * altitude
+    step_x = ground_width * (1 - overlap)
+    step_y = ground_width * height / width * (1 - overlap)
+    columns = max(1, math.ceil(math.sqrt(count)))
+
+    paths = []
+    for i in range(count):
+        row, column = divmod(i, columns)
+        if row % 2:
+            column = columns - 1 - column
+        image_lat = lat + row * step_y / METERS_PER_DEGREE
+        image_lon = lon + column * step_x / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+
+        # Крупная текстура, чтобы JPEG сжимался как реальный снимок поля, а не как шум
+        texture = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+        path = os.path.join(directory, f"DJI_{i:04d}.JPG")
+        Image.fromarray(texture).resize((width, height), Image.BILINEAR).save(path, quality=90)
+
+        image = pyexiv2.Image(path)
+        try:
+            image.modify_exif(
+                {
+                    "Exif.GPSInfo.GPSLatitude": to_dms(abs(image_lat)),
+                    "Exif.GPSInfo.GPSLatitudeRef": "N" if image_lat >= 0 else "S",
+                    "Exif.GPSInfo.GPSLongitude": to_dms(abs(image_lon)),
+                    "Exif.GPSInfo.GPSLongitudeRef": "E" if image_lon >= 0 else "W",
+                    "Exif.Photo.DateTimeOriginal": "2024:05:01 10:00:00",
+                }
+            )
+            image.modify_xmp(
+                {
+                    "Xmp.drone-dji.RelativeAltitude": f"+{altitude:.2f}",
+                    "Xmp.drone-dji.GimbalPitchDegree": "-90.0",
+                }
+            )
+        finally:
+            image.close()
+        paths.append(path)
+    return paths
+
+
+class StubArray:
+    """Minimal stand-in for the tensors of ultralytics results"""
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def cpu(self):
+        return self
+
+    def int(self):
+        return StubArray(self.values.astype(np.int64))
+
+    def tolist(self):
+        return self.values.tolist()
+
+    def __len__(self):
+        return len(self.values)
+
+
+class StubBoxes:
+    def __init__(self, xyxy, cls, conf, ids=None):
+        self.xyxy = StubArray(xyxy)
+        self.cls = StubArray(cls)
+        self.conf = StubArray(conf)
+        self.id = StubArray(ids) if ids is not None else None
+
+    def __len__(self):
+        return len(self.cls)
+
+
+class StubResult:
+    names = {0: "plant", 1: "weed"}
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubDetector:
+    """
+    Offline replacement of the YOLO model: a fixed number of random boxes per frame, reproducible by seed.
+    Detection time is not measured this way, only the pipeline around the model.
+    """
+
+    def __init__(self, objects_per_frame=20, seed=0):
+        self.objects_per_frame = objects_per_frame
+        self.rng = np.random.default_rng(seed)
+        self.next_id = 1
+        self.predictor = None
+
+    def detect(self, frame, track):
+        height, width = frame.shape[:2]
+        n = self.objects_per_frame
+        x1 = self.rng.uniform(0, max(1, width - 40), n)
+        y1 = self.rng.uniform(0, max(1, height - 40), n)
+        xyxy = np.stack([x1, y1, x1 + 40, y1 + 40], axis=1)
+        ids = None
+        if track:
+            ids = np.arange(self.next_id, self.next_id + n)
+            self.next_id += n
+        return StubResult(
+            StubBoxes(xyxy, self.rng.integers(0, 2, n), np.full(n, 0.9), ids)
+        )
+
+    def predict(self, frames, verbose=True, **kwargs):
+        frames = frames if isinstance(frames, list) else [frames]
+        return [self.detect(frame, track=False) for frame in frames]
+
+    def track(self, frames, persist=True, verbose=True, **kwargs):
+        frames = frames if isinstance(frames, list) else [frames]
+        return [self.detect(frame, track=True) for frame in frames]
+
+
+def copy_obj_counter(obj_counter):
+    # calc_gps заменяет объекты в списках, поэтому каждому запуску нужна своя копия
+    return {
+        class_name: {"count": details["count"], "objects": list(details["objects"])}
+        for class_name, details in obj_counter.items()
+    }
+
+
+def summarize(runs):
+    wall_times = [run["wall_time"] for run in runs]
+    return {
+        "wall_time": statistics.median(wall_times),
+        "wall_time_min": min(wall_times),
+        "peak_rss": max(run["peak_rss"] for run in runs),
+        "rss_delta": max(run["rss_delta"] for run in runs),
+        "runs": runs,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the processing pipeline on synthetic geotagged images with a stub detector "
+        "and saves wall time and peak RSS of every stage as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=20, help="Number of synthetic images")
+        parser.add_argument("--width", type=int, default=4000)
+        parser.add_argument("--height", type=int, default=3000)
+        parser.add_argument("--altitude", type=float, default=50, help="RelativeAltitude, m")
+        parser.add_argument("--hfov", type=float, default=67)
+        parser.add_argument("--overlap", type=float, default=0.7, help="Overlap of neighbouring images")
+        parser.add_argument("--objects", type=int, default=20, help="Stub detections per image")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs of every stage (the median is reported)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+        parser.add_argument("--output", default="benchmark.json", help="Where to save the results")
+        parser.add_argument("--baseline", help="Results of an earlier run to compare with")
+        parser.add_argument(
+            "--threshold", type=float, default=0.1, help="Slowdown against the baseline reported as a regression"
+        )
+        parser.add_argument(
+            "--fail-on-regression", action="store_true", help="Exit with an error if any stage regressed"
+        )
+        parser.add_argument("--workdir", help="Directory for the images and outputs (default: temporary)")
+        parser.add_argument("--keep", action="store_true", help="Do not delete the working directory")
+
+    def handle(self, *args, **options):
+        workdir = options["workdir"] or tempfile.mkdtemp(prefix="agrosystem_benchmark_")
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            results = self.run(workdir, options)
+        finally:
+            if not options["keep"]:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results saved to {options['output']}")
+
+        if options["baseline"]:
+            regressions = self.compare(results, options["baseline"], options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"Regressions: {', '.join(regressions)}")
+
+    def run(self, workdir, options):
+        config = {
+            key: options[key]
+            for key in ("images", "width", "height", "altitude", "hfov", "overlap", "objects", "repeat", "seed")
+        }
+        hfov = options["hfov"]
+        self.stdout.write(
+            f"Generating {options['images']} images {options['width']}x{options['height']} in {workdir}"
+        )
+        paths = make_synthetic_images(
+            os.path.join(workdir, "images"),
+            options["images"],
+            options["width"],
+            options["height"],
+            altitude=options["altitude"],
+            hfov=hfov,
+            overlap=options["overlap"],
+            seed=options["seed"],
+        )
+        output_path = os.path.join(workdir, "output.tif")
+        scratch_dir = os.path.join(workdir, "scratch")
+        # Без постоянного кэша метаданных: повторные запуски должны читать заголовки снимков заново
+        mosaic_options = {**get_mosaic_options(), "metadata_cache_path": None}
+        detection_options = get_detection_options()
+
+        def get_stub_model(model_path, tracking=False, warmup=True, backend="pytorch"):
+            return StubDetector(options["objects"], options["seed"])
+
+        stages = {}
+        with mock.patch.object(obj_counter_module, "get_model", get_stub_model):
+            creator = GeoTIFFCreator(paths, None, None, hfov, **mosaic_options)
+            obj_counter = process_images(paths, "stub.pt", **detection_options)
+            georeferenced = None
+
+            for stage in options["stages"]:
+                runs = []
+                for _ in range(options["repeat"]):
+                    shutil.rmtree(scratch_dir, ignore_errors=True)
+                    os.makedirs(scratch_dir)
+
+                    if stage == "process_image":
+                        _, run = measure(lambda: [creator.process_image(path) for path in paths])
+                    elif stage == "create_geotiff":
+                        params = [creator.process_image(path) for path in paths]
+                        _, run = measure(
+                            lambda: [
+                                creator.create_geotiff(
+                                    path, os.path.join(scratch_dir, f"{i}.tif"), *image_params
+                                )
+                                for i, (path, image_params) in enumerate(zip(paths, params))
+                            ]
+                        )
+                    elif stage == "create_mosaic":
+                        mosaic_creator = GeoTIFFCreator(
+                            paths, output_path, copy_obj_counter(obj_counter), hfov, **mosaic_options
+                        )
+                        _, run = measure(mosaic_creator.create_mosaic)
+                    elif stage == "calc_gps":
+                        georeferenced = creator.georeference_images(scratch_dir)
+                        geotransforms = {}
+                        for path, georeferenced_path in georeferenced:
+                            with rasterio.open(georeferenced_path) as src:
+                                geotransforms[path] = src.transform.to_gdal()
+                        _, run = measure(creator.calc_gps, copy_obj_counter(obj_counter), geotransforms)
+                    elif stage == "save_objects_to_db":
+                        run = self.measure_save(copy_obj_counter(obj_counter), output_path)
+                    else:
+                        (_, _, status), run = measure(
+                            start_processing,
+                            paths,
+                            "stub.pt",
+                            output_path,
+                            hfov,
+                            detection_options=detection_options,
+                            mosaic_options=mosaic_options,
+                        )
+                        if status != "Complete":
+                            raise CommandError("start_processing failed")
+                    runs.append(run)
+
+                stages[stage] = summarize(runs)
+                self.stdout.write(
+                    f"{stage:20} {stages[stage]['wall_time']:9.3f} s  "
+                    f"peak RSS {stages[stage]['peak_rss'] / 1024 ** 2:8.1f} MB"
+                )
+
+        return {
+            "created_at": now().isoformat(),
+            "config": config,
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "mosaic_options": mosaic_options,
+                "detection_options": detection_options,
+            },
+            "stages": stages,
+        }
+
+    def measure_save(self, obj_counter, output_path):
+        # Сохранение идёт в настоящую базу, поэтому всё откатывается после замера
+        with transaction.atomic():
+            user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+            project = Project.objects.create(
+                project_name="benchmark", model_type="stub.pt", output_path=output_path, user=user
+            )
+            saved, run = measure(save_objects_to_db, project.id, (obj_counter, output_path, "Complete"))
+            transaction.set_rollback(True)
+        if not saved:
+            raise CommandError("save_objects_to_db failed")
+        return run
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            self.stdout.write(self.style.WARNING("Baseline was measured with a different config"))
+
+        regressions = []
+        self.stdout.write(f"{'stage':20} {'baseline':>10} {'current':>10} {'change':>8}")
+        for stage, current in results["stages"].items():
+            previous = baseline.get("stages", {}).get(stage)
+            if previous is None:
+                continue
+            change = current["wall_time"] / previous["wall_time"] - 1 if previous["wall_time"] else 0
+            line = f"{stage:20} {previous['wall_time']:9.3f}s {current['wall_time']:9.3f}s {change:+8.1%}"
+            if change > threshold:
+                regressions.append(stage)
+                line = self.style.ERROR(line)
+            elif change < -threshold:
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
+        return regressions
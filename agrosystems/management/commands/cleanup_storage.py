@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from agrosystems.storage import delete_stale_uploads, delete_unused_blobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes uploads not changed for UPLOAD_MAX_AGE seconds and stored images no project uses; "
+        "run it periodically, e.g. from cron"
+    )
+
+    def handle(self, *args, **options):
+        # Сначала загрузки: снимки брошенных загрузок становятся неиспользуемыми
+        delete_stale_uploads()
+        delete_unused_blobs()
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+from .utils import model_registry, tiles
+
+# Метрики процесса (веб-сервер или процесс воркера). Если задана переменная окружения
+# PROMETHEUS_MULTIPROC_DIR, значения пишутся в файлы этой директории и суммируются по всем процессам
+# (нужно для gunicorn с несколькими воркерами и prefork-пула Celery)
+
+# Этапы обработки длятся от долей секунды (кластеры) до часов (детекция большого проекта)
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, float("inf"))
+
+STAGE_DURATION = Histogram(
+    "agrosystem_stage_duration_seconds",
+    "Duration of a pipeline stage in one task",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+)
+STAGE_ITEMS = Counter(
+    "agrosystem_stage_items_total",
+    "Items processed by pipeline stages (images for detection and georeferencing, objects for save)",
+    ["stage"],
+)
+STAGE_FAILURES = Counter(
+    "agrosystem_stage_failures_total", "Pipeline stages that ended with an exception", ["stage"]
+)
+TASK_DURATION = Histogram(
+    "agrosystem_task_duration_seconds",
+    "Run time of Celery tasks",
+    ["task", "state"],
+    buckets=DURATION_BUCKETS,
+)
+TASK_QUEUE_WAIT = Histogram(
+    "agrosystem_task_queue_wait_seconds",
+    "Time between publishing a Celery task and the start of its execution",
+    ["task"],
+    buckets=DURATION_BUCKETS,
+)
+TASK_FAILURES = Counter("agrosystem_task_failures_total", "Failed Celery tasks", ["task"])
+PROJECTS = Counter("agrosystem_projects_total", "Finished projects by final status", ["status"])
+DETECTIONS = Counter("agrosystem_detections_total", "Objects saved for finished projects", ["class_name"])
+MOSAIC_SIZE = Histogram(
+    "agrosystem_mosaic_size_bytes",
+    "File size of finished mosaics",
+    buckets=tuple(2 ** power for power in range(20, 38, 2)) + (float("inf"),),
+)
+RESULT_CACHE_LOOKUPS = Counter(
+    "agrosystem_result_cache_lookups_total", "Result cache lookups of new projects", ["result"]
+)
+CACHE_HITS = Counter("agrosystem_cache_hits_total", "In-process cache hits", ["cache"])
+CACHE_MISSES = Counter("agrosystem_cache_misses_total", "In-process cache misses", ["cache"])
+
+# Последние переданные в счётчики значения hits/misses кэшей этого процесса
+_cache_counts = {}
+_cache_lock = threading.Lock()
+# Время начала выполняющихся задач процесса по task_id
+_task_started = {}
+
+
+def sync_cache_metrics():
+    # Кэши считают попадания сами; в счётчики Prometheus переносим прирост с прошлого раза
+    with _cache_lock:
+        for name, stats in (("models", model_registry.cache_stats()), ("tiles", tiles.cache_stats())):
+            hits, misses = _cache_counts.get(name, (0, 0))
+            if stats["hits"] > hits:
+                CACHE_HITS.labels(cache=name).inc(stats["hits"] - hits)
+            if stats["misses"] > misses:
+                CACHE_MISSES.labels(cache=name).inc(stats["misses"] - misses)
+            _cache_counts[name] = (stats["hits"], stats["misses"])
+
+
+def record_stages(stages):
+    """
+    Adds the stage records of a task (ProgressReporter.stages) to the stage metrics.
+
+    Parameters:
+        - stages: list - Stage records.
+    """
+    for stage in stages:
+        STAGE_DURATION.labels(stage=stage["name"]).observe(stage["duration"])
+        STAGE_ITEMS.labels(stage=stage["name"]).inc(stage["items"])
+        if stage["error"]:
+            STAGE_FAILURES.labels(stage=stage["name"]).inc()
+
+
+def record_project(status, obj_counter=None, output_file=None):
+    """
+    Counts a finished project, its detections and the size of its mosaic.
+
+    Parameters:
+        - status: str - Final status of the project.
+        - obj_counter: dict - Saved detections.
+        - output_file: str - Path to the mosaic.
+    """
+    PROJECTS.labels(status=status).inc()
+    if status != "Complete":
+        return
+    for class_name, details in (obj_counter or {}).items():
+        DETECTIONS.labels(class_name=class_name).inc(len(details["objects"]))
+    if output_file and os.path.isfile(output_file):
+        MOSAIC_SIZE.observe(os.path.getsize(output_file))
+
+
+class QueueCollector:
+    """Collects the number of messages waiting in the Celery queues at scrape time"""
+
+    def __init__(self, app, queues):
+        self.app = app
+        self.queues = queues
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "agrosystem_queue_messages", "Messages waiting in the Celery queue", labels=["queue"]
+        )
+        try:
+            with self.app.connection_for_read() as connection:
+                connection.ensure_connection(max_retries=1)
+                channel = connection.default_channel
+                for queue in self.queues:
+                    _, messages, _ = channel.queue_declare(queue=queue, passive=True)
+                    gauge.add_metric([queue], messages)
+        except Exception as e:
+            # Брокер недоступен - отдаём остальные метрики без длины очереди
+            print(f"Ошибка при получении длины очереди: {e}")
+        yield gauge
+
+
+def is_multiprocess():
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def get_registry(app=None, queues=None):
+    """
+    Returns the registry to expose: the metrics of all processes in multiprocess mode,
+    otherwise the metrics of this process.
+
+    Parameters:
+        - app: Celery - If set, the queue lengths are collected at scrape time.
+        - queues: list - Queue names, default - the default queue of the app.
+
+    Returns:
+        - CollectorRegistry: Registry for generate_latest or start_http_server.
+    """
+    registry = CollectorRegistry()
+    if is_multiprocess():
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_RegistryCollector(REGISTRY))
+    if app is not None:
+        registry.register(QueueCollector(app, queues or [app.conf.task_default_queue]))
+    return registry
+
+
+class _RegistryCollector:
+    # Глобальный реестр процесса как коллектор, чтобы не регистрировать в нём коллектор очереди
+    def __init__(self, registry):
+        self.registry = registry
+
+    def collect(self):
+        return self.registry.collect()
+
+
+def start_worker_exporter(port, app):
+    """
+    Serves the metrics of the Celery worker over HTTP (http://<host>:<port>/metrics).
+    Tasks run in the child processes of the pool, so their metrics are only visible in multiprocess mode.
+
+    Parameters:
+        - port: int - Port of the exporter.
+        - app: Celery - Celery app, for the queue lengths.
+    """
+    start_http_server(port, registry=get_registry(app))
+
+
+def mark_process_dead(pid):
+    # Процесс пула завершился: его gauge-метрики больше не учитываются
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid)
+
+
+def render(app=None):
+    """
+    Returns:
+        - bytes: All metrics in the Prometheus text format.
+    """
+    sync_cache_metrics()
+    return generate_latest(get_registry(app))
+
+
+@before_task_publish.connect
+def add_publish_time(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.monotonic()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is not None:
+        TASK_QUEUE_WAIT.labels(task=task.name).observe(max(0, time.time() - published_at))
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started_at = _task_started.pop(task_id, None)
+    if started_at is not None:
+        TASK_DURATION.labels(task=task.name, state=state or "UNKNOWN").observe(
+            time.monotonic() - started_at
+        )
+    sync_cache_metrics()
+
+
+@task_failure.connect
+def count_task_failure(sender=None, **kwargs):
+    TASK_FAILURES.labels(task=sender.name).inc()
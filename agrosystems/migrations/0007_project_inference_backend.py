@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("agrosystems", "0006_remove_celerytask_status_alter_project_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="inference_backend",
+            field=models.CharField(
+                choices=[
+                    ("pytorch", "PyTorch"),
+                    ("onnx", "ONNX Runtime"),
+                    ("openvino", "OpenVINO"),
+                ],
+                default="pytorch",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+import math
+
+from django.db import migrations, models
+
+# Размер ячейки на момент миграции (OBJECT_GRID_CELL_DEGREES); миграция не зависит от текущих настроек
+GRID_CELL_DEGREES = 0.001
+
+
+def fill_grid_cells(apps, schema_editor):
+    ObjectDetail = apps.get_model("agrosystems", "ObjectDetail")
+    batch = []
+    for obj in ObjectDetail.objects.only("id", "gps_lat", "gps_lon").iterator(
+        chunk_size=1000
+    ):
+        obj.grid_x = math.floor(obj.gps_lon / GRID_CELL_DEGREES)
+        obj.grid_y = math.floor(obj.gps_lat / GRID_CELL_DEGREES)
+        batch.append(obj)
+        if len(batch) >= 1000:
+            ObjectDetail.objects.bulk_update(batch, ["grid_x", "grid_y"])
+            batch = []
+    ObjectDetail.objects.bulk_update(batch, ["grid_x", "grid_y"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("agrosystems", "0007_project_inference_backend"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="objectdetail",
+            name="grid_x",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="objectdetail",
+            name="grid_y",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="objectdetail",
+            index=models.Index(
+                fields=["project", "grid_x", "grid_y"], name="objectdetail_grid_idx"
+            ),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
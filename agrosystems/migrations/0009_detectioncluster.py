@@ -0,0 +1,116 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+import math
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Параметры кластеров на момент миграции (CLUSTER_MIN_ZOOM, CLUSTER_MAX_ZOOM, CLUSTER_CELL_PIXELS,
+# размер тайла); миграция не зависит от текущих настроек и кода приложения
+MIN_ZOOM = 0
+MAX_ZOOM = 19
+CELL_PIXELS = 64
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+
+
+def cluster_cell(lat, lon):
+    # Ячейка точки на MAX_ZOOM в пикселях Web Mercator (сетка XYZ-тайлов)
+    scale = TILE_SIZE * 2 ** MAX_ZOOM
+    lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+    x = (lon + 180) / 360 * scale
+    y = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * scale
+    return math.floor(x / CELL_PIXELS), math.floor(y / CELL_PIXELS)
+
+
+def build_clusters(rows):
+    # Ячейка уровня ниже - родительская (cell // 2), как у тайлов карты
+    clusters = defaultdict(lambda: [0, 0.0, 0.0])
+    for class_name, lat, lon in rows:
+        cell_x, cell_y = cluster_cell(lat, lon)
+        for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+            shift = MAX_ZOOM - zoom
+            cluster = clusters[(class_name, zoom, cell_x >> shift, cell_y >> shift)]
+            cluster[0] += 1
+            cluster[1] += lat
+            cluster[2] += lon
+    return [
+        (class_name, zoom, cell_x, cell_y, count, lat_sum / count, lon_sum / count)
+        for (class_name, zoom, cell_x, cell_y), (count, lat_sum, lon_sum) in clusters.items()
+    ]
+
+
+def build_project_clusters(apps, schema_editor):
+    ObjectDetail = apps.get_model("agrosystems", "ObjectDetail")
+    DetectionCluster = apps.get_model("agrosystems", "DetectionCluster")
+    project_ids = ObjectDetail.objects.values_list("project_id", flat=True).distinct()
+    for project_id in project_ids:
+        rows = list(
+            ObjectDetail.objects.filter(project_id=project_id)
+            .exclude(gps_lat=0, gps_lon=0)
+            .values_list("class_name", "gps_lat", "gps_lon")
+        )
+        DetectionCluster.objects.bulk_create(
+            [
+                DetectionCluster(
+                    project_id=project_id,
+                    class_name=class_name,
+                    zoom=zoom,
+                    cell_x=cell_x,
+                    cell_y=cell_y,
+                    count=count,
+                    gps_lat=lat,
+                    gps_lon=lon,
+                )
+                for class_name, zoom, cell_x, cell_y, count, lat, lon in build_clusters(rows)
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("agrosystems", "0008_objectdetail_grid"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DetectionCluster",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("class_name", models.CharField(max_length=100)),
+                ("zoom", models.IntegerField()),
+                ("cell_x", models.IntegerField()),
+                ("cell_y", models.IntegerField()),
+                ("count", models.IntegerField()),
+                ("gps_lat", models.FloatField()),
+                ("gps_lon", models.FloatField()),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="detection_clusters",
+                        to="agrosystems.project",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["project", "zoom", "cell_x", "cell_y"],
+                        name="cluster_cell_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_project_clusters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("agrosystems", "0009_detectioncluster"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="celerytask",
+            name="group_id",
+            field=models.CharField(blank=True, default="", max_length=50),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("agrosystems", "0013_resultcacheentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessingRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_id", models.CharField(blank=True, default="", max_length=50)),
+                ("status", models.CharField(default="Not complete", max_length=100)),
+                ("cached", models.BooleanField(default=False)),
+                ("image_count", models.IntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("traceback", models.TextField(blank=True, default="")),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="runs",
+                        to="agrosystems.project",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ProcessingStage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50)),
+                ("task_id", models.CharField(blank=True, default="", max_length=50)),
+                ("started_at", models.DateTimeField()),
+                ("duration", models.FloatField()),
+                ("items", models.IntegerField(default=0)),
+                ("total", models.IntegerField(default=0)),
+                ("peak_rss", models.BigIntegerField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("traceback", models.TextField(blank=True, default="")),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stages",
+                        to="agrosystems.processingrun",
+                    ),
+                ),
+            ],
+        ),
+    ]
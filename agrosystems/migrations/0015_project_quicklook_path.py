@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("agrosystems", "0014_processingrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="quicklook_path",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+    ]
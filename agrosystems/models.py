@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 
@@ -6,14 +8,26 @@ from django.conf import settings
 #     hashed_password = models.CharField(max_length=100)
 #     is_active = models.BooleanField(default=True)
 
+INFERENCE_BACKENDS = [
+    ("pytorch", "PyTorch"),
+    ("onnx", "ONNX Runtime"),
+    ("openvino", "OpenVINO"),
+]
+
+
 class Project(models.Model):
     project_name = models.CharField(max_length=100)
     model_type = models.CharField(max_length=100)
     status = models.CharField(max_length=100, default="Not complete")
     output_path = models.CharField(max_length=100)
     hfov = models.FloatField(default=67)
+    inference_backend = models.CharField(max_length=20, choices=INFERENCE_BACKENDS, default="pytorch")
     # user = models.ForeignKey(User, related_name='projects', on_delete=models.CASCADE)
     user = models.ForeignKey('auth.User', related_name='projects', on_delete=models.CASCADE)
+    # Предварительная мозаика низкого разрешения, пока строится полная
+    quicklook_path = models.CharField(max_length=255, blank=True, default="")
+    # Время последнего изменения (статуса), по нему клиент узнаёт об изменениях через long-poll
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
 class ObjectDetail(models.Model):
@@ -26,11 +40,106 @@ class ObjectDetail(models.Model):
     gps_lat = models.FloatField()
     gps_lon = models.FloatField()
     image_path = models.CharField(max_length=100)
+    # Ячейка сетки OBJECT_GRID_CELL_DEGREES - пространственный индекс для выборки по области карты
+    grid_x = models.IntegerField(default=0)
+    grid_y = models.IntegerField(default=0)
     project = models.ForeignKey(Project, related_name='object_details', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "grid_x", "grid_y"], name="objectdetail_grid_idx"),
+        ]
+
+
+class DetectionCluster(models.Model):
+    # Группа объектов одного класса в ячейке сетки уровня масштаба карты (ячейки как у XYZ-тайлов)
+    class_name = models.CharField(max_length=100)
+    zoom = models.IntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    count = models.IntegerField()
+    gps_lat = models.FloatField()
+    gps_lon = models.FloatField()
+    project = models.ForeignKey(Project, related_name='detection_clusters', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "zoom", "cell_x", "cell_y"], name="cluster_cell_idx"),
+        ]
+
+
+class ImageBlob(models.Model):
+    # Снимок хранится один раз по SHA-256 содержимого, проекты ссылаются на него через ProjectImage
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    path = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class ProjectImage(models.Model):
+    project = models.ForeignKey(Project, related_name='images', on_delete=models.CASCADE)
+    blob = models.ForeignKey(ImageBlob, related_name='project_images', on_delete=models.PROTECT)
+    name = models.CharField(max_length=255)
+
+
+class UploadSession(models.Model):
+    # Возобновляемая загрузка одного файла по частям
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    blob = models.ForeignKey(
+        ImageBlob, related_name='upload_sessions', null=True, blank=True, on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class ResultCacheEntry(models.Model):
+    # Готовый результат обработки (мозаика и объекты) по ключу: снимки, модель, hfov и настройки
+    key = models.CharField(max_length=64, unique=True)
+    mosaic_path = models.CharField(max_length=255)
+    objects_path = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class ProcessingRun(models.Model):
+    # Один запуск обработки проекта: общий итог и записи этапов (ProcessingStage)
+    project = models.ForeignKey(Project, related_name='runs', on_delete=models.CASCADE)
+    task_id = models.CharField(max_length=50, blank=True, default="")
+    status = models.CharField(max_length=100, default="Not complete")
+    # Результат взят из кэша результатов, обработки не было
+    cached = models.BooleanField(default=False)
+    image_count = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    traceback = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return f"ProcessingRun {self.id} ({self.project_id})"
+
+
+class ProcessingStage(models.Model):
+    # Этап одной задачи конвейера: детекция, привязка, мозаика и т.д.
+    run = models.ForeignKey(ProcessingRun, related_name='stages', on_delete=models.CASCADE)
+    name = models.CharField(max_length=50)
+    task_id = models.CharField(max_length=50, blank=True, default="")
+    started_at = models.DateTimeField()
+    duration = models.FloatField()  # секунды
+    items = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    peak_rss = models.BigIntegerField(null=True, blank=True)  # байты
+    error = models.TextField(blank=True, default="")
+    traceback = models.TextField(blank=True, default="")
+
 
 class CeleryTask(models.Model):
     task_id = models.CharField(max_length=50, unique=True)
+    # GroupResult задач-частей конвейера (chord), по нему считается прогресс
+    group_id = models.CharField(max_length=50, blank=True, default="")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, default=None)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
@@ -0,0 +1,200 @@
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import (
+    CeleryTask,
+    DetectionCluster,
+    ObjectDetail,
+    ProcessingRun,
+    ProcessingStage,
+    Project,
+)
+from .utils.clusters import build_clusters
+from .utils.progress import ProgressReporter
+from .utils.spatial import grid_cell
+
+
+def iter_object_details(project_id, obj_counter):
+    cell_degrees = settings.OBJECT_GRID_CELL_DEGREES
+    for class_name, details in obj_counter.items():
+        for obj in details["objects"]:
+            grid_x, grid_y = grid_cell(obj[3][0], obj[3][1], cell_degrees)
+            yield ObjectDetail(
+                project_id=project_id,
+                class_name=class_name,
+                track_id=obj[1],
+                box_x1=obj[2][0],
+                box_y1=obj[2][1],
+                box_x2=obj[2][2],
+                box_y2=obj[2][3],
+                gps_lat=obj[3][0],
+                gps_lon=obj[3][1],
+                image_path=obj[4],
+                grid_x=grid_x,
+                grid_y=grid_y,
+            )
+
+
+def save_objects_to_db(project_id, objects_data, batch_size=None, progress=None):
+    batch_size = batch_size or settings.OBJECT_DETAIL_BATCH_SIZE
+    progress = progress or ProgressReporter()
+    progress.start(
+        "save",
+        sum(len(details["objects"]) for data in objects_data[:-2] for details in data.values()),
+    )
+    try:
+        # Одна транзакция на весь результат; старые строки проекта удаляются,
+        # поэтому повторная обработка того же результата не создаёт дубликатов
+        with transaction.atomic():
+            ObjectDetail.objects.filter(project_id=project_id).delete()
+            for data in objects_data[
+                :-2
+            ]:  # Исключаем последние два элемента ('output.tif' и 'Complete')
+                objects = iter_object_details(project_id, data)
+                while True:
+                    batch = list(islice(objects, batch_size))
+                    if not batch:
+                        break
+                    ObjectDetail.objects.bulk_create(batch, batch_size=batch_size)
+                    progress.advance(len(batch))
+    except Exception as e:
+        print(f"Ошибка при сохранении в базу данных: {e}")
+        progress.fail(e)
+        return False
+    return True
+
+
+def save_clusters(project_id, progress=None):
+    progress = progress or ProgressReporter()
+    progress.start("clusters", 1)
+    # Кластеры строятся по уже сохранённым объектам; объекты без координат на карту не попадают
+    rows = list(
+        ObjectDetail.objects.filter(project_id=project_id)
+        .exclude(gps_lat=0, gps_lon=0)
+        .values_list("class_name", "gps_lat", "gps_lon")
+    )
+    try:
+        with transaction.atomic():
+            DetectionCluster.objects.filter(project_id=project_id).delete()
+            if rows:
+                class_names, lats, lons = zip(*rows)
+                DetectionCluster.objects.bulk_create(
+                    (
+                        DetectionCluster(
+                            project_id=project_id,
+                            class_name=class_name,
+                            zoom=zoom,
+                            cell_x=cell_x,
+                            cell_y=cell_y,
+                            count=count,
+                            gps_lat=lat,
+                            gps_lon=lon,
+                        )
+                        for class_name, zoom, cell_x, cell_y, count, lat, lon in build_clusters(
+                            class_names,
+                            lats,
+                            lons,
+                            settings.CLUSTER_MIN_ZOOM,
+                            settings.CLUSTER_MAX_ZOOM,
+                            settings.CLUSTER_CELL_PIXELS,
+                        )
+                    ),
+                    batch_size=settings.OBJECT_DETAIL_BATCH_SIZE,
+                )
+    except Exception as e:
+        print(f"Ошибка при сохранении кластеров в базу данных: {e}")
+        progress.fail(e)
+        return False
+    progress.advance()
+    return True
+
+
+def save_project_result(project_id, result, progress=None):
+    """
+    Saves the result of the processing task and sets the project status. Runs on the worker
+    as the last step of the pipeline, so web requests only read the Project row.
+
+    Parameters:
+        - project_id: int - Project ID.
+        - result: tuple - (obj_counter, output_file, status) returned by start_processing/finish_processing.
+        - progress: ProgressReporter - Receives the save and clusters stages.
+
+    Returns:
+        - str: Final status of the project ("Complete" or "Error").
+    """
+    progress = progress or ProgressReporter()
+    status = result[2]
+    if status != "Error" and not save_objects_to_db(project_id, result, progress=progress):
+        status = "Error"
+    # Без кластеров карта проекта не показывает объекты, поэтому это тоже ошибка обработки
+    if status != "Error" and not save_clusters(project_id, progress=progress):
+        status = "Error"
+    set_project_status(project_id, status)
+    return status
+
+
+def set_project_status(project_id, status):
+    # update() не трогает auto_now, поэтому время изменения ставим явно - по нему работает long-poll
+    Project.objects.filter(pk=project_id).update(status=status, updated_at=now())
+
+
+def set_project_quicklook(project_id, path):
+    Project.objects.filter(pk=project_id).update(quicklook_path=path, updated_at=now())
+
+
+def attach_quicklook(project_id, path):
+    # Только пока проект обрабатывается: одним запросом, без гонки с завершением обработки
+    return bool(
+        Project.objects.filter(pk=project_id, status="Not complete").update(
+            quicklook_path=path, updated_at=now()
+        )
+    )
+
+
+def save_run_stages(run_id, task_id, stages):
+    """
+    Saves the stage records of one pipeline task to the processing run.
+
+    Parameters:
+        - run_id: int - ProcessingRun ID.
+        - task_id: str - ID of the Celery task the stages ran in.
+        - stages: list - ProgressReporter.stages.
+    """
+    ProcessingStage.objects.bulk_create(
+        ProcessingStage(
+            run_id=run_id,
+            name=stage["name"],
+            task_id=task_id or "",
+            started_at=datetime.fromtimestamp(stage["started_at"], tz=timezone.utc),
+            duration=stage["duration"],
+            items=stage["items"],
+            total=stage["total"],
+            peak_rss=stage["peak_rss"],
+            error=stage["error"],
+            traceback=stage["traceback"],
+        )
+        for stage in stages
+    )
+
+
+def register_pipeline_task(project_id, task, run_id=None):
+    # Конвейер запущен воркером (промах кэша результатов): по новой записи страница проекта
+    # показывает прогресс задач-частей
+    CeleryTask.objects.create(
+        task_id=task.id,
+        group_id=task.parent.id if task.parent is not None else "",
+        project_id=project_id,
+        user_id=Project.objects.values_list("user_id", flat=True).get(pk=project_id),
+    )
+    if run_id is not None:
+        ProcessingRun.objects.filter(pk=run_id).update(cached=False)
+
+
+def finish_run(run_id, status, error="", traceback=""):
+    ProcessingRun.objects.filter(pk=run_id).update(
+        status=status, finished_at=now(), error=error, traceback=traceback
+    )
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.utils.timezone import now
+
+from .models import ProjectImage, ResultCacheEntry
+from .utils.image_metadata import file_sha256
+
+
+@lru_cache(maxsize=32)
+def _model_sha256(model_path, mtime):
+    return file_sha256(model_path)
+
+
+def get_model_hash(model_path):
+    # Хэш файла модели считается один раз на процесс, пока файл не изменится
+    return _model_sha256(os.path.abspath(model_path), os.path.getmtime(model_path))
+
+
+def make_cache_key(image_hashes, model_path, hfov, options):
+    """
+    Returns the result cache key of a processing run.
+
+    Parameters:
+        - image_hashes: list - SHA-256 of the images in processing order (the order affects the mosaic).
+        - model_path: str - Path to the model file.
+        - hfov: float - Horizontal field of view of the camera in degrees.
+        - options: dict - Processing settings that affect the result (backend, tiling, dedup, compression...).
+
+    Returns:
+        - str: Hex digest.
+    """
+    data = {
+        "images": list(image_hashes),
+        "model": get_model_hash(model_path),
+        "hfov": float(hfov),
+        "options": options,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def get_entry_dir(key):
+    return os.path.join(settings.RESULT_CACHE_DIR, key[:2], key)
+
+
+def get_cached_result(key):
+    """
+    Returns:
+        - ResultCacheEntry: Entry with its files in place, or None. A hit marks the entry as recently used.
+    """
+    entry = ResultCacheEntry.objects.filter(key=key).first()
+    if entry is None:
+        return None
+    if not (os.path.isfile(entry.mosaic_path) and os.path.isfile(entry.objects_path)):
+        delete_entry(entry)
+        return None
+    ResultCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=now())
+    return entry
+
+
+def _link_or_copy(src, dst):
+    # Жёсткая ссылка не занимает места; между файловыми системами - копия
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _project_image_hashes(project_id, project_directory):
+    return {
+        os.path.join(project_directory, name): sha256
+        for name, sha256 in ProjectImage.objects.filter(project_id=project_id).values_list(
+            "name", "blob__sha256"
+        )
+    }
+
+
+def store_result(key, project_id, output_file, obj_counter):
+    """
+    Stores the mosaic and the detections of a finished project, then evicts the least recently used
+    entries over RESULT_CACHE_MAX_BYTES.
+
+    Image paths of the objects are stored as image hashes, so the result can be restored into a project
+    whose files have other names.
+
+    Parameters:
+        - key: str - Result of make_cache_key.
+        - project_id: int - Project the result belongs to.
+        - output_file: str - Path to the mosaic of the project.
+        - obj_counter: dict - Detections with GPS coordinates.
+    """
+    if settings.RESULT_CACHE_MAX_BYTES <= 0 or ResultCacheEntry.objects.filter(key=key).exists():
+        return
+
+    hashes = _project_image_hashes(project_id, os.path.dirname(os.path.abspath(output_file)))
+    entry_dir = get_entry_dir(key)
+    os.makedirs(entry_dir, exist_ok=True)
+    mosaic_path = os.path.join(entry_dir, "output.tif")
+    objects_path = os.path.join(entry_dir, "objects.json")
+    if not os.path.exists(mosaic_path):
+        _link_or_copy(output_file, mosaic_path)
+    with open(objects_path, "w") as f:
+        json.dump(
+            {
+                class_name: {
+                    "count": details["count"],
+                    "objects": [
+                        [*obj[:4], hashes.get(os.path.abspath(obj[4]), obj[4])]
+                        for obj in details["objects"]
+                    ],
+                }
+                for class_name, details in obj_counter.items()
+            },
+            f,
+        )
+
+    try:
+        ResultCacheEntry.objects.create(
+            key=key,
+            mosaic_path=mosaic_path,
+            objects_path=objects_path,
+            size=os.path.getsize(mosaic_path) + os.path.getsize(objects_path),
+        )
+    except IntegrityError:
+        # Тот же результат одновременно сохранил другой воркер
+        return
+    evict(settings.RESULT_CACHE_MAX_BYTES)
+
+
+def restore_result(key, project_id, output_file):
+    """
+    Puts the cached mosaic into the project and returns the cached detections.
+
+    Parameters:
+        - key: str - Result of make_cache_key.
+        - project_id: int - Project to restore the result into.
+        - output_file: str - Path to the mosaic of the project.
+
+    Returns:
+        - dict: obj_counter with image paths of this project, or None if the entry is gone.
+    """
+    entry = get_cached_result(key)
+    if entry is None:
+        return None
+
+    paths = {}
+    for path, sha256 in _project_image_hashes(
+        project_id, os.path.dirname(os.path.abspath(output_file))
+    ).items():
+        paths.setdefault(sha256, path)
+
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    _link_or_copy(entry.mosaic_path, output_file)
+    with open(entry.objects_path) as f:
+        obj_counter = json.load(f)
+    for details in obj_counter.values():
+        for obj in details["objects"]:
+            obj[4] = paths.get(obj[4], obj[4])
+    return obj_counter
+
+
+def delete_entry(entry):
+    shutil.rmtree(get_entry_dir(entry.key), ignore_errors=True)
+    entry.delete()
+
+
+def evict(max_bytes):
+    """Deletes the least recently used entries until the cache fits into max_bytes"""
+    total = ResultCacheEntry.objects.aggregate(total=Sum("size"))["total"] or 0
+    for entry in ResultCacheEntry.objects.order_by("last_used_at").iterator():
+        if total <= max_bytes:
+            break
+        total -= entry.size
+        delete_entry(entry)
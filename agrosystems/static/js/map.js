@@ -3,177 +3,193 @@ var map = L.map('map', {
         51.505, -0.09
     ],
     zoom: 13,
-    maxZoom: 100, // Устанавливаем очень высокое значение для maxZoom
+    maxZoom: 30,
 });
 
 L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', {}).addTo(map);
 
-function populateSidebar(objects) {
+// Маркеры каждого класса лежат в своём слое, чтобы их можно было скрывать целиком
+var classLayers = {};
+var hiddenClasses = {};
+// Номер последнего запроса объектов: ответы на устаревшие запросы отбрасываются
+var objectsRequest = 0;
+
+function populateSidebar(classCounts) {
     var list = document.getElementById('object-list');
     list.innerHTML = ''; // Очистить список перед заполнением
-    if (objects.length === 0){
+    if (Object.keys(classCounts).length === 0){
         list.innerHTML = '<p>No object details available for this project.</p>';
     }
 
-    var groupedObjects = {};
-    objects.forEach(function(detail) {
-        // if (detail.class_name === "Gryadka") {
-        //     return;
-        // }
-        if (!groupedObjects[detail.class_name]) {
-            groupedObjects[detail.class_name] = [];
-        }
-        groupedObjects[detail.class_name].push(detail);
-    });
+    for (var title in classCounts) {
+        classLayers[title] = L.layerGroup().addTo(map);
 
-    for (var title in groupedObjects) {
-        var group = groupedObjects[title];
         var groupItem = document.createElement('div');
         groupItem.className = 'object-group';
+        groupItem.style.padding = '10px';
+        groupItem.style.border = '1px solid #ccc';
+        groupItem.style.marginBottom = '5px';
 
         var groupTitle = document.createElement('h4');
-        groupTitle.style.cursor = 'pointer';
-        groupTitle.onclick = function() {
-            toggleGroupVisibility(this.nextElementSibling); // Изменено
-        };
-
-        var detailsContainer = document.createElement('div'); // Создаем контейнер для деталей
-        detailsContainer.style.display = 'none'; // Изначально скрыт
-
-        group.forEach(function(detail) {
-            var item = document.createElement('div');
-            var hideButton = document.createElement('button');
-            hideButton.innerHTML = 'Hide';
-            hideButton.style.padding = '2px 5px';
-            hideButton.style.marginLeft = '10px';
-            hideButton.style.backgroundColor = '#d9534f';
-            hideButton.style.border = 'none';
-            hideButton.style.color = 'white';
-            hideButton.style.cursor = 'pointer';
-            item.className = 'object-detail';
-            item.style.padding = '10px';
-            item.style.border = '1px solid #ccc';
-            item.style.marginBottom = '5px';
-            var gpsInfo = document.createElement('p');
-            gpsInfo.textContent = `GPS: [${detail.gps_lat}, ${detail.gps_lon}]`;
-            gpsInfo.style.cursor = 'pointer';
-            item.appendChild(gpsInfo);
-            item.appendChild(hideButton);
-            detailsContainer.appendChild(item); // Добавляем элемент в контейнер деталей
-            var marker = L.marker([detail.gps_lat, detail.gps_lon]).addTo(map);
-            marker.bindPopup(`<b>${detail.class_name}</b><br>Track ID: ${detail.track_id}`);
-            item.marker = marker;
-            item.isVisible = true;
-            gpsInfo.onclick = function(event) {
-                var marker = item.marker;
-                map.setView(marker.getLatLng(), 30);
-            }
-            hideButton.onclick = function(event) {
-                event.stopPropagation(); // Предотвращаем всплытие события, чтобы не срабатывал обработчик item.onclick
-                toggleObjectsVisibility(detail.class_name, hideButton);
+        groupTitle.textContent = `${title} (${classCounts[title]})`;
+
+        var hideButton = document.createElement('button');
+        hideButton.innerHTML = 'Hide';
+        hideButton.style.padding = '2px 5px';
+        hideButton.style.backgroundColor = '#d9534f';
+        hideButton.style.border = 'none';
+        hideButton.style.color = 'white';
+        hideButton.style.cursor = 'pointer';
+        hideButton.onclick = (function(title, hideButton) {
+            return function() {
+                toggleObjectsVisibility(title, hideButton);
             };
-        });
-        
+        })(title, hideButton);
+
         groupItem.appendChild(groupTitle);
-        groupItem.appendChild(detailsContainer); // Добавляем контейнер деталей в элемент группы
+        groupItem.appendChild(hideButton);
         list.appendChild(groupItem);
-        groupTitle.textContent = `${title} (${group.length})`;
     }
 }
 
-// Функция для скрытия/показа группы объектов
-function toggleGroupVisibility(detailsContainer) {
-    if (detailsContainer.style.display === 'none') {
-        detailsContainer.style.display = 'block';
+
+// Функция для скрытия/показа объектов класса
+function toggleObjectsVisibility(title, hideButton) {
+    if (hiddenClasses[title]) {
+        delete hiddenClasses[title];
+        classLayers[title].addTo(map); // Показать маркеры
+        hideButton.textContent = 'Hide';
+        loadVisibleObjects();
     } else {
-        detailsContainer.style.display = 'none';
+        hiddenClasses[title] = true;
+        classLayers[title].remove(); // Скрыть маркеры
+        hideButton.textContent = 'Show';
     }
 }
 
 
-function toggleObjectsVisibility(title) {
-    var groups = document.getElementsByClassName('object-group');
-    for (var i = 0; i < groups.length; i++) {
-        var group = groups[i];
-        var groupTitle = group.getElementsByTagName('h4')[0].textContent;
-        var groupName = groupTitle.split(' (')[0];
-        if (groupName === title) {
-            var items = group.getElementsByClassName('object-detail');
-            for (var j = 0; j < items.length; j++) {
-                var item = items[j];
-                var marker = item.marker; // Получаем маркер, связанный с элементом
-                var hideButton = item.getElementsByTagName('button')[0]; // Получаем кнопку
-                if (item.isVisible) {
-                    marker.remove(); // Скрыть маркер
-                    hideButton.textContent = 'Show'; // Изменить текст кнопки на "Show"
-                } else {
-                    marker.addTo(map); // Показать маркер
-                    hideButton.textContent = 'Hide'; // Изменить текст кнопки на "Hide"
-                }
-                item.isVisible = !item.isVisible; // Инвертировать состояние видимости
-            }
-        }
+// Заменяет маркеры классов только когда загружена вся область, чтобы карта не мигала
+function replaceMarkers(visibleClasses, markers) {
+    visibleClasses.forEach(function(title) {
+        classLayers[title].clearLayers();
+        (markers[title] || []).forEach(marker => classLayers[title].addLayer(marker));
+    });
+}
+
+
+function createClusterMarker(feature) {
+    var props = feature.properties;
+    var latLng = [feature.geometry.coordinates[1], feature.geometry.coordinates[0]];
+    if (props.count === 1) {
+        return L.marker(latLng).bindPopup(`<b>${props.class_name}</b>`);
     }
+    var size = 30 + 6 * Math.floor(Math.log10(props.count));
+    var marker = L.marker(latLng, {
+        icon: L.divIcon({
+            className: 'cluster-marker',
+            html: `<div>${props.count}</div>`,
+            iconSize: [size, size],
+        }),
+    });
+    marker.bindTooltip(`${props.class_name}: ${props.count}`);
+    marker.on('click', function() {
+        map.setView(latLng, map.getZoom() + 2);
+    });
+    return marker;
 }
 
 
-function addGeoTIFFToMapAndCalculateFieldInfo(geoTIFFUrl, map) {
-    fetch(geoTIFFUrl).then(response => response.arrayBuffer()).then(arrayBuffer => {
-        parseGeoraster(arrayBuffer).then(georaster => {
-            const pixelValuesToColorFn = values => {
-                if (values[0] === 0 && values[1] === 0 && values[2] === 0) {
-                    return 'rgba(0, 0, 0, 0)'; // Полностью прозрачный
-                } else {
-                    return `rgb(${values[0]}, ${values[1]}, ${values[2]})`;
-                }
-            };
+// Загружает объекты видимой области карты: на мелком масштабе - готовые кластеры,
+// на крупном - сами объекты постранично
+function loadVisibleObjects() {
+    var request = ++objectsRequest;
+    var visibleClasses = Object.keys(classLayers).filter(title => !hiddenClasses[title]);
+    var markers = {};
+    if (visibleClasses.length === 0) {
+        return;
+    }
 
-            const layer = new GeoRasterLayer({
-                georaster: georaster,
-                pixelValuesToColorFn: pixelValuesToColorFn,
-                resolution: 64 // adjust according to your needs
-            });
-            layer.addTo(map);
-
-            // Zoom to the bounds of the raster layer
-            map.fitBounds(layer.getBounds());
-
-            // Автоматическое определение UTM зоны
-            const centralLongitude = (georaster.xmin + georaster.xmax) / 2;
-            const utmZone = Math.floor((centralLongitude + 180) / 6) + 1;
-            const utmProjection = `+proj=utm +zone=${utmZone} +datum=WGS84 +units=m +no_defs`;
-
-            // Подсчет пустых пикселей
-            let emptyPixelCount = 0;
-            for (let i = 0; i < georaster.values[0].length; i++) {
-                if (georaster.values[0][i] === georaster.noDataValue) {
-                    emptyPixelCount++;
-                }
+    if (map.getZoom() <= clusterMaxZoom) {
+        var params = new URLSearchParams({bbox: map.getBounds().toBBoxString(), zoom: Math.round(map.getZoom())});
+        visibleClasses.forEach(title => params.append('class_name', title));
+        fetch(`${clustersUrl}?${params}`).then(response => response.json()).then(data => {
+            if (request !== objectsRequest) {
+                return;
             }
+            data.features.forEach(function(feature) {
+                var title = feature.properties.class_name;
+                (markers[title] = markers[title] || []).push(createClusterMarker(feature));
+            });
+            replaceMarkers(visibleClasses, markers);
+        });
+        return;
+    }
 
-            // Преобразование координат границ в UTM
-            const [xmin, ymin] = proj4("EPSG:4326", utmProjection, [georaster.xmin, georaster.ymin]);
-            const [xmax, ymax] = proj4("EPSG:4326", utmProjection, [georaster.xmax, georaster.ymax]);
-
-            // Рассчитайте размеры и площадь поля в метрах, исключая пустые пиксели
-            const totalPixelCount = georaster.width * georaster.height;
-            const validPixelCount = totalPixelCount - emptyPixelCount;
-            const widthInMeters = Math.abs(xmax - xmin);
-            const heightInMeters = Math.abs(ymax - ymin);
-            const areaInSquareMeters = validPixelCount * (widthInMeters * heightInMeters / totalPixelCount);
-
-            // Отобразите информацию о поле
-            const infoList = document.getElementById('info-list');
-            infoList.innerHTML = `
-                <li>Field Area: ${areaInSquareMeters.toFixed(2)} sq.m.</li>
-                <li>Field Width: ${widthInMeters.toFixed(2)} m</li>
-                <li>Field Height: ${heightInMeters.toFixed(2)} m</li>
-            `;
+    function loadPage(cursor) {
+        var params = new URLSearchParams({bbox: map.getBounds().toBBoxString(), cursor: cursor});
+        visibleClasses.forEach(title => params.append('class_name', title));
+        fetch(`${objectsUrl}?${params}`).then(response => response.json()).then(data => {
+            if (request !== objectsRequest) {
+                return;
+            }
+            data.features.forEach(function(feature) {
+                var props = feature.properties;
+                var coords = feature.geometry.coordinates;
+                var marker = L.marker([coords[1], coords[0]]);
+                marker.bindPopup(`<b>${props.class_name}</b><br>Track ID: ${props.track_id}`);
+                (markers[props.class_name] = markers[props.class_name] || []).push(marker);
+            });
+            if (data.next_cursor !== null) {
+                loadPage(data.next_cursor);
+                return;
+            }
+            replaceMarkers(visibleClasses, markers);
         });
+    }
+    loadPage(0);
+}
+
+
+function addMosaicToMap(tileUrl, mosaicInfo, map) {
+    if (!mosaicInfo) {
+        return;
+    }
+    // Тайлы мозаики режет сервер, в браузер GeoTIFF целиком не загружается
+    L.tileLayer(tileUrl, {
+        maxZoom: 30,
+        bounds: mosaicInfo.bounds,
+    }).addTo(map);
+    map.fitBounds(mosaicInfo.bounds);
+
+    // Размеры и площадь поля посчитаны на сервере
+    const infoList = document.getElementById('info-list');
+    infoList.innerHTML = `
+        <li>Field Area: ${mosaicInfo.area_m2.toFixed(2)} sq.m.</li>
+        <li>Field Width: ${mosaicInfo.width_m.toFixed(2)} m</li>
+        <li>Field Height: ${mosaicInfo.height_m.toFixed(2)} m</li>
+    `;
+}
+
+
+// Пока показана предварительная мозаика, ждём окончания обработки и перезагружаем карту с полной
+function waitForFullMosaic() {
+    $.getJSON(progressUrl, function(response) {
+        if (response.status === 'Not complete') {
+            setTimeout(waitForFullMosaic, 5000);
+        } else {
+            location.reload();
+        }
+    }).fail(function() {
+        setTimeout(waitForFullMosaic, 15000);
     });
 }
 
 
 // Вызов функции для заполнения боковой панели
-populateSidebar(objectDetails);
-addGeoTIFFToMapAndCalculateFieldInfo(geoTIFFUrl, map);
+populateSidebar(JSON.parse(document.getElementById('class-counts').textContent));
+addMosaicToMap(tileUrl, JSON.parse(document.getElementById('mosaic-info').textContent), map);
+map.on('moveend', loadVisibleObjects);
+loadVisibleObjects();
+if (isPreview) {
+    waitForFullMosaic();
+}
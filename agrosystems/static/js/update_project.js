@@ -35,51 +35,135 @@ function getCookie(name) {
 }
 
 
+// Проекты пользователя по id и время сервера, с которого ждём изменений
+var projectsById = {};
+var lastTimestamp = null;
+
+
 function updateProjects() {
     $.ajax({
         url: '/',
         type: 'GET',
         dataType: 'json',
         success: function(response) {
-            var projects = response.projects;
-            var projectsList = $('#projectsList');
-            projectsList.empty(); // Clear the current list of projects
-            projects.forEach(function(project) {
-                var buttons = '';
-                if (project.status === 'Complete') {
-                    var viewMapUrl = `/view-map/${project.id}/`; // Предполагается, что у вас есть такой URL-паттерн
-                    buttons = `
-                        <div class="project-actions">
-                            <button onclick="location.href='${viewMapUrl}'">View Map</button>
-                            <button onclick="deleteProject(${project.id})">Delete</button>
-                        </div>
-                    `;
-                } else if (project.status === 'Error') {
-                    buttons = `
-                        <div class="project-actions">
-                            <button onclick="deleteProject(${project.id})">Delete</button>
-                        </div>
-                    `;
-                }
-                projectsList.append(`
-                    <div class="project">
-                        <h3>${project.project_name}</h3>
-                        <p>Model type: ${project.model_type}</p>
-                        <p>Status: ${project.status}</p>
-                        ${buttons}
-                    </div>
-                `);
+            projectsById = {};
+            response.projects.forEach(function(project) {
+                projectsById[project.id] = project;
+            });
+            lastTimestamp = response.timestamp;
+            renderProjects();
+        }
+    });
+}
+
+
+// Long-poll: сервер отвечает, когда изменился какой-нибудь проект, или по таймауту
+function pollProjects() {
+    if (lastTimestamp === null) {
+        setTimeout(pollProjects, 1000);
+        return;
+    }
+    $.ajax({
+        url: '/api/projects/changes/',
+        type: 'GET',
+        data: {since: lastTimestamp},
+        dataType: 'json',
+        success: function(response) {
+            response.projects.forEach(function(project) {
+                projectsById[project.id] = project;
             });
+            lastTimestamp = response.timestamp;
+            if (response.projects.length > 0) {
+                renderProjects();
+            }
+            pollProjects();
+        },
+        error: function() {
+            setTimeout(pollProjects, 5000);
         }
     });
 }
 
 
+function renderProjects() {
+    var projectsList = $('#projectsList');
+    projectsList.empty(); // Clear the current list of projects
+    Object.values(projectsById).forEach(function(project) {
+        var buttons = '';
+        if (project.status === 'Complete') {
+            var viewMapUrl = `/view-map/${project.id}/`; // Предполагается, что у вас есть такой URL-паттерн
+            buttons = `
+                <div class="project-actions">
+                    <button onclick="location.href='${viewMapUrl}'">View Map</button>
+                    <button onclick="deleteProject(${project.id})">Delete</button>
+                </div>
+            `;
+        } else if (project.status === 'Not complete' && project.quicklook_path) {
+            // Предварительная мозаика уже построена, полная ещё обрабатывается
+            buttons = `
+                <div class="project-actions">
+                    <button onclick="location.href='/view-map/${project.id}/'">Preview Map</button>
+                </div>
+            `;
+        } else if (project.status === 'Error') {
+            buttons = `
+                <div class="project-actions">
+                    <button onclick="deleteProject(${project.id})">Delete</button>
+                </div>
+            `;
+        }
+        projectsList.append(`
+            <div class="project">
+                <h3>${project.project_name}</h3>
+                <p>Model type: ${project.model_type}</p>
+                <p>Status: ${project.status}</p>
+                <p class="project-progress" id="progress-${project.id}"></p>
+                ${buttons}
+            </div>
+        `);
+    });
+    refreshProgress();
+}
+
+
+// Прогресс обновляется только у проектов, которые ещё обрабатываются
+function refreshProgress() {
+    Object.values(projectsById).forEach(function(project) {
+        if (project.status === 'Not complete') {
+            updateProgress(project.id);
+        }
+    });
+}
+
+
+// Показывает этап обработки проекта, сколько обработано и скорость
+function updateProgress(projectId) {
+    $.getJSON(`/api/projects/${projectId}/progress/`, function(response) {
+        var progress = response.progress;
+        if (!progress) {
+            return;
+        }
+        var lines = [];
+        if (progress.stage) {
+            lines.push(`${progress.stage}: ${progress.done}/${progress.total} (${progress.rate}/s)`);
+        }
+        if (progress.chunks) {
+            lines.push(`Chunks: ${progress.chunks.done}/${progress.chunks.total}`);
+            for (var stage in progress.stages) {
+                var info = progress.stages[stage];
+                lines.push(`${stage}: ${info.done}/${info.total} (${info.rate.toFixed(2)}/s)`);
+            }
+        }
+        $(`#progress-${projectId}`).html(lines.join('<br>'));
+    });
+}
+
 
 $(document).ready(function() {
     // Update the list of projects immediately on page load
     updateProjects();
 
-    // Update the list of projects every 5 seconds
-    setInterval(updateProjects, 5000);
+    // Further changes of the projects come through the long poll
+    pollProjects();
+    setInterval(refreshProgress, 5000);
 });
@@ -0,0 +1,111 @@
+// Загрузка снимков по частям с возобновлением: при обрыве соединения загрузка
+// продолжается с последнего принятого байта, а уже сохранённые на сервере снимки не загружаются вовсе
+document.addEventListener('DOMContentLoaded', function () {
+    var form = document.getElementById('addProjectForm');
+    if (!form) {
+        return;
+    }
+    var csrftoken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    var status = document.getElementById('uploadProgress');
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function request(url, options) {
+        options = options || {};
+        options.headers = Object.assign({'X-CSRFToken': csrftoken}, options.headers || {});
+        var response = await fetch(url, options);
+        var data = await response.json();
+        if (!response.ok && response.status !== 409) {
+            throw new Error(data.error || response.statusText);
+        }
+        return data;
+    }
+
+    async function fileSha256(file) {
+        // crypto.subtle доступен только по HTTPS и на localhost; без хэша сервер посчитает его сам
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        var digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function uploadFile(file, onProgress) {
+        var sha256 = await fileSha256(file);
+        // Незавершённую загрузку того же файла (например, до перезагрузки страницы) продолжаем
+        var key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        var uploadId = localStorage.getItem(key);
+        var upload = null;
+        if (uploadId) {
+            upload = await request(`/api/uploads/${uploadId}/`).catch(() => null);
+        }
+        if (!upload) {
+            upload = await request('/api/uploads/', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({filename: file.name, size: file.size, sha256: sha256}),
+            });
+            if (upload.upload_id) {
+                localStorage.setItem(key, upload.upload_id);
+            }
+        }
+        var chunkSize = upload.chunk_size || 8 * 1024 * 1024;
+        var retries = 0;
+
+        while (!upload.complete) {
+            onProgress(upload.offset);
+            try {
+                upload = await request(`/api/uploads/${upload.upload_id}/?offset=${upload.offset}`, {
+                    method: 'PUT',
+                    headers: {'Content-Type': 'application/octet-stream'},
+                    body: file.slice(upload.offset, upload.offset + chunkSize),
+                });
+                retries = 0;
+            } catch (error) {
+                // Соединение оборвалось: ждём и спрашиваем у сервера, сколько байт он принял
+                if (++retries > 10) {
+                    throw error;
+                }
+                await sleep(Math.min(30000, 1000 * 2 ** retries));
+                upload = await request(`/api/uploads/${upload.upload_id}/`).catch(() => upload);
+            }
+        }
+        localStorage.removeItem(key);
+        onProgress(file.size);
+        return {sha256: upload.sha256, name: file.name};
+    }
+
+    form.addEventListener('submit', async function (event) {
+        var input = form.querySelector('input[name=images]');
+        if (!window.fetch || input.files.length === 0) {
+            return; // Обычная отправка формы
+        }
+        event.preventDefault();
+        var files = Array.from(input.files);
+        var totalBytes = files.reduce((sum, file) => sum + file.size, 0);
+        var doneBytes = 0;
+        var blobs = [];
+
+        try {
+            for (var i = 0; i < files.length; i++) {
+                blobs.push(await uploadFile(files[i], function (offset) {
+                    var percent = totalBytes ? Math.round(100 * (doneBytes + offset) / totalBytes) : 100;
+                    status.textContent = `Uploading ${i + 1}/${files.length}: ${percent}%`;
+                }));
+                doneBytes += files[i].size;
+            }
+        } catch (error) {
+            status.textContent = `Upload failed: ${error.message}. Submit the form again to resume.`;
+            return;
+        }
+
+        var data = new FormData(form);
+        data.delete('images');
+        data.append('image_blobs', JSON.stringify(blobs));
+        status.textContent = 'Creating the project...';
+        var response = await fetch(form.action, {method: 'POST', body: data});
+        window.location.href = response.redirected ? response.url : '/';
+    });
+});
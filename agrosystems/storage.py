@@ -0,0 +1,223 @@
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError, Q
+from django.utils.timezone import now
+
+from .models import ImageBlob, ProjectImage, UploadSession
+from .utils.lru import SizedLRUCache
+
+# Состояние SHA-256 незавершённых загрузок в этом процессе: (принято байт, hashlib-объект).
+# Если загрузку продолжили в другом процессе, уже принятая часть файла хэшируется заново один раз
+_upload_hashes = SizedLRUCache(max_size=1024, sizeof=lambda value: 1)
+
+
+def get_blob_path(sha256, filename):
+    # Расширение оставляем, чтобы файл можно было открыть по имени
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join(settings.MEDIA_ROOT, "blobs", sha256[:2], f"{sha256}{ext}")
+
+
+def get_upload_path(upload_id):
+    return os.path.join(settings.MEDIA_ROOT, "uploads", f"{upload_id}.part")
+
+
+def store_blob(temp_path, sha256, size, filename):
+    """
+    Moves the fully received file into the content-addressed storage.
+
+    Parameters:
+        - temp_path: str - Path to the received file.
+        - sha256: str - Hex digest of its content.
+        - size: int - File size in bytes.
+        - filename: str - Original file name (only the extension is used).
+
+    Returns:
+        - ImageBlob: The stored blob. If the same content is already stored, the received copy is deleted.
+    """
+    blob = ImageBlob.objects.filter(sha256=sha256).first()
+    if blob is not None and os.path.isfile(blob.path):
+        os.remove(temp_path)
+        return blob
+
+    path = get_blob_path(sha256, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    try:
+        with transaction.atomic():
+            blob, _ = ImageBlob.objects.update_or_create(
+                sha256=sha256, defaults={"size": size, "path": path}
+            )
+    except IntegrityError:
+        # Тот же файл одновременно сохранил другой запрос
+        blob = ImageBlob.objects.get(sha256=sha256)
+    return blob
+
+
+def store_uploaded_file(uploaded_file):
+    """
+    Streams a file of a multipart upload to disk, hashing it on the way, and stores it as a blob.
+
+    Parameters:
+        - uploaded_file: UploadedFile - File from request.FILES.
+
+    Returns:
+        - ImageBlob: The stored blob.
+    """
+    temp_path = get_upload_path(uuid.uuid4())
+    os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_path, "wb") as f:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return store_blob(temp_path, digest.hexdigest(), size, uploaded_file.name)
+
+
+def append_chunk(session, offset, stream, read_size=64 * 1024):
+    """
+    Appends the next chunk of a resumable upload, hashing it while it is written.
+
+    Parameters:
+        - session: UploadSession - Open upload session.
+        - offset: int - Position of the chunk in the file; must be equal to the number of bytes received so far.
+        - stream: file-like - Request body with the chunk.
+        - read_size: int - Number of bytes read at a time.
+
+    Returns:
+        - bool: False if the offset does not match (the client should ask for the current offset and resume).
+          When the last byte is received, the file is stored as a blob and session.blob is set.
+    """
+    if offset != session.received or session.blob_id is not None:
+        return False
+
+    temp_path = get_upload_path(session.id)
+    os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+    received, digest = _upload_hashes.pop(session.id, (None, None))
+
+    with open(temp_path, "r+b" if os.path.exists(temp_path) else "w+b") as f:
+        # Обрезаем хвост, оставшийся от оборванного запроса, который не попал в базу
+        f.truncate(session.received)
+        if received != session.received:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(read_size), b""):
+                digest.update(chunk)
+        f.seek(session.received)
+        for chunk in iter(lambda: stream.read(read_size), b""):
+            chunk = chunk[: session.size - session.received]
+            digest.update(chunk)
+            f.write(chunk)
+            session.received += len(chunk)
+
+    if session.received >= session.size:
+        session.blob = store_blob(temp_path, digest.hexdigest(), session.size, session.filename)
+    else:
+        _upload_hashes.set(session.id, (session.received, digest))
+    session.save(update_fields=["received", "blob"])
+    return True
+
+
+def get_user_blobs(user, hashes):
+    """
+    Finds stored blobs by SHA-256 among the files the user has already uploaded.
+
+    Parameters:
+        - user: User - Owner of the uploads and projects.
+        - hashes: list - Hex digests sent by the client.
+
+    Returns:
+        - dict: {sha256: ImageBlob} of the blobs referenced by the user's upload sessions or projects.
+          A hash alone is not a proof that the client has the file, so blobs of other users are not returned.
+    """
+    blobs = ImageBlob.objects.filter(sha256__in=hashes).filter(
+        Q(upload_sessions__user=user) | Q(project_images__project__user=user)
+    )
+    return {blob.sha256: blob for blob in blobs.distinct()}
+
+
+def link_project_images(project, blobs_with_names, project_directory):
+    """
+    Adds the blobs to the project and links them into the project directory under their original names.
+    Hard links (or symlinks across file systems) cost no extra disk space.
+
+    Parameters:
+        - project: Project - Project to add the images to.
+        - blobs_with_names: list - (ImageBlob, original file name) pairs.
+        - project_directory: str - Directory of the project files.
+
+    Returns:
+        - list: Paths of the images in the project directory.
+    """
+    fs = FileSystemStorage(location=project_directory)
+    file_paths = []
+    project_images = []
+    for blob, name in blobs_with_names:
+        file_path = fs.path(fs.get_available_name(os.path.basename(name)))
+        try:
+            os.link(blob.path, file_path)
+        except OSError:
+            os.symlink(os.path.abspath(blob.path), file_path)
+        file_paths.append(file_path)
+        project_images.append(
+            ProjectImage(project=project, blob=blob, name=os.path.basename(file_path))
+        )
+    ProjectImage.objects.bulk_create(project_images)
+    return file_paths
+
+
+def delete_unused_blobs():
+    # Удаляем файлы, на которые больше не ссылается ни один проект и ни одна загрузка.
+    # Недавно сохранённые пропускаем: add_project может ещё не успеть связать их с проектом
+    unused = ImageBlob.objects.filter(
+        project_images__isnull=True,
+        upload_sessions__isnull=True,
+        created_at__lt=now() - timedelta(seconds=settings.UNUSED_BLOB_MIN_AGE),
+    )
+    for blob in unused:
+        try:
+            with transaction.atomic():
+                # Сначала строка: если снимок уже взял новый проект, PROTECT не даст её удалить
+                deleted, _ = ImageBlob.objects.filter(pk=blob.pk, upload_sessions__isnull=True).delete()
+        except ProtectedError:
+            continue
+        if deleted and os.path.isfile(blob.path):
+            os.remove(blob.path)
+
+
+def delete_stale_uploads():
+    # Брошенные загрузки: без изменений дольше UPLOAD_MAX_AGE (время изменения .part-файла,
+    # если файла нет - время создания). Завершённые, но не добавленные в проект, тоже удаляются,
+    # их снимки потом убирает delete_unused_blobs
+    cutoff = now() - timedelta(seconds=settings.UPLOAD_MAX_AGE)
+    for session in UploadSession.objects.filter(created_at__lt=cutoff):
+        path = get_upload_path(session.id)
+        if os.path.isfile(path) and os.path.getmtime(path) >= cutoff.timestamp():
+            continue
+        delete_upload(session)
+
+    # .part-файлы без загрузки: оборванные запросы add_project (store_uploaded_file)
+    upload_dir = os.path.join(settings.MEDIA_ROOT, "uploads")
+    if not os.path.isdir(upload_dir):
+        return
+    session_ids = {str(upload_id) for upload_id in UploadSession.objects.values_list("id", flat=True)}
+    for entry in os.scandir(upload_dir):
+        if (
+            entry.name.endswith(".part")
+            and entry.name[: -len(".part")] not in session_ids
+            and entry.stat().st_mtime < cutoff.timestamp()
+        ):
+            os.remove(entry.path)
+
+
+def delete_upload(session):
+    _upload_hashes.pop(session.id)
+    if os.path.isfile(get_upload_path(session.id)):
+        os.remove(get_upload_path(session.id))
+    session.delete()
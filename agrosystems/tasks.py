@@ -1,7 +1,415 @@
-from celery import shared_task
-from .utils.create_map import start_processing  # Импортируем вашу функцию обработки
+import os
+import shutil
+from contextlib import contextmanager
+from celery import chord, shared_task
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from django.conf import settings
+from . import metrics, result_cache
+from .persistence import (
+    attach_quicklook,
+    finish_run,
+    register_pipeline_task,
+    save_project_result,
+    save_run_stages,
+    set_project_quicklook,
+    set_project_status,
+)
+from .utils import model_registry
+from .utils.create_map import finish_processing, start_processing  # Импортируем вашу функцию обработки
+from .utils.map_creator import GeoTIFFCreator
+from .utils.obj_counter import process_images, process_video
+from .utils.progress import ProgressReporter
+
+
+def get_detection_options(backend=None):
+    return {
+        "batch_size": settings.DETECTION_BATCH_SIZE,
+        "prefetch": settings.DETECTION_PREFETCH,
+        "track": settings.DETECTION_TRACKING,
+        "backend": backend or settings.INFERENCE_BACKEND,
+        "tile_size": settings.DETECTION_TILE_SIZE,
+        "tile_overlap": settings.DETECTION_TILE_OVERLAP,
+        "tile_batch": settings.DETECTION_TILE_BATCH,
+        "tile_nms_threshold": settings.DETECTION_TILE_NMS_THRESHOLD,
+    }
+
+
+def get_mosaic_options():
+    return {
+        "block_size": settings.MOSAIC_BLOCK_SIZE,
+        "workers": settings.GEOREF_WORKERS,
+        "executor": settings.GEOREF_EXECUTOR,
+        "metadata_cache_path": settings.IMAGE_METADATA_CACHE,
+        "cog": settings.MOSAIC_COG,
+        "compress": settings.MOSAIC_COMPRESSION,
+        "quality": settings.MOSAIC_COMPRESSION_QUALITY,
+    }
+
+
+def get_video_options(backend=None):
+    return {
+        "backend": backend or settings.INFERENCE_BACKEND,
+        "batch_size": settings.VIDEO_BATCH_SIZE,
+        "prefetch": settings.DETECTION_PREFETCH,
+        "stride": settings.VIDEO_FRAME_STRIDE,
+        "motion_threshold": settings.VIDEO_MOTION_THRESHOLD,
+    }
+
+
+def get_result_options(backend=None):
+    # Настройки, от которых зависит результат обработки (часть ключа кэша результатов);
+    # размеры пакетов, число потоков и т.п. на результат не влияют
+    detection = get_detection_options(backend)
+    mosaic = get_mosaic_options()
+    return {
+        "track": detection["track"],
+        "backend": detection["backend"],
+        "tile_size": detection["tile_size"],
+        "tile_overlap": detection["tile_overlap"],
+        "tile_nms_threshold": detection["tile_nms_threshold"],
+        "block_size": mosaic["block_size"],
+        "cog": mosaic["cog"],
+        "compress": mosaic["compress"],
+        "quality": mosaic["quality"],
+        "dedup_distance": settings.DEDUP_DISTANCE_M,
+    }
+
+
+def get_progress(task):
+    return ProgressReporter(
+        task,
+        min_interval=settings.PROGRESS_UPDATE_INTERVAL,
+        track_memory=bool(settings.PROGRESS_MEMORY_INTERVAL),
+        memory_interval=settings.PROGRESS_MEMORY_INTERVAL,
+    )
+
+
+@contextmanager
+def instrumented(task, run_id=None):
+    # Прогресс задачи; записи её этапов сохраняются в запуск обработки, даже если задача упала
+    progress = get_progress(task)
+    try:
+        yield progress
+    except Exception as e:
+        progress.fail(e)
+        raise
+    finally:
+        progress.finish()
+        metrics.record_stages(progress.stages)
+        if run_id is not None:
+            save_run_stages(run_id, task.request.id, progress.stages)
+
+
+def complete_project(project_id, result, progress, cache_key=None, run_id=None):
+    if project_id is None:
+        return result
+    if cache_key and result[2] == "Complete":
+        try:
+            result_cache.store_result(cache_key, project_id, result[1], result[0])
+        except Exception as e:
+            # Кэш не должен ломать сохранение результата проекта
+            print(f"Ошибка при сохранении результата в кэш: {e}")
+    status = save_project_result(project_id, result, progress=progress)
+    if status == "Complete":
+        # Полная мозаика готова, предварительная больше не нужна
+        remove_quicklook(project_id, result[1])
+    metrics.record_project(status, result[0], result[1])
+    if run_id is not None:
+        finish_run(run_id, status, progress.error, progress.traceback)
+    # Объекты уже в базе, в бэкенде результатов их не дублируем
+    return None, result[1], status
+
+
+@shared_task(bind=True)
+def process_project(
+    self, images_path, model_path, output_file, hfov, backend=None, project_id=None, run_id=None
+):
+    with instrumented(self, run_id) as progress:
+        obj_counter, _, status = start_processing(
+            images_path,
+            model_path,
+            output_file,
+            hfov,
+            detection_options=get_detection_options(backend),
+            mosaic_options=get_mosaic_options(),
+            dedup_distance=settings.DEDUP_DISTANCE_M,
+            progress=progress,
+        )
+        return complete_project(
+            project_id, (obj_counter, output_file, status), progress, run_id=run_id
+        )
+
+
+def get_quicklook_path(output_file):
+    return os.path.join(os.path.dirname(os.path.abspath(output_file)), "quicklook.tif")
+
+
+def remove_quicklook(project_id, output_file):
+    quicklook_path = get_quicklook_path(output_file)
+    if os.path.exists(quicklook_path):
+        os.remove(quicklook_path)
+    set_project_quicklook(project_id, "")
+
+
+@shared_task(bind=True)
+def build_quicklook(self, images_path, output_file, hfov, project_id, run_id=None):
+    # Предварительная мозаика из уменьшенных при декодировании снимков; видна, пока строится полная
+    quicklook_path = get_quicklook_path(output_file)
+    mosaic_options = get_mosaic_options()
+    with instrumented(self, run_id) as progress:
+        creator = GeoTIFFCreator(
+            images_path,
+            quicklook_path,
+            None,
+            hfov,
+            workers=mosaic_options["workers"],
+            metadata_cache_path=mosaic_options["metadata_cache_path"],
+            progress=progress,
+        )
+        if creator.create_quicklook(settings.QUICKLOOK_SCALE) is None:
+            return None
+    # Полная обработка могла завершиться раньше - тогда предварительная мозаика не нужна
+    if not attach_quicklook(project_id, quicklook_path) and os.path.exists(quicklook_path):
+        os.remove(quicklook_path)
+    return quicklook_path
+
+
+def split_chunks(items, chunk_size):
+    return [items[i : i + chunk_size] for i in range(0, len(items), max(1, chunk_size))]
+
+
+def get_georef_dir(output_file):
+    # VRT-файлы лежат в директории проекта: их создают и читают разные воркеры
+    return os.path.join(os.path.dirname(os.path.abspath(output_file)), "georef")
+
+
+@shared_task(bind=True)
+def detect_chunk(self, images_path, model_path, backend=None, run_id=None):
+    with instrumented(self, run_id) as progress:
+        return process_images(
+            images_path, model_path, progress=progress, **get_detection_options(backend)
+        )
+
+
+@shared_task(bind=True)
+def georeference_chunk(self, images_path, georef_dir, hfov, run_id=None):
+    os.makedirs(georef_dir, exist_ok=True)
+    with instrumented(self, run_id) as progress:
+        creator = GeoTIFFCreator(
+            images_path, None, None, hfov, progress=progress, **get_mosaic_options()
+        )
+        return creator.georeference_images(georef_dir)
+
+
+@shared_task(bind=True)
+def finalize_project(
+    self,
+    chunk_results,
+    images_path,
+    output_file,
+    hfov,
+    detection_chunks,
+    project_id=None,
+    cache_key=None,
+    run_id=None,
+):
+    # Результаты chord идут в порядке задач: сначала детекция, затем привязка
+    obj_counters = chunk_results[:detection_chunks]
+    georeferenced = [pair for pairs in chunk_results[detection_chunks:] for pair in pairs]
+    with instrumented(self, run_id) as progress:
+        try:
+            obj_counter, _, status = finish_processing(
+                images_path,
+                obj_counters,
+                georeferenced,
+                output_file,
+                hfov,
+                mosaic_options=get_mosaic_options(),
+                dedup_distance=settings.DEDUP_DISTANCE_M,
+                progress=progress,
+            )
+        finally:
+            shutil.rmtree(get_georef_dir(output_file), ignore_errors=True)
+        return complete_project(
+            project_id,
+            (obj_counter, output_file, status),
+            progress,
+            cache_key=cache_key,
+            run_id=run_id,
+        )
+
+
+@shared_task(bind=True)
+def restore_cached_result(
+    self, cache_key, output_file, project_id, images_path, model_path, hfov, backend=None, run_id=None
+):
+    # Попадание в кэш результатов: мозаика связывается с проектом, объекты сохраняются в базу
+    with instrumented(self, run_id) as progress:
+        progress.start("restore", 1)
+        obj_counter = result_cache.restore_result(cache_key, project_id, output_file)
+        progress.advance()
+        if obj_counter is not None:
+            return complete_project(
+                project_id, (obj_counter, output_file, "Complete"), progress, run_id=run_id
+            )
+
+    # Запись вытеснили из кэша после проверки в add_project: обрабатываем снимки заново
+    print(f"Результат проекта {project_id} вытеснен из кэша, запускается обработка")
+    task = start_project_processing(
+        images_path,
+        model_path,
+        output_file,
+        hfov,
+        backend,
+        project_id=project_id,
+        cache_key=cache_key,
+        run_id=run_id,
+    )
+    register_pipeline_task(project_id, task, run_id=run_id)
+    return None, output_file, "Not complete"
+
+
+@shared_task(bind=True)
+def count_video_objects(self, video_path, model_path, backend=None):
+    # Прогресс стадии video: кадры видео, rate - кадров в секунду
+    with instrumented(self) as progress:
+        return process_video(
+            video_path, model_path, progress=progress, **get_video_options(backend)
+        )
+
 
 @shared_task
-def process_project(images_path, model_path, output_file, hfov):
-    obj_counter, _, status = start_processing(images_path, model_path, output_file, hfov)
-    return obj_counter, output_file, status
+def mark_project_failed(request, exc, traceback, project_id, run_id=None, georef_dir=None):
+    # Errback конвейера: одна из задач-частей упала, и finalize_project не будет вызван
+    print(f"Ошибка обработки проекта {project_id}: {exc}")
+    if georef_dir is not None:
+        shutil.rmtree(georef_dir, ignore_errors=True)
+    set_project_status(project_id, "Error")
+    metrics.record_project("Error")
+    if run_id is not None:
+        finish_run(run_id, "Error", repr(exc), traceback or "")
+
+
+def launch_project_pipeline(
+    images_path,
+    model_path,
+    output_file,
+    hfov,
+    backend=None,
+    project_id=None,
+    cache_key=None,
+    run_id=None,
+):
+    """
+    Starts processing of the project as a Celery chord: detection and georeferencing of image chunks
+    run in parallel on all workers, finalize_project builds the mosaic and geolocates the objects.
+
+    Parameters:
+        - images_path: list - Paths to the images.
+        - model_path: str - Path to the model file (.pt) to use.
+        - output_file: str - Path to the output GeoTIFF mosaic.
+        - hfov: float - Horizontal field of view of the camera in degrees.
+        - backend: str - Inference backend, None - settings.INFERENCE_BACKEND.
+        - project_id: int - Project whose objects and status are saved by the worker when processing ends.
+          None - the result only goes to the Celery result backend.
+        - cache_key: str - Result cache key (result_cache.make_cache_key); the finished result is stored under it.
+        - run_id: int - ProcessingRun that receives the stage records of every task and the final status.
+
+    Returns:
+        - AsyncResult: Result of finalize_project, the same (obj_counter, output_file, status) as process_project
+          (obj_counter is None when it is saved to the project). Its parent is the saved GroupResult
+          of the chunk tasks (for progress reporting).
+    """
+    # Трекер должен видеть все кадры подряд, поэтому с трекингом детекция идёт одной задачей
+    if settings.DETECTION_TRACKING and not settings.DETECTION_TILE_SIZE:
+        detection_chunks = [images_path]
+    else:
+        detection_chunks = split_chunks(images_path, settings.PIPELINE_CHUNK_SIZE)
+    georef_chunks = split_chunks(images_path, settings.PIPELINE_GEOREF_CHUNK_SIZE)
+    georef_dir = get_georef_dir(output_file)
+
+    header = [
+        detect_chunk.s(chunk, model_path, backend, run_id=run_id) for chunk in detection_chunks
+    ] + [
+        georeference_chunk.s(chunk, georef_dir, hfov, run_id=run_id) for chunk in georef_chunks
+    ]
+    callback = finalize_project.s(
+        images_path,
+        output_file,
+        hfov,
+        len(detection_chunks),
+        project_id=project_id,
+        cache_key=cache_key,
+        run_id=run_id,
+    )
+    if project_id is not None:
+        callback.on_error(mark_project_failed.s(project_id, run_id, georef_dir=georef_dir))
+    result = chord(header)(callback)
+    # Группу сохраняем в бэкенде, чтобы по её id можно было узнать прогресс задач-частей
+    if result.parent is not None:
+        result.parent.save()
+    return result
+
+
+def start_project_processing(
+    images_path,
+    model_path,
+    output_file,
+    hfov,
+    backend=None,
+    project_id=None,
+    cache_key=None,
+    run_id=None,
+):
+    """
+    Queues the quicklook mosaic (if QUICKLOOK_SCALE is set) and starts the processing pipeline of the project.
+    The parameters are the same as of launch_project_pipeline.
+
+    Returns:
+        - AsyncResult: Result of launch_project_pipeline.
+    """
+    # Предварительная мозаика ставится в очередь первой, чтобы карта появилась сразу
+    if settings.QUICKLOOK_SCALE:
+        build_quicklook.delay(images_path, output_file, hfov, project_id, run_id=run_id)
+    return launch_project_pipeline(
+        images_path,
+        model_path,
+        output_file,
+        hfov,
+        backend,
+        project_id=project_id,
+        cache_key=cache_key,
+        run_id=run_id,
+    )
+
+
+@worker_process_init.connect
+def init_model_registry(**kwargs):
+    """Configures the model registry of the worker process and preloads the models from static/models"""
+    model_registry.configure(settings.MODEL_CACHE_MAX_BYTES)
+    if not settings.MODEL_PRELOAD:
+        return
+
+    from .views import get_model_path, scan_models_directory
+
+    model_registry.preload_models(
+        [get_model_path(os.path.join("models", name)) for name in scan_models_directory()],
+        tracking=settings.DETECTION_TRACKING,
+        backend=settings.INFERENCE_BACKEND,
+    )
+
+
+@worker_init.connect
+def start_metrics_exporter(sender=None, **kwargs):
+    """Starts the Prometheus exporter of the worker in its main process (see settings.METRICS_WORKER_PORT)"""
+    if not settings.METRICS_WORKER_PORT:
+        return
+    if not metrics.is_multiprocess():
+        print("Экспортер метрик воркера не запущен: не задана переменная PROMETHEUS_MULTIPROC_DIR")
+        return
+    metrics.start_worker_exporter(settings.METRICS_WORKER_PORT, sender.app)
+
+
+@worker_process_shutdown.connect
+def clean_process_metrics(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
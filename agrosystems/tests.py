@@ -1,3 +1,1221 @@
-from django.test import TestCase
+import hashlib
+import importlib.util
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import warnings
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cv2
+import numpy as np
+import rasterio
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from PIL import Image
+from prometheus_client import REGISTRY
+from rasterio.errors import NotGeoreferencedWarning
+
+from . import metrics, result_cache, storage
+from .management.commands.benchmark import StubDetector, make_synthetic_images
+from .models import (
+    CeleryTask,
+    DetectionCluster,
+    ImageBlob,
+    ObjectDetail,
+    ProcessingRun,
+    Project,
+    ProjectImage,
+    ResultCacheEntry,
+    UploadSession,
+)
+from .persistence import save_objects_to_db, save_project_result, set_project_status
+from .tasks import (
+    build_quicklook,
+    get_progress,
+    get_quicklook_path,
+    remove_quicklook,
+    restore_cached_result,
+)
+from .utils import model_registry, tiles
+from .utils.clusters import build_clusters
+from .utils.dedup import deduplicate_objects
+from .utils.image_metadata import (
+    EMPTY_METADATA,
+    MetadataCache,
+    get_image_metadata,
+    read_image_metadata,
+)
+from .utils.inference_backends import resolve_model_path
+from .utils.map_creator import GeoTIFFCreator
+from .utils.obj_counter import ObjectDetails, merge_tile_boxes, process_video, read_video_frames
+from .utils.profiling import PeakMemory
+from .utils.progress import ProgressReporter
+from .views import get_project_mosaic
+
+
+class SyntheticImagesMixin:
+    # Геопривязанные снимки съёмочного полёта, как в команде benchmark
+    image_count = 4
+    image_size = (320, 240)
+
+    def setUp(self):
+        super().setUp()
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.image_paths = make_synthetic_images(
+            os.path.join(self.workdir, "images"), self.image_count, *self.image_size
+        )
+
+    def make_creator(self, output_name="output.tif", obj_counter=None, **kwargs):
+        kwargs.setdefault("cog", False)
+        return GeoTIFFCreator(
+            self.image_paths,
+            os.path.join(self.workdir, output_name),
+            obj_counter or {},
+            hfov_degrees=67,
+            **kwargs,
+        )
+
+
+class WindowedMosaicTests(SyntheticImagesMixin, SimpleTestCase):
+    def test_windowed_mosaic_matches_in_memory_merge(self):
+        windowed_path, _ = self.make_creator("windowed.tif", block_size=128).create_mosaic()
+        merged_path, _ = self.make_creator("merged.tif", block_size=None).create_mosaic()
+
+        with rasterio.open(windowed_path) as windowed, rasterio.open(merged_path) as merged:
+            self.assertEqual((windowed.width, windowed.height), (merged.width, merged.height))
+            self.assertTrue(windowed.transform.almost_equals(merged.transform))
+            self.assertTrue(windowed.profile["tiled"])
+            self.assertEqual(windowed.block_shapes[0], (128, 128))
+            windowed_data = windowed.read()
+            merged_data = merged.read()
+            filled = windowed.read_masks(1) > 0
+
+        # Пиксели с изображением совпадают с rasterio.merge, пустые области закрыты маской
+        self.assertTrue(filled.any())
+        np.testing.assert_array_equal(windowed_data[:, filled], merged_data[:, filled])
+        self.assertFalse(windowed_data[:, ~filled].any())
+
+    def test_block_size_does_not_change_the_mosaic(self):
+        small_path, _ = self.make_creator("small.tif", block_size=64).create_mosaic()
+        large_path, _ = self.make_creator("large.tif", block_size=256).create_mosaic()
+        with rasterio.open(small_path) as small, rasterio.open(large_path) as large:
+            np.testing.assert_array_equal(small.read(), large.read())
+
+
+class VrtGeoreferencingTests(SyntheticImagesMixin, SimpleTestCase):
+    def test_vrt_matches_temporary_geotiff(self):
+        scratch_dir = os.path.join(self.workdir, "scratch")
+        os.makedirs(scratch_dir)
+        vrt_path = self.make_creator(use_vrt=True).georeference_image(self.image_paths[0], scratch_dir)
+        tif_path = self.make_creator(use_vrt=False).georeference_image(self.image_paths[0], scratch_dir)
+
+        self.assertTrue(vrt_path.endswith(".vrt"))
+        # VRT ссылается на исходный JPEG и не содержит пикселей
+        self.assertLess(os.path.getsize(vrt_path), 4096)
+        with rasterio.open(vrt_path) as vrt, rasterio.open(tif_path) as tif:
+            self.assertEqual(vrt.transform, tif.transform)
+            self.assertTrue(vrt.crs.is_geographic)
+            vrt_data, tif_data = vrt.read(), tif.read()
+        # VRT декодирует JPEG через GDAL, временный GeoTIFF - через PIL: декодеры расходятся на единицы
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", NotGeoreferencedWarning)
+            with rasterio.open(self.image_paths[0]) as jpg:
+                np.testing.assert_array_equal(vrt_data, jpg.read())
+        self.assertLessEqual(np.abs(vrt_data.astype(int) - tif_data).max(), 16)
+
+    def test_image_without_gps_is_skipped(self):
+        path = os.path.join(self.workdir, "no_gps.jpg")
+        Image.new("RGB", (64, 48)).save(path)
+        self.assertIsNone(self.make_creator().georeference_image(path, self.workdir))
+
+
+class CogMosaicTests(SyntheticImagesMixin, SimpleTestCase):
+    # Мозаика больше блока 512x512, чтобы у COG были обзоры
+    image_size = (1024, 768)
+
+    def test_cog_has_tiles_and_overviews(self):
+        cog_path, _ = self.make_creator("cog.tif", cog=True).create_mosaic()
+        plain_path, _ = self.make_creator("plain.tif", cog=False).create_mosaic()
+
+        with rasterio.open(cog_path) as cog, rasterio.open(plain_path) as plain:
+            self.assertEqual(cog.tags(ns="IMAGE_STRUCTURE").get("LAYOUT"), "COG")
+            self.assertEqual(cog.block_shapes[0], (512, 512))
+            self.assertEqual(cog.compression.name, "deflate")
+            self.assertTrue(cog.overviews(1))
+            self.assertEqual(cog.transform, plain.transform)
+            # deflate без потерь: пиксели и маска совпадают с обычной мозаикой
+            np.testing.assert_array_equal(cog.read(), plain.read())
+            np.testing.assert_array_equal(cog.read_masks(1), plain.read_masks(1))
+
+    def test_lossy_compression(self):
+        cog_path, _ = self.make_creator("cog.tif", cog=True, compress="jpeg", quality=70).create_mosaic()
+        with rasterio.open(cog_path) as cog:
+            self.assertEqual(cog.compression.name, "jpeg")
+            self.assertEqual(cog.count, 3)
+            self.assertTrue(cog.overviews(1))
+
+
+def tile_at(lat, lon, z):
+    n = 2 ** z
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return int((lon + 180) / 360 * n), int(y)
+
+
+class TileRenderingTests(SyntheticImagesMixin, SimpleTestCase):
+    image_size = (1024, 768)
+
+    def setUp(self):
+        super().setUp()
+        self.mosaic_path, _ = self.make_creator("cog.tif", cog=True).create_mosaic()
+        (south, west), (north, east) = tiles.mosaic_info(self.mosaic_path)["bounds"]
+        self.center = ((south + north) / 2, (west + east) / 2)
+        with rasterio.open(self.mosaic_path) as src:
+            self.overviews = src.overviews(1)
+
+    def render(self, z):
+        x, y = tile_at(*self.center, z)
+        with mock.patch("agrosystems.utils.tiles.rasterio.open", wraps=rasterio.open) as open_mock:
+            png = tiles.render_tile(self.mosaic_path, z, x, y)
+        with Image.open(io.BytesIO(png)) as image:
+            return np.asarray(image.convert("RGBA")), open_mock.call_args.kwargs
+
+    def test_select_overview_level(self):
+        self.assertIsNone(tiles.select_overview_level(0.5, 1, [2, 4, 8]))
+        self.assertIsNone(tiles.select_overview_level(1.5, 1, [2, 4, 8]))
+        self.assertEqual(tiles.select_overview_level(2, 1, [2, 4, 8]), 0)
+        self.assertEqual(tiles.select_overview_level(5, 1, [2, 4, 8]), 1)
+        self.assertEqual(tiles.select_overview_level(100, 1, [2, 4, 8]), 2)
+        self.assertIsNone(tiles.select_overview_level(100, 1, []))
+
+    def test_low_zoom_tile_reads_overview(self):
+        self.assertTrue(self.overviews)
+        # Пиксель тайла z=17 ~0.7 м, пиксель мозаики ~0.07 м
+        rgba, open_kwargs = self.render(17)
+        self.assertEqual(open_kwargs, {"overview_level": len(self.overviews) - 1})
+        self.assertTrue((rgba[..., 3] > 0).any())
+
+        # Тайл из обзора почти не отличается от тайла из полного разрешения
+        with mock.patch("agrosystems.utils.tiles.select_overview_level", return_value=None):
+            full, _ = self.render(17)
+        opaque = (rgba[..., 3] > 0) & (full[..., 3] > 0)
+        self.assertGreater(opaque.mean(), 0.9 * (full[..., 3] > 0).mean())
+        diff = np.abs(rgba[opaque, :3].astype(int) - full[opaque, :3])
+        self.assertLess(diff.mean(), 8)
+
+    def test_high_zoom_tile_reads_full_resolution(self):
+        rgba, open_kwargs = self.render(22)
+        self.assertEqual(open_kwargs, {})
+        self.assertTrue((rgba[..., 3] > 0).all())
+
+    def test_tile_outside_mosaic_is_transparent(self):
+        png = tiles.render_tile(self.mosaic_path, 17, 0, 0)
+        with Image.open(io.BytesIO(png)) as image:
+            self.assertFalse(np.asarray(image.convert("RGBA"))[..., 3].any())
+
+
+class QuicklookTests(SyntheticImagesMixin, TestCase):
+    image_size = (1024, 768)
+
+    def setUp(self):
+        super().setUp()
+        self.settings_override = override_settings(
+            QUICKLOOK_SCALE=8, IMAGE_METADATA_CACHE=os.path.join(self.workdir, "metadata.sqlite3")
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.output_file = os.path.join(self.workdir, "output.tif")
+        self.project = Project.objects.create(
+            project_name="test",
+            model_type="model.pt",
+            output_path=self.output_file,
+            user=User.objects.create_user("tester", password="password"),
+        )
+
+    def test_quicklook_covers_the_mosaic(self):
+        mosaic_path, _ = self.make_creator("mosaic.tif").create_mosaic()
+        quicklook_path = self.make_creator("quicklook.tif").create_quicklook(8)
+
+        with rasterio.open(mosaic_path) as mosaic, rasterio.open(quicklook_path) as quicklook:
+            self.assertEqual(quicklook.tags(ns="IMAGE_STRUCTURE").get("LAYOUT"), "COG")
+            self.assertAlmostEqual(quicklook.width, mosaic.width / 8, delta=2)
+            self.assertAlmostEqual(quicklook.height, mosaic.height / 8, delta=2)
+            # Охват совпадает с точностью до пикселя предварительной мозаики
+            for edge, expected in zip(quicklook.bounds, mosaic.bounds):
+                self.assertAlmostEqual(edge, expected, delta=quicklook.res[0])
+        self.assertFalse(os.path.exists(f"{quicklook_path}.tmp"))
+
+    def test_quicklook_is_shown_while_processing(self):
+        build_quicklook.apply(args=(self.image_paths, self.output_file, 67, self.project.id))
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.quicklook_path, get_quicklook_path(self.output_file))
+        self.assertEqual(get_project_mosaic(self.project), self.project.quicklook_path)
+
+        # Готовая мозаика заменяет предварительную
+        with open(self.output_file, "wb") as f:
+            f.write(b"mosaic")
+        remove_quicklook(self.project.id, self.output_file)
+        set_project_status(self.project.id, "Complete")
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.quicklook_path, "")
+        self.assertFalse(os.path.exists(get_quicklook_path(self.output_file)))
+        self.assertEqual(get_project_mosaic(self.project), self.output_file)
+
+    def test_quicklook_of_finished_project_is_discarded(self):
+        set_project_status(self.project.id, "Complete")
+        build_quicklook.apply(args=(self.image_paths, self.output_file, 67, self.project.id))
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.quicklook_path, "")
+        self.assertFalse(os.path.exists(get_quicklook_path(self.output_file)))
+
+
+class MetadataCacheTests(SyntheticImagesMixin, SimpleTestCase):
+    image_count = 1
+
+    def setUp(self):
+        super().setUp()
+        self.cache_path = os.path.join(self.workdir, "cache", "image_metadata.sqlite3")
+        self.cache = MetadataCache(self.cache_path)
+        self.addCleanup(self.cache.close)
+
+    def test_header_is_read_once(self):
+        path = self.image_paths[0]
+        expected = read_image_metadata(path)
+        self.assertAlmostEqual(expected.lat, 55.75, places=5)
+        self.assertAlmostEqual(expected.lon, 37.6, places=5)
+        self.assertEqual(expected.relative_alt, 50)
+        self.assertEqual((expected.width, expected.height), self.image_size)
+
+        self.assertEqual(get_image_metadata(path, self.cache), expected)
+        with mock.patch("agrosystems.utils.image_metadata.read_image_metadata") as read:
+            self.assertEqual(get_image_metadata(path, self.cache), expected)
+        read.assert_not_called()
+
+    def test_cache_survives_reopening(self):
+        expected = get_image_metadata(self.image_paths[0], self.cache)
+        self.cache.close()
+        self.cache = MetadataCache(self.cache_path)
+        with mock.patch("agrosystems.utils.image_metadata.read_image_metadata") as read:
+            self.assertEqual(get_image_metadata(self.image_paths[0], self.cache), expected)
+        read.assert_not_called()
+
+    def test_file_is_hashed_again_only_after_change(self):
+        path = self.image_paths[0]
+        with open(path, "rb") as f:
+            expected = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(self.cache.get_file_hash(path), expected)
+        with mock.patch("agrosystems.utils.image_metadata.file_sha256") as sha256:
+            self.assertEqual(self.cache.get_file_hash(path), expected)
+        sha256.assert_not_called()
+
+        with open(path, "ab") as f:
+            f.write(b"\0")
+        self.assertNotEqual(self.cache.get_file_hash(path), expected)
+
+    def test_failed_read_is_not_cached(self):
+        path = os.path.join(self.workdir, "broken.jpg")
+        with open(path, "wb") as f:
+            f.write(b"not an image")
+        self.assertEqual(get_image_metadata(path, self.cache), EMPTY_METADATA)
+        self.assertIsNone(self.cache.get(self.cache.get_file_hash(path)))
+
+
+class CalcGpsTests(SimpleTestCase):
+    def setUp(self):
+        self.creator = GeoTIFFCreator([], None, {}, hfov_degrees=67)
+
+    def test_matches_per_object_conversion(self):
+        rng = np.random.default_rng(0)
+        geotransforms = {
+            "/georef/DJI_0001.vrt": (37.6, 1e-6, 2e-7, 55.75, -1e-7, -1e-6),
+            "/georef/DJI_0002.vrt": (37.7, 2e-6, 0.0, 55.8, 0.0, -2e-6),
+        }
+        # Объекты сопоставляются со снимками по имени файла без расширения
+        image_transforms = {
+            "/images/DJI_0001.JPG": geotransforms["/georef/DJI_0001.vrt"],
+            "/images/DJI_0002.JPG": geotransforms["/georef/DJI_0002.vrt"],
+        }
+        obj_counter = {}
+        for class_name in ("plant", "weed"):
+            objects = []
+            for image_path in image_transforms:
+                for x1, y1 in rng.integers(0, 4000, (5, 2)).tolist():
+                    objects.append(ObjectDetails(class_name, None, (x1, y1, x1 + 30, y1 + 40), None, image_path))
+            obj_counter[class_name] = {"count": len(objects), "objects": list(objects)}
+        expected = {
+            class_name: [
+                self.creator.pixels_to_coords(
+                    image_transforms[obj.image_path],
+                    (obj.box[0] + obj.box[2]) / 2,
+                    (obj.box[1] + obj.box[3]) / 2,
+                )
+                for obj in details["objects"]
+            ]
+            for class_name, details in obj_counter.items()
+        }
+
+        result = self.creator.calc_gps(obj_counter, geotransforms)
+
+        for class_name, details in result.items():
+            self.assertEqual(len(details["objects"]), 10)
+            for obj, (lat, lon) in zip(details["objects"], expected[class_name]):
+                self.assertEqual(obj.class_name, class_name)
+                self.assertAlmostEqual(obj.gps[0], lat, places=12)
+                self.assertAlmostEqual(obj.gps[1], lon, places=12)
+
+    def test_objects_without_georeferenced_image_keep_empty_gps(self):
+        obj_counter = {"plant": {"count": 1, "objects": [make_object(None, "/images/DJI_0003.JPG")]}}
+        result = self.creator.calc_gps(obj_counter, {"/georef/DJI_0001.vrt": (0, 1, 0, 0, 0, -1)})
+        self.assertIsNone(result["plant"]["objects"][0].gps)
+
+
+class InferenceBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.model_path = os.path.join(self.workdir, "model.pt")
+
+    def fake_export(self, format, **kwargs):
+        path = os.path.join(self.workdir, "model.onnx")
+        with open(path, "w") as f:
+            f.write("onnx")
+        return path
+
+    def test_export_uses_dynamic_batch_once(self):
+        with open(self.model_path, "w") as f:
+            f.write("pt")
+        with mock.patch("agrosystems.utils.inference_backends.YOLO") as yolo:
+            yolo.return_value.export.side_effect = self.fake_export
+            path = resolve_model_path(self.model_path, "onnx")
+            self.assertEqual(resolve_model_path(self.model_path, "onnx"), path)
+
+        self.assertEqual(path, os.path.join(self.workdir, "model.onnx"))
+        yolo.return_value.export.assert_called_once_with(format="onnx", dynamic=True)
+
+    def test_artifact_exported_with_other_args_is_exported_again(self):
+        with open(self.model_path, "w") as f:
+            f.write("pt")
+        # Модель, экспортированная до появления EXPORT_ARGS, с фиксированным batch=1
+        self.fake_export("onnx")
+        with mock.patch("agrosystems.utils.inference_backends.YOLO") as yolo:
+            yolo.return_value.export.side_effect = self.fake_export
+            resolve_model_path(self.model_path, "onnx")
+        yolo.return_value.export.assert_called_once_with(format="onnx", dynamic=True)
+
+    @skipUnless(
+        importlib.util.find_spec("torch") and importlib.util.find_spec("onnxruntime"),
+        "PyTorch and ONNX Runtime are required to export the model",
+    )
+    def test_exported_model_accepts_batches(self):
+        from ultralytics import YOLO
+
+        YOLO("yolov8n.yaml").save(self.model_path)
+        model = YOLO(resolve_model_path(self.model_path, "onnx"), task="detect")
+        frames = [np.zeros((320, 320, 3), dtype=np.uint8)] * 8
+        self.assertEqual(len(model.predict(frames, verbose=False)), 8)
+
+
+class TaskMemoryTrackingTests(SimpleTestCase):
+    def run_stage(self):
+        progress = get_progress(None)
+        progress.start("detection", 1)
+        progress.advance()
+        progress.finish()
+        return progress.stages[0]
+
+    @override_settings(PROGRESS_MEMORY_INTERVAL=0.1)
+    def test_sampling_interval_comes_from_settings(self):
+        with mock.patch("agrosystems.utils.progress.PeakMemory", wraps=PeakMemory) as peak_memory:
+            stage = self.run_stage()
+        peak_memory.assert_called_once_with(0.1)
+        self.assertGreater(stage["peak_rss"], 0)
+
+    @override_settings(PROGRESS_MEMORY_INTERVAL=None)
+    def test_sampling_can_be_disabled(self):
+        with mock.patch("agrosystems.utils.progress.PeakMemory") as peak_memory:
+            stage = self.run_stage()
+        peak_memory.assert_not_called()
+        self.assertIsNone(stage["peak_rss"])
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(SimpleTestCase):
+    def test_record_stages(self):
+        before = (
+            sample("agrosystem_stage_duration_seconds_count", stage="detection"),
+            sample("agrosystem_stage_items_total", stage="detection"),
+            sample("agrosystem_stage_failures_total", stage="detection"),
+        )
+        metrics.record_stages(
+            [
+                {"name": "detection", "duration": 2.0, "items": 10, "error": ""},
+                {"name": "detection", "duration": 1.0, "items": 3, "error": "RuntimeError()"},
+            ]
+        )
+        after = (
+            sample("agrosystem_stage_duration_seconds_count", stage="detection"),
+            sample("agrosystem_stage_items_total", stage="detection"),
+            sample("agrosystem_stage_failures_total", stage="detection"),
+        )
+        self.assertEqual([b - a for a, b in zip(before, after)], [2, 13, 1])
+
+    def test_record_project(self):
+        mosaic = tempfile.NamedTemporaryFile(suffix=".tif")
+        self.addCleanup(mosaic.close)
+        mosaic.write(b"0" * 1000)
+        mosaic.flush()
+        before = (
+            sample("agrosystem_projects_total", status="Complete"),
+            sample("agrosystem_detections_total", class_name="plant"),
+            sample("agrosystem_mosaic_size_bytes_sum"),
+        )
+        obj_counter = {"plant": {"count": 2, "objects": [make_object(None, "a.jpg"), make_object(None, "b.jpg")]}}
+        metrics.record_project("Complete", obj_counter, mosaic.name)
+        metrics.record_project("Error", obj_counter, mosaic.name)
+        after = (
+            sample("agrosystem_projects_total", status="Complete"),
+            sample("agrosystem_detections_total", class_name="plant"),
+            sample("agrosystem_mosaic_size_bytes_sum"),
+        )
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 2, 1000])
+
+    def test_cache_counters_receive_only_the_increase(self):
+        stats = {"hits": 0, "misses": 0}
+        with mock.patch.object(model_registry, "cache_stats", side_effect=lambda: dict(stats)):
+            metrics.sync_cache_metrics()
+            before = sample("agrosystem_cache_hits_total", cache="models")
+            stats.update(hits=5, misses=1)
+            metrics.sync_cache_metrics()
+            metrics.sync_cache_metrics()
+            stats.update(hits=7)
+            metrics.sync_cache_metrics()
+        self.assertEqual(sample("agrosystem_cache_hits_total", cache="models") - before, 7)
+
+    def test_task_timers(self):
+        task = mock.Mock()
+        task.name = "agrosystems.tasks.detect_chunk"
+        task.request.published_at = time.time() - 3
+        before = (
+            sample("agrosystem_task_queue_wait_seconds_count", task=task.name),
+            sample("agrosystem_task_duration_seconds_count", task=task.name, state="SUCCESS"),
+        )
+        metrics.start_task_timer(task_id="task-1", task=task)
+        metrics.stop_task_timer(task_id="task-1", task=task, state="SUCCESS")
+        after = (
+            sample("agrosystem_task_queue_wait_seconds_count", task=task.name),
+            sample("agrosystem_task_duration_seconds_count", task=task.name, state="SUCCESS"),
+        )
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 1])
+        self.assertGreaterEqual(sample("agrosystem_task_queue_wait_seconds_sum", task=task.name), 3)
+
+    def test_metrics_endpoint(self):
+        app = mock.MagicMock()
+        app.conf.task_default_queue = "celery"
+        channel = app.connection_for_read.return_value.__enter__.return_value.default_channel
+        channel.queue_declare.return_value = ("celery", 4, 0)
+        with mock.patch("agrosystems.views.current_app", app):
+            response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn('agrosystem_queue_messages{queue="celery"} 4.0', body)
+        self.assertIn("agrosystem_stage_duration_seconds", body)
+        channel.queue_declare.assert_called_once_with(queue="celery", passive=True)
+
+
+class VideoSamplingTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def write_video(self, values):
+        # Однотонные кадры: MJPG передаёт их почти без потерь
+        path = os.path.join(self.workdir, "video.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+        for value in values:
+            writer.write(np.full((48, 64, 3), value, dtype=np.uint8))
+        writer.release()
+        return path
+
+    def test_stride_takes_every_nth_frame(self):
+        path = self.write_video(range(0, 200, 20))
+        all_frames = dict(read_video_frames(path))
+        sampled = list(read_video_frames(path, stride=3))
+
+        self.assertEqual(len(all_frames), 10)
+        self.assertEqual([index for index, _ in sampled], [0, 3, 6, 9])
+        for index, frame in sampled:
+            np.testing.assert_array_equal(frame, all_frames[index])
+
+    def test_motion_threshold_skips_static_frames(self):
+        path = self.write_video([50] * 5 + [200] * 5)
+        self.assertEqual([index for index, _ in read_video_frames(path, motion_threshold=10)], [0, 5])
+        self.assertEqual(len(list(read_video_frames(path))), 10)
+
+    def test_process_video_counts_sampled_frames(self):
+        path = self.write_video(range(0, 200, 20))
+        # Заглушка даёт каждому кадру один объект с новым track_id
+        model = StubDetector(objects_per_frame=1)
+        progress = ProgressReporter()
+        with mock.patch("agrosystems.utils.obj_counter.get_model", return_value=model), mock.patch.object(
+            model, "track", wraps=model.track
+        ) as track:
+            counts = process_video(path, "model.pt", batch_size=3, stride=2, progress=progress)
+        progress.finish()
+
+        self.assertEqual(sum(counts.values()), 5)
+        self.assertEqual([len(call.args[0]) for call in track.call_args_list], [3, 2])
+        # Пропущенные кадры тоже учитываются в прогрессе
+        self.assertEqual(progress.stages[-1]["items"], 10)
+
+
+class MergeTileBoxesTests(SimpleTestCase):
+    def test_object_cut_by_tile_border_is_merged(self):
+        # Полная рамка из одного тайла и обрезанная границей часть того же объекта из соседнего
+        boxes = np.array([[100, 100, 200, 200], [150, 100, 200, 200]], dtype=np.float64)
+        keep = merge_tile_boxes(boxes, np.array([0.9, 0.8]), np.array([0, 0]))
+        self.assertEqual(keep.tolist(), [0])
+
+    def test_best_score_is_kept(self):
+        boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10]], dtype=np.float64)
+        keep = merge_tile_boxes(boxes, np.array([0.3, 0.7]), np.array([0, 0]))
+        self.assertEqual(keep.tolist(), [1])
+
+    def test_other_class_and_separate_boxes_are_kept(self):
+        boxes = np.array(
+            [[0, 0, 10, 10], [0, 0, 10, 10], [50, 50, 60, 60]], dtype=np.float64
+        )
+        keep = merge_tile_boxes(boxes, np.array([0.9, 0.8, 0.7]), np.array([0, 1, 0]))
+        self.assertEqual(sorted(keep.tolist()), [0, 1, 2])
+
+    def test_threshold(self):
+        # Пересечение - половина меньшей рамки
+        boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=np.float64)
+        scores, classes = np.array([0.9, 0.8]), np.array([0, 0])
+        self.assertEqual(len(merge_tile_boxes(boxes, scores, classes, threshold=0.4)), 1)
+        self.assertEqual(len(merge_tile_boxes(boxes, scores, classes, threshold=0.6)), 2)
+
+    def test_no_boxes(self):
+        keep = merge_tile_boxes(np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64))
+        self.assertEqual(len(keep), 0)
+
+
+def make_object(gps, image_path, track_id=0, class_name="plant"):
+    return ObjectDetails(class_name, track_id, (0, 0, 10, 10), gps, image_path)
+
+
+class DeduplicateObjectsTests(SimpleTestCase):
+    def test_same_object_on_overlapping_images_is_merged(self):
+        # ~0.1 м между детекциями одного объекта на двух снимках
+        obj_counter = {
+            "plant": {
+                "count": 2,
+                "objects": [
+                    make_object((55.0, 37.0), "a.jpg"),
+                    make_object((55.000001, 37.0), "b.jpg"),
+                ],
+            }
+        }
+        result = deduplicate_objects(obj_counter, distance_m=0.5)
+        self.assertEqual(result["plant"]["count"], 1)
+        (obj,) = result["plant"]["objects"]
+        self.assertAlmostEqual(obj.gps[0], 55.0000005)
+        self.assertAlmostEqual(obj.gps[1], 37.0)
+        self.assertEqual(obj.track_id, 1)
+
+    def test_objects_on_the_same_image_are_not_merged(self):
+        obj_counter = {
+            "plant": {
+                "count": 2,
+                "objects": [
+                    make_object((55.0, 37.0), "a.jpg"),
+                    make_object((55.000001, 37.0), "a.jpg"),
+                ],
+            }
+        }
+        self.assertEqual(deduplicate_objects(obj_counter, distance_m=0.5)["plant"]["count"], 2)
+
+    def test_distant_objects_are_not_merged(self):
+        # ~11 м
+        obj_counter = {
+            "plant": {
+                "count": 2,
+                "objects": [
+                    make_object((55.0, 37.0), "a.jpg"),
+                    make_object((55.0001, 37.0), "b.jpg"),
+                ],
+            }
+        }
+        self.assertEqual(deduplicate_objects(obj_counter, distance_m=0.5)["plant"]["count"], 2)
+
+    def test_classes_are_deduplicated_separately(self):
+        obj_counter = {
+            "plant": {"count": 1, "objects": [make_object((55.0, 37.0), "a.jpg")]},
+            "weed": {"count": 1, "objects": [make_object((55.0, 37.0), "b.jpg", class_name="weed")]},
+        }
+        result = deduplicate_objects(obj_counter, distance_m=0.5)
+        self.assertEqual(result["plant"]["count"], 1)
+        self.assertEqual(result["weed"]["count"], 1)
+
+    def test_objects_without_coordinates_are_kept(self):
+        obj_counter = {
+            "plant": {
+                "count": 3,
+                "objects": [
+                    make_object((0, 0), "a.jpg", track_id=7),
+                    make_object((0, 0), "b.jpg", track_id=7),
+                    make_object((55.0, 37.0), "a.jpg"),
+                ],
+            }
+        }
+        result = deduplicate_objects(obj_counter, distance_m=0.5)
+        self.assertEqual(len(result["plant"]["objects"]), 3)
+        self.assertEqual(result["plant"]["count"], 2)
+
+
+class BuildClustersTests(SimpleTestCase):
+    def test_counts_and_centroids(self):
+        lats = np.array([55.0, 55.00001, -40.0])
+        lons = np.array([37.0, 37.00001, -60.0])
+        clusters = build_clusters(["plant", "plant", "plant"], lats, lons, 0, 19, 64)
+
+        by_zoom = {}
+        for class_name, zoom, cell_x, cell_y, count, lat, lon in clusters:
+            by_zoom.setdefault(zoom, []).append((count, lat, lon))
+        self.assertEqual(sorted(by_zoom), list(range(20)))
+        for zoom, items in by_zoom.items():
+            self.assertEqual(sum(count for count, _, _ in items), 3)
+
+        # На нулевом уровне две соседние точки в одной ячейке, далёкая - в другой
+        self.assertEqual(sorted(count for count, _, _ in by_zoom[0]), [1, 2])
+        count, lat, lon = max(by_zoom[0])
+        self.assertAlmostEqual(lat, 55.000005)
+        self.assertAlmostEqual(lon, 37.000005)
+
+    def test_cells_nest_into_parent_cells(self):
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(54.9, 55.1, 200)
+        lons = rng.uniform(36.9, 37.1, 200)
+        clusters = build_clusters(["plant"] * 200, lats, lons, 10, 15, 64)
+        cells = {(zoom, cell_x, cell_y) for _, zoom, cell_x, cell_y, _, _, _ in clusters}
+        for zoom, cell_x, cell_y in cells:
+            if zoom > 10:
+                self.assertIn((zoom - 1, cell_x // 2, cell_y // 2), cells)
+
+    def test_classes_are_not_mixed(self):
+        clusters = build_clusters(["plant", "weed"], np.array([55.0, 55.0]), np.array([37.0, 37.0]), 0, 0)
+        self.assertEqual(sorted((c[0], c[4]) for c in clusters), [("plant", 1), ("weed", 1)])
+
+    def test_no_detections(self):
+        self.assertEqual(build_clusters([], np.array([]), np.array([]), 0, 19), [])
+
+
+class SaveObjectsToDbTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("tester", password="password")
+        self.project = Project.objects.create(
+            project_name="test", model_type="model.pt", status="Not complete", hfov=80, user=user
+        )
+        objects = [make_object((55.0 + i * 1e-5, 37.0), f"{i}.jpg", track_id=i) for i in range(5)]
+        self.result = ({"plant": {"count": 5, "objects": objects}}, "output.tif", "Complete")
+
+    def test_retry_does_not_duplicate_objects(self):
+        self.assertTrue(save_objects_to_db(self.project.id, self.result, batch_size=2))
+        self.assertTrue(save_objects_to_db(self.project.id, self.result, batch_size=2))
+        self.assertEqual(ObjectDetail.objects.filter(project=self.project).count(), 5)
+
+    def test_failed_save_is_rolled_back(self):
+        save_objects_to_db(self.project.id, self.result, batch_size=2)
+        bulk_create = ObjectDetail.objects.bulk_create
+        calls = []
+
+        def fail_on_second_batch(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("database is locked")
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(ObjectDetail.objects, "bulk_create", side_effect=fail_on_second_batch):
+            self.assertFalse(save_objects_to_db(self.project.id, self.result, batch_size=2))
+        # Прежний результат остался целиком, повторная попытка его заменяет
+        self.assertEqual(ObjectDetail.objects.filter(project=self.project).count(), 5)
+        self.assertTrue(save_objects_to_db(self.project.id, self.result, batch_size=2))
+        self.assertEqual(ObjectDetail.objects.filter(project=self.project).count(), 5)
+
+
+class SaveProjectResultTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("tester", password="password")
+        self.project = Project.objects.create(
+            project_name="test", model_type="model.pt", status="Not complete", hfov=80, user=user
+        )
+        objects = [make_object((55.0 + i * 1e-5, 37.0), f"{i}.jpg", track_id=i) for i in range(5)]
+        self.result = ({"plant": {"count": 5, "objects": objects}}, "output.tif", "Complete")
+
+    def test_complete_with_clusters(self):
+        self.assertEqual(save_project_result(self.project.id, self.result), "Complete")
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, "Complete")
+        self.assertTrue(DetectionCluster.objects.filter(project=self.project).exists())
+
+    def test_failed_clusters_mark_project_error(self):
+        progress = ProgressReporter()
+        with mock.patch("agrosystems.persistence.build_clusters", side_effect=RuntimeError("database is locked")):
+            self.assertEqual(save_project_result(self.project.id, self.result, progress=progress), "Error")
+        progress.finish()
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, "Error")
+        self.assertEqual(progress.stages[-1]["name"], "clusters")
+        self.assertIn("database is locked", progress.stages[-1]["error"])
+
+
+class ProjectObjectsApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester", password="password")
+        self.project = Project.objects.create(
+            project_name="test", model_type="model.pt", status="Complete", hfov=80, user=self.user
+        )
+        # Сетка 10x10 объектов с шагом 0.0005° (половина ячейки индекса), классы чередуются
+        objects = [
+            make_object(
+                (55.0 + row * 5e-4, 37.0 + column * 5e-4), "a.jpg", class_name=("plant", "weed")[column % 2]
+            )
+            for row in range(10)
+            for column in range(10)
+        ]
+        obj_counter = {
+            class_name: {"count": 50, "objects": [obj for obj in objects if obj.class_name == class_name]}
+            for class_name in ("plant", "weed")
+        }
+        save_objects_to_db(self.project.id, (obj_counter, "output.tif", "Complete"))
+        self.client.force_login(self.user)
+        self.url = reverse("project_objects", args=[self.project.id])
+
+    def get_all(self, **params):
+        features, cursor = [], None
+        while True:
+            response = self.client.get(self.url, {**params, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data["features"]), int(params.get("limit", 1000)))
+            features.extend(data["features"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return features
+
+    def test_pages_cover_all_objects_once(self):
+        features = self.get_all(limit=7)
+        self.assertEqual(len(features), 100)
+        self.assertEqual(len({feature["id"] for feature in features}), 100)
+
+    def test_bbox_and_class_filter(self):
+        # Область пересекает несколько ячеек индекса и захватывает 4x4 точки сетки
+        bbox = "37.0009,55.0009,37.0026,55.0026"
+        features = self.get_all(bbox=bbox)
+        self.assertEqual(len(features), 16)
+        for feature in features:
+            lon, lat = feature["geometry"]["coordinates"]
+            self.assertTrue(37.0009 <= lon <= 37.0026 and 55.0009 <= lat <= 55.0026)
+
+        weeds = self.get_all(bbox=bbox, class_name="weed")
+        self.assertEqual(len(weeds), 8)
+        self.assertEqual({feature["properties"]["class_name"] for feature in weeds}, {"weed"})
+
+    def test_invalid_bbox(self):
+        self.assertEqual(self.client.get(self.url, {"bbox": "37.1,55,37.0,55.1"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"bbox": "west"}).status_code, 400)
+
+    def test_other_users_project_is_not_found(self):
+        self.client.force_login(User.objects.create_user("other", password="password"))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(LONG_POLL_TIMEOUT=0.2, LONG_POLL_INTERVAL=0.05)
+class ProjectChangesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester", password="password")
+        self.project = Project.objects.create(
+            project_name="test", model_type="model.pt", status="Not complete", hfov=80, user=self.user
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("project_changes")
+
+    def test_returns_projects_changed_since(self):
+        since = self.project.updated_at - timedelta(seconds=1)
+        data = self.client.get(self.url, {"since": since.isoformat()}).json()
+        self.assertEqual([project["id"] for project in data["projects"]], [self.project.id])
+
+        # Следующий запрос с полученной отметкой времени ждёт новых изменений
+        data = self.client.get(self.url, {"since": data["timestamp"]}).json()
+        self.assertEqual(data["projects"], [])
+
+        set_project_status(self.project.id, "Complete")
+        data = self.client.get(self.url, {"since": data["timestamp"]}).json()
+        self.assertEqual([project["status"] for project in data["projects"]], ["Complete"])
+
+    def test_other_users_projects_are_not_returned(self):
+        since = self.project.updated_at - timedelta(seconds=1)
+        self.client.force_login(User.objects.create_user("other", password="password"))
+        self.assertEqual(self.client.get(self.url, {"since": since.isoformat()}).json()["projects"], [])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get(self.url, {"since": "yesterday"}).status_code, 400)
+
+
+def make_async_result(state, info=None, ready=False):
+    return mock.Mock(state=state, info=info, **{"ready.return_value": ready})
+
+
+class TaskProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester", password="password")
+        self.project = Project.objects.create(
+            project_name="test", model_type="model.pt", status="Not complete", hfov=80, user=self.user
+        )
+        CeleryTask.objects.create(task_id="task-1", group_id="group-1", project=self.project, user=self.user)
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def test_check_task_status_reports_progress(self):
+        info = {"stage": "detection", "done": 3, "total": 10, "rate": 1.5}
+        with mock.patch("agrosystems.views.AsyncResult", return_value=make_async_result("PROGRESS", info)):
+            response = self.client.get(reverse("check_task_status", args=["task-1"]))
+        self.assertEqual(response.json(), {"status": "PROGRESS", **info})
+
+        self.project.status = "Complete"
+        self.project.save()
+        response = self.client.get(reverse("check_task_status", args=["task-1"]))
+        self.assertEqual(response.json(), {"status": "Complete"})
+
+    def test_check_task_status_is_limited_to_the_owner(self):
+        url = reverse("check_task_status", args=["task-1"])
+        self.assertEqual(self.client.get(reverse("check_task_status", args=["missing"])).status_code, 404)
+        self.client.force_login(User.objects.create_user("other", password="password"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_project_progress_sums_chunk_tasks(self):
+        group = mock.Mock(
+            results=[
+                make_async_result("SUCCESS", ready=True),
+                make_async_result("PROGRESS", {"stage": "detection", "done": 2, "total": 5, "rate": 1.0}),
+                make_async_result("PROGRESS", {"stage": "detection", "done": 1, "total": 5, "rate": 0.5}),
+                make_async_result("PROGRESS", {"stage": "georeference", "done": 4, "total": 8, "rate": 2.0}),
+            ]
+        )
+        with mock.patch("agrosystems.views.AsyncResult", return_value=make_async_result("PENDING")), mock.patch(
+            "agrosystems.views.GroupResult.restore", return_value=group
+        ):
+            response = self.client.get(reverse("project_progress", args=[self.project.id]))
+
+        progress = response.json()["progress"]
+        self.assertEqual(progress["chunks"], {"done": 1, "total": 4})
+        self.assertEqual(progress["stages"]["detection"], {"done": 3, "total": 10, "rate": 1.5})
+        self.assertEqual(progress["stages"]["georeference"], {"done": 4, "total": 8, "rate": 2.0})
+
+    def test_project_progress_is_cached(self):
+        info = {"stage": "detection", "done": 3, "total": 10, "rate": 1.5}
+        url = reverse("project_progress", args=[self.project.id])
+        with mock.patch("agrosystems.views.AsyncResult", return_value=make_async_result("PROGRESS", info)) as result:
+            first = self.client.get(url).json()
+            second = self.client.get(url).json()
+        self.assertEqual(first, second)
+        self.assertEqual(first["progress"], {"state": "PROGRESS", **info})
+        result.assert_called_once_with("task-1")
+
+    def test_project_progress_of_finished_project(self):
+        self.project.status = "Complete"
+        self.project.save()
+        response = self.client.get(reverse("project_progress", args=[self.project.id]))
+        self.assertEqual(response.json(), {"status": "Complete"})
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.settings_override = override_settings(
+            RESULT_CACHE_DIR=os.path.join(self.workdir, "cache"), RESULT_CACHE_MAX_BYTES=10 ** 6
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user("tester", password="password")
+        self.blobs = [
+            ImageBlob.objects.create(sha256=f"{i}" * 64, size=1, path=f"/blobs/{i}.jpg") for i in range(2)
+        ]
+
+    def make_project(self, name, image_names):
+        project_dir = os.path.join(self.workdir, name)
+        os.makedirs(project_dir)
+        project = Project.objects.create(
+            project_name=name,
+            model_type="model.pt",
+            output_path=os.path.join(project_dir, "output.tif"),
+            user=self.user,
+        )
+        for blob, image_name in zip(self.blobs, image_names):
+            ProjectImage.objects.create(project=project, blob=blob, name=image_name)
+        return project
+
+    def store(self, key, mosaic=b"mosaic"):
+        project = self.make_project(f"source_{key}", ["a.jpg", "b.jpg"])
+        with open(project.output_path, "wb") as f:
+            f.write(mosaic)
+        obj_counter = {
+            "plant": {
+                "count": 2,
+                "objects": [
+                    make_object((55.0, 37.0), os.path.join(os.path.dirname(project.output_path), "a.jpg")),
+                    make_object((55.1, 37.1), os.path.join(os.path.dirname(project.output_path), "b.jpg"), 1),
+                ],
+            }
+        }
+        result_cache.store_result(key, project.id, project.output_path, obj_counter)
+
+    def test_restore_into_project_with_other_file_names(self):
+        self.store("a" * 64)
+        project = self.make_project("copy", ["DJI_0001.JPG", "DJI_0002.JPG"])
+
+        obj_counter = result_cache.restore_result("a" * 64, project.id, project.output_path)
+
+        project_dir = os.path.dirname(project.output_path)
+        self.assertEqual(
+            [obj[4] for obj in obj_counter["plant"]["objects"]],
+            [os.path.join(project_dir, "DJI_0001.JPG"), os.path.join(project_dir, "DJI_0002.JPG")],
+        )
+        self.assertEqual(obj_counter["plant"]["objects"][1][3], [55.1, 37.1])
+        with open(project.output_path, "rb") as f:
+            self.assertEqual(f.read(), b"mosaic")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with override_settings(RESULT_CACHE_MAX_BYTES=1500):
+            self.store("a" * 64, mosaic=b"a" * 400)
+            self.store("b" * 64, mosaic=b"b" * 400)
+            self.assertIsNotNone(result_cache.get_cached_result("a" * 64))
+            self.store("c" * 64, mosaic=b"c" * 400)
+
+        self.assertIsNotNone(result_cache.get_cached_result("a" * 64))
+        self.assertIsNone(result_cache.get_cached_result("b" * 64))
+        self.assertFalse(os.path.exists(result_cache.get_entry_dir("b" * 64)))
+
+    def test_entry_with_missing_files_is_a_miss(self):
+        self.store("a" * 64)
+        os.remove(ResultCacheEntry.objects.get(key="a" * 64).mosaic_path)
+        self.assertIsNone(result_cache.get_cached_result("a" * 64))
+        self.assertFalse(ResultCacheEntry.objects.exists())
+
+    def test_evicted_entry_falls_back_to_processing(self):
+        project = self.make_project("evicted", ["a.jpg", "b.jpg"])
+        run = ProcessingRun.objects.create(project=project, cached=True, image_count=2)
+        task = mock.Mock(id="pipeline-1")
+        task.parent.id = "group-1"
+        images = [os.path.join(self.workdir, "evicted", name) for name in ("a.jpg", "b.jpg")]
+
+        with override_settings(QUICKLOOK_SCALE=0), mock.patch(
+            "agrosystems.tasks.launch_project_pipeline", return_value=task
+        ) as pipeline:
+            restore_cached_result.apply(
+                args=("d" * 64, project.output_path, project.id, images, "model.pt", 67), kwargs={"run_id": run.id}
+            )
+
+        self.assertEqual(pipeline.call_args.args[0], images)
+        self.assertEqual(pipeline.call_args.kwargs["cache_key"], "d" * 64)
+        project.refresh_from_db()
+        run.refresh_from_db()
+        self.assertEqual(project.status, "Not complete")
+        self.assertFalse(run.cached)
+        self.assertTrue(CeleryTask.objects.filter(task_id="pipeline-1", group_id="group-1", project=project).exists())
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user("uploader", password="password")
+        self.client.force_login(self.user)
+        self.content = bytes(range(256)) * 40
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def create_upload(self, **data):
+        data = {"filename": "image.jpg", "size": len(self.content), **data}
+        return self.client.post(reverse("create_upload"), data, content_type="application/json")
+
+    def put_chunk(self, upload_id, offset, chunk):
+        return self.client.put(
+            f"{reverse('upload_chunk', args=[upload_id])}?offset={offset}",
+            chunk,
+            content_type="application/octet-stream",
+        )
+
+    def test_upload_in_chunks(self):
+        upload_id = self.create_upload().json()["upload_id"]
+        response = self.put_chunk(upload_id, 0, self.content[:4000])
+        self.assertEqual(response.json()["offset"], 4000)
+        self.assertFalse(response.json()["complete"])
+
+        response = self.put_chunk(upload_id, 4000, self.content[4000:])
+        self.assertTrue(response.json()["complete"])
+        self.assertEqual(response.json()["sha256"], self.sha256)
+        blob = ImageBlob.objects.get(sha256=self.sha256)
+        with open(blob.path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_offset_mismatch_returns_409(self):
+        upload_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(upload_id, 0, self.content[:4000])
+
+        response = self.put_chunk(upload_id, 1000, self.content[1000:5000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 4000)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).received, 4000)
+
+    def test_resume_after_restart(self):
+        upload_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(upload_id, 0, self.content[:4000])
+        # Хвост оборванного запроса, не попавший в базу, и потерянное состояние хэша
+        # (загрузку продолжает другой процесс)
+        with open(storage.get_upload_path(upload_id), "ab") as f:
+            f.write(b"garbage")
+        storage._upload_hashes.pop(UploadSession.objects.get(pk=upload_id).id)
+
+        offset = self.client.get(reverse("upload_chunk", args=[upload_id])).json()["offset"]
+        self.assertEqual(offset, 4000)
+        response = self.put_chunk(upload_id, offset, self.content[offset:])
+        self.assertEqual(response.json()["sha256"], self.sha256)
+        with open(ImageBlob.objects.get(sha256=self.sha256).path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_known_file_is_not_uploaded_again(self):
+        upload_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(upload_id, 0, self.content)
+
+        response = self.create_upload(sha256=self.sha256)
+        self.assertEqual(response.json(), {"sha256": self.sha256, "complete": True})
+
+    def test_known_file_of_another_user_is_uploaded_again(self):
+        other = User.objects.create_user("other", password="password")
+        self.client.force_login(other)
+        upload_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(upload_id, 0, self.content)
+
+        # Одного хэша недостаточно: файл нужно загрузить, после чего он ссылается на тот же снимок
+        self.client.force_login(self.user)
+        response = self.create_upload(sha256=self.sha256).json()
+        self.assertFalse(response["complete"])
+        response = self.put_chunk(response["upload_id"], 0, self.content).json()
+        self.assertEqual(response["sha256"], self.sha256)
+        self.assertEqual(ImageBlob.objects.count(), 1)
+
+    def add_project(self, image_blobs=(), images=()):
+        with open(os.path.join(self.media_root, "model.pt"), "wb") as f:
+            f.write(b"model")
+        task = mock.Mock(id="task-1")
+        task.parent = None
+        with override_settings(QUICKLOOK_SCALE=0), mock.patch(
+            "agrosystems.views.get_model_path", return_value=os.path.join(self.media_root, "model.pt")
+        ), mock.patch(
+            "agrosystems.tasks.launch_project_pipeline", return_value=task
+        ) as pipeline:
+            self.client.post(
+                reverse("add_project"),
+                {
+                    "project_name": "field",
+                    "model_type": "model.pt",
+                    "hfov": 67,
+                    "image_blobs": json.dumps([{"sha256": sha256, "name": name} for sha256, name in image_blobs]),
+                    "images": list(images),
+                },
+            )
+        return pipeline.call_args.args[0]
+
+    def test_add_project_uses_only_own_blobs(self):
+        other = User.objects.create_user("other", password="password")
+        self.client.force_login(other)
+        upload_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(upload_id, 0, self.content)
+
+        self.client.force_login(self.user)
+        own_content = b"own" * 1000
+        upload_id = self.create_upload(size=len(own_content)).json()["upload_id"]
+        own_sha256 = self.put_chunk(upload_id, 0, own_content).json()["sha256"]
+
+        file_paths = self.add_project([(self.sha256, "foreign.jpg"), (own_sha256, "own.jpg")])
+        self.assertEqual([os.path.basename(path) for path in file_paths], ["own.jpg"])
+        # Снимок, добавленный в проект, можно использовать без загрузки
+        self.assertTrue(self.create_upload(sha256=own_sha256).json()["complete"])
+        self.assertFalse(UploadSession.objects.filter(user=self.user).exists())
+
+    def test_form_images_are_stored_outside_transaction(self):
+        depth = len(connection.atomic_blocks)
+        store_uploaded_file = storage.store_uploaded_file
+        depths = []
+
+        def store(uploaded_file):
+            depths.append(len(connection.atomic_blocks))
+            return store_uploaded_file(uploaded_file)
+
+        image = SimpleUploadedFile("image.jpg", self.content, content_type="image/jpeg")
+        with mock.patch("agrosystems.views.store_uploaded_file", side_effect=store):
+            file_paths = self.add_project(images=[image])
+        self.assertEqual(depths, [depth])
+        with open(file_paths[0], "rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_stale_uploads_are_deleted(self):
+        stale_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(stale_id, 0, self.content[:4000])
+        active_id = self.create_upload().json()["upload_id"]
+        self.put_chunk(active_id, 0, self.content[:4000])
+        orphan_path = storage.get_upload_path(uuid.uuid4())
+        with open(orphan_path, "wb") as f:
+            f.write(b"part")
+
+        old = now() - timedelta(days=2)
+        UploadSession.objects.update(created_at=old)
+        for path in (storage.get_upload_path(stale_id), orphan_path):
+            os.utime(path, (old.timestamp(), old.timestamp()))
+
+        storage.delete_stale_uploads()
+        # Загрузку, в которую недавно писали, не трогаем, даже если она начата давно
+        self.assertEqual([str(session.id) for session in UploadSession.objects.all()], [active_id])
+        self.assertTrue(os.path.isfile(storage.get_upload_path(active_id)))
+        self.assertFalse(os.path.exists(storage.get_upload_path(stale_id)))
+        self.assertFalse(os.path.exists(orphan_path))
+
+    def test_invalid_offset_returns_400(self):
+        upload_id = self.create_upload().json()["upload_id"]
+        response = self.client.put(
+            f"{reverse('upload_chunk', args=[upload_id])}?offset=abc",
+            b"data",
+            content_type="application/octet-stream",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_of_another_user_is_not_found(self):
+        upload_id = self.create_upload().json()["upload_id"]
+        other = User.objects.create_user("other", password="password")
+        self.client.force_login(other)
+        self.assertEqual(self.put_chunk(upload_id, 0, self.content).status_code, 404)
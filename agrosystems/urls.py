@@ -10,6 +10,15 @@ urlpatterns = [
     path('add-project/', views.add_project, name='add_project'),
     path('check-task-status/<task_id>', views.check_task_status, name='check_task_status'),
     path('view-map/<int:project_id>/', views.view_map, name='view_map'),
+    path('tiles/<int:project_id>/<int:z>/<int:x>/<int:y>.png', views.project_tile, name='project_tile'),
+    path('api/uploads/', views.create_upload, name='create_upload'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('api/projects/changes/', views.project_changes, name='project_changes'),
+    path('api/projects/<int:project_id>/objects/', views.project_objects, name='project_objects'),
+    path('api/projects/<int:project_id>/clusters/', views.project_clusters, name='project_clusters'),
+    path('api/projects/<int:project_id>/progress/', views.project_progress, name='project_progress'),
+    path('api/runs/', views.processing_runs, name='processing_runs'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('delete-project/<int:project_id>/', views.delete_project, name='delete-project'),
     path('user/', views.user_profile, name='user_profile'),
     path('logout/', views.logout_view, name='logout'),
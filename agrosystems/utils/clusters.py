@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+
+from .tiles import TILE_SIZE
+
+# Предел широты Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+
+def to_world_pixels(lats, lons, zoom):
+    """
+    Converts coordinates to Web Mercator pixel coordinates of the zoom level (the same grid as XYZ tiles).
+
+    Parameters:
+        - lats: numpy.ndarray - Latitudes in degrees.
+        - lons: numpy.ndarray - Longitudes in degrees.
+        - zoom: int - Zoom level.
+
+    Returns:
+        - tuple: (x, y) numpy arrays, y grows to the south.
+    """
+    scale = TILE_SIZE * 2 ** zoom
+    lats = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lons, dtype=np.float64) + 180) / 360 * scale
+    y = (1 - np.log(np.tan(lats) + 1 / np.cos(lats)) / math.pi) / 2 * scale
+    return x, y
+
+
+def bbox_cells(bbox, zoom, cell_pixels):
+    """
+    Returns ranges of the cluster cells that cover the bounding box.
+
+    Parameters:
+        - bbox: tuple - (west, south, east, north) in degrees.
+        - zoom: int - Zoom level.
+        - cell_pixels: int - Cluster cell size in screen pixels.
+
+    Returns:
+        - tuple: ((min_x, max_x), (min_y, max_y)), both ends inclusive.
+    """
+    west, south, east, north = bbox
+    x, y = to_world_pixels(np.array([north, south]), np.array([west, east]), zoom)
+    cells_x = np.floor(x / cell_pixels).astype(np.int64)
+    cells_y = np.floor(y / cell_pixels).astype(np.int64)
+    return (int(cells_x[0]), int(cells_x[1])), (int(cells_y[0]), int(cells_y[1]))
+
+
+def build_clusters(class_names, lats, lons, min_zoom, max_zoom, cell_pixels=64):
+    """
+    Groups detections of every class into grid cells of every zoom level.
+
+    The cells are computed once at max_zoom; a cell of the zoom level below is the parent cell
+    (cell // 2), so the clusters nest into each other like the tiles of the map, and every level
+    is aggregated from the clusters of the level above instead of from all detections.
+
+    Parameters:
+        - class_names: list - Class of every detection.
+        - lats: numpy.ndarray - Latitudes in degrees.
+        - lons: numpy.ndarray - Longitudes in degrees.
+        - min_zoom: int - Lowest zoom level.
+        - max_zoom: int - Highest zoom level.
+        - cell_pixels: int - Cell size in screen pixels.
+
+    Returns:
+        - list: (class_name, zoom, cell_x, cell_y, count, lat, lon) for every cluster, lat/lon is the centroid.
+    """
+    if len(class_names) == 0:
+        return []
+
+    classes, class_index = np.unique(np.asarray(class_names), return_inverse=True)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    x, y = to_world_pixels(lats, lons, max_zoom)
+    cells_x = np.floor(x / cell_pixels).astype(np.int64)
+    cells_y = np.floor(y / cell_pixels).astype(np.int64)
+    counts = np.ones(len(lats), dtype=np.int64)
+
+    clusters = []
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        (class_index, cells_x, cells_y), inverse = _group_cells(class_index, cells_x, cells_y)
+        counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        # Суммы координат, центроид - сумма / количество
+        lats = np.bincount(inverse, weights=lats)
+        lons = np.bincount(inverse, weights=lons)
+        clusters.extend(
+            zip(
+                classes[class_index].tolist(),
+                [zoom] * len(counts),
+                cells_x.tolist(),
+                cells_y.tolist(),
+                counts.tolist(),
+                (lats / counts).tolist(),
+                (lons / counts).tolist(),
+            )
+        )
+        cells_x = cells_x // 2
+        cells_y = cells_y // 2
+    return clusters
+
+
+def _group_cells(class_index, cells_x, cells_y):
+    # Один целочисленный ключ вместо np.unique(axis=0), который заметно медленнее
+    offset_x, offset_y = cells_x.min(), cells_y.min()
+    width = int(cells_x.max() - offset_x) + 1
+    height = int(cells_y.max() - offset_y) + 1
+    keys = (class_index * width + (cells_x - offset_x)) * height + (cells_y - offset_y)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    class_index, rest = np.divmod(unique_keys, width * height)
+    x, y = np.divmod(rest, height)
+    return (class_index, x + offset_x, y + offset_y), inverse
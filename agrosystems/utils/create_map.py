@@ -1,17 +1,115 @@
+import traceback
+
+from .dedup import deduplicate_objects
 from .map_creator import GeoTIFFCreator
-from .obj_counter import process_images
+from .obj_counter import merge_object_counters, process_images
+from .progress import ProgressReporter
+
+
+def start_processing(
+    images_path,
+    model_path,
+    output_path="test.tif",
+    hfov_degrees=67,
+    detection_options=None,
+    mosaic_options=None,
+    dedup_distance=None,
+    progress=None,
+):
+    """
+    Detects objects on the images, builds the mosaic and calculates GPS coordinates of the objects.
 
+    Parameters:
+        - images_path: list - Paths to the images.
+        - model_path: str - Path to the model file (.pt) to use.
+        - output_path: str - Path to the output GeoTIFF mosaic.
+        - hfov_degrees: float - Horizontal field of view of the camera in degrees.
+        - detection_options: dict - Keyword arguments for process_images (batch_size, prefetch, track).
+        - mosaic_options: dict - Keyword arguments for GeoTIFFCreator (block_size, workers, executor, metadata_cache_path).
+        - dedup_distance: float - Merge same-class detections closer than this on the ground (meters). None - keep all.
+        - progress: ProgressReporter - Receives progress of the processing stages.
 
-def start_processing(images_path, model_path, output_path="test.tif", hfov_degrees=67):
+    Returns:
+        - tuple: obj_counter, output_path, status ("Complete" or "Error").
+    """
+    progress = progress or ProgressReporter()
     try:
-        obj_counter = process_images(images_path, model_path)
+        obj_counter = process_images(
+            images_path, model_path, progress=progress, **(detection_options or {})
+        )
         # obj_counter = calc_gps(obj_counter)
 
-        _, obj_counter = GeoTIFFCreator(images_path, output_path, obj_counter, hfov_degrees).create_mosaic()
+        _, obj_counter = GeoTIFFCreator(
+            images_path,
+            output_path,
+            obj_counter,
+            hfov_degrees,
+            progress=progress,
+            **(mosaic_options or {}),
+        ).create_mosaic()
+        if dedup_distance:
+            progress.start("dedup", 1)
+            obj_counter = deduplicate_objects(obj_counter, dedup_distance)
+            progress.advance()
         status = "Complete"
-    except Exception:
+    except Exception as e:
+        # Статус остаётся "Error", а исключение с traceback попадает в запись этапа
+        traceback.print_exc()
+        progress.fail(e)
         status = "Error"
         obj_counter = None
         output_path = None
     return obj_counter, output_path, status
 
+
+def finish_processing(
+    images_path,
+    obj_counters,
+    georeferenced,
+    output_path="test.tif",
+    hfov_degrees=67,
+    mosaic_options=None,
+    dedup_distance=None,
+    progress=None,
+):
+    """
+    Merges detections and georeferenced images made by parallel tasks, builds the mosaic
+    and calculates GPS coordinates of the objects.
+
+    Parameters:
+        - images_path: list - Paths to the images.
+        - obj_counters: list - Results of process_images for every chunk of images, in order.
+        - georeferenced: list - (image path, georeferenced file path) pairs of all images, in order.
+        - output_path: str - Path to the output GeoTIFF mosaic.
+        - hfov_degrees: float - Horizontal field of view of the camera in degrees.
+        - mosaic_options: dict - Keyword arguments for GeoTIFFCreator.
+        - dedup_distance: float - Merge same-class detections closer than this on the ground (meters). None - keep all.
+        - progress: ProgressReporter - Receives progress of the processing stages.
+
+    Returns:
+        - tuple: obj_counter, output_path, status ("Complete" or "Error").
+    """
+    progress = progress or ProgressReporter()
+    try:
+        obj_counter = merge_object_counters(obj_counters)
+        _, obj_counter = GeoTIFFCreator(
+            images_path,
+            output_path,
+            obj_counter,
+            hfov_degrees,
+            progress=progress,
+            **(mosaic_options or {}),
+        ).create_mosaic(georeferenced)
+        if dedup_distance:
+            progress.start("dedup", 1)
+            obj_counter = deduplicate_objects(obj_counter, dedup_distance)
+            progress.advance()
+        status = "Complete"
+    except Exception as e:
+        # Статус остаётся "Error", а исключение с traceback попадает в запись этапа
+        traceback.print_exc()
+        progress.fail(e)
+        status = "Error"
+        obj_counter = None
+        output_path = None
+    return obj_counter, output_path, status
@@ -0,0 +1,110 @@
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Средний радиус Земли, м
+EARTH_RADIUS = 6371008.8
+
+
+def to_local_meters(lats, lons):
+    """
+    Projects coordinates to a local plane (equirectangular around the mean point).
+
+    Parameters:
+        - lats: numpy.ndarray - Latitudes in degrees.
+        - lons: numpy.ndarray - Longitudes in degrees.
+
+    Returns:
+        - numpy.ndarray: Points (N, 2) in meters. Accurate enough for distances within one field.
+    """
+    lat0 = math.radians(float(np.mean(lats)))
+    x = np.radians(lons - np.mean(lons)) * EARTH_RADIUS * math.cos(lat0)
+    y = np.radians(lats - np.mean(lats)) * EARTH_RADIUS
+    return np.column_stack([x, y])
+
+
+def cluster_detections(points, image_keys, distance_m):
+    """
+    Groups detections of the same object seen on overlapping images.
+
+    Every detection joins the nearest not yet grouped detections within distance_m, at most one per image:
+    two boxes on the same frame are always different objects, and the limit also stops dense rows
+    of plants from chaining into one group.
+
+    Parameters:
+        - points: numpy.ndarray - Detection positions (N, 2) in meters.
+        - image_keys: list - Source image of every detection.
+        - distance_m: float - Maximum ground distance between detections of the same object.
+
+    Returns:
+        - numpy.ndarray: Cluster number of every detection (N,).
+    """
+    clusters = np.full(len(points), -1, dtype=np.int64)
+    if len(points) == 0:
+        return clusters
+
+    tree = cKDTree(points)
+    neighbours = tree.query_ball_point(points, r=distance_m)
+    cluster = 0
+    for i in range(len(points)):
+        if clusters[i] >= 0:
+            continue
+        clusters[i] = cluster
+        used_images = {image_keys[i]}
+
+        candidates = np.array([j for j in neighbours[i] if clusters[j] < 0], dtype=np.int64)
+        if len(candidates):
+            distances = np.hypot(*(points[candidates] - points[i]).T)
+            for j in candidates[np.argsort(distances, kind="stable")]:
+                if image_keys[j] not in used_images:
+                    clusters[j] = cluster
+                    used_images.add(image_keys[j])
+        cluster += 1
+    return clusters
+
+
+def deduplicate_objects(obj_counter, distance_m=0.5):
+    """
+    Merges same-class detections that are closer than distance_m on the ground and recounts the objects.
+
+    Parameters:
+        - obj_counter: dict - Result of calc_gps ({class_name: {"count": int, "objects": [ObjectDetails]}}).
+        - distance_m: float - Maximum ground distance between detections of the same object.
+
+    Returns:
+        - dict: obj_counter with one object per physical object. Its gps is the centroid of the merged detections,
+          track_id is the number of the group. Objects without coordinates are kept as they are.
+    """
+    result = {}
+    for class_name, details in obj_counter.items():
+        objects = details["objects"]
+        located = [obj for obj in objects if tuple(obj.gps) != (0, 0)]
+        not_located = [obj for obj in objects if tuple(obj.gps) == (0, 0)]
+
+        merged = []
+        if located:
+            coords = np.array([obj.gps for obj in located], dtype=np.float64)
+            clusters = cluster_detections(
+                to_local_meters(coords[:, 0], coords[:, 1]),
+                [obj.image_path for obj in located],
+                distance_m,
+            )
+            counts = np.bincount(clusters)
+            lats = np.bincount(clusters, weights=coords[:, 0]) / counts
+            lons = np.bincount(clusters, weights=coords[:, 1]) / counts
+
+            # Первый объект группы остаётся её представителем
+            _, first = np.unique(clusters, return_index=True)
+            for cluster, i in enumerate(first):
+                merged.append(
+                    located[i]._replace(
+                        track_id=cluster + 1, gps=(float(lats[cluster]), float(lons[cluster]))
+                    )
+                )
+
+        result[class_name] = {
+            "count": len(merged) + len(set(obj.track_id for obj in not_located)),
+            "objects": merged + not_located,
+        }
+    return result
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+import pyexiv2
+
+# Все метаданные снимка, которые нужны для построения карты, читаются за одно открытие файла
+ImageMetadata = namedtuple(
+    "ImageMetadata",
+    [
+        "lat",
+        "lon",
+        "relative_alt",
+        "width",
+        "height",
+        "gimbal_yaw",
+        "gimbal_pitch",
+        "gimbal_roll",
+        "timestamp",
+    ],
+)
+
+EMPTY_METADATA = ImageMetadata(*([None] * len(ImageMetadata._fields)))
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Computes the SHA-256 hash of the file content.
+
+    Parameters:
+        - path: str - Path to the file.
+        - chunk_size: int - Number of bytes read at a time.
+
+    Returns:
+        - str: Hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_rational(value):
+    numerator, _, denominator = value.partition("/")
+    return float(numerator) / float(denominator or 1)
+
+
+def _parse_dms(value, ref):
+    if not value:
+        return None
+    degrees, minutes, seconds = (_parse_rational(part) for part in value.split())
+    result = degrees + minutes / 60 + seconds / 3600
+    return -result if ref in ("S", "W") else result
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_image_metadata(img_path):
+    """
+    Reads GPS position, relative altitude, dimensions, gimbal angles and timestamp
+    from the image header in a single pass.
+
+    Parameters:
+        - img_path: str - Path to the image file.
+
+    Returns:
+        - ImageMetadata: Metadata of the image. Fields that are missing in the header are None.
+    """
+    try:
+        image = pyexiv2.Image(img_path)
+        try:
+            exif = image.read_exif()
+            xmp = image.read_xmp()
+            width, height = image.get_pixel_width(), image.get_pixel_height()
+        finally:
+            image.close()
+    except Exception as e:
+        print(f"Error reading metadata from {img_path}: {e}")
+        return EMPTY_METADATA
+
+    try:
+        lat = _parse_dms(
+            exif.get("Exif.GPSInfo.GPSLatitude"), exif.get("Exif.GPSInfo.GPSLatitudeRef")
+        )
+        lon = _parse_dms(
+            exif.get("Exif.GPSInfo.GPSLongitude"), exif.get("Exif.GPSInfo.GPSLongitudeRef")
+        )
+    except (ValueError, ZeroDivisionError) as e:
+        print(f"Error getting GPS data from {img_path}: {e}")
+        lat, lon = None, None
+
+    return ImageMetadata(
+        lat=lat,
+        lon=lon,
+        relative_alt=_parse_float(xmp.get("Xmp.drone-dji.RelativeAltitude")),
+        width=width,
+        height=height,
+        gimbal_yaw=_parse_float(xmp.get("Xmp.drone-dji.GimbalYawDegree")),
+        gimbal_pitch=_parse_float(xmp.get("Xmp.drone-dji.GimbalPitchDegree")),
+        gimbal_roll=_parse_float(xmp.get("Xmp.drone-dji.GimbalRollDegree")),
+        timestamp=exif.get("Exif.Photo.DateTimeOriginal"),
+    )
+
+
+class MetadataCache:
+    """Persistent image metadata cache keyed by the SHA-256 of the image content"""
+
+    def __init__(self, path):
+        """Initialize MetadataCache
+
+        Args:
+            path (str): Path to the SQLite database file (e.g. /path/to/image_metadata.sqlite3)
+
+        Description:
+            The MetadataCache class stores ImageMetadata in SQLite, so it survives worker restarts and can be shared
+            by all worker processes on the host. The hash of every file is also kept by (path, size, mtime),
+            so a file that did not change is not read again to find its cache entry.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS image_metadata (hash TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL)"
+            )
+
+    def get_file_hash(self, path):
+        """Get the SHA-256 of the file content
+
+        Args:
+            path (str): Path to the file
+
+        Returns:
+            str: Hex digest. The file is read only if its size or modification time changed since the last call
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is not None:
+            return row[0]
+
+        content_hash = file_sha256(path)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, content_hash),
+            )
+        return content_hash
+
+    def get(self, content_hash):
+        """Get cached metadata
+
+        Args:
+            content_hash (str): SHA-256 of the image content
+
+        Returns:
+            ImageMetadata: Cached metadata or None
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM image_metadata WHERE hash = ?", (content_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return ImageMetadata(**json.loads(row[0]))
+
+    def set(self, content_hash, metadata):
+        """Store metadata
+
+        Args:
+            content_hash (str): SHA-256 of the image content
+            metadata (ImageMetadata): Metadata of the image
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO image_metadata (hash, data) VALUES (?, ?)",
+                (content_hash, json.dumps(metadata._asdict())),
+            )
+
+    def close(self):
+        self._connection.close()
+
+
+def get_image_metadata(img_path, cache=None):
+    """
+    Returns metadata of the image, reading the header only if it is not in the cache.
+
+    Parameters:
+        - img_path: str - Path to the image file.
+        - cache: MetadataCache - Persistent cache, or None to always read the header.
+
+    Returns:
+        - ImageMetadata: Metadata of the image.
+    """
+    if cache is None:
+        return read_image_metadata(img_path)
+
+    content_hash = cache.get_file_hash(img_path)
+    metadata = cache.get(content_hash)
+    if metadata is None:
+        metadata = read_image_metadata(img_path)
+        # Не кэшируем неудачное чтение, чтобы повторный запуск попробовал ещё раз
+        if metadata != EMPTY_METADATA:
+            cache.set(content_hash, metadata)
+    return metadata
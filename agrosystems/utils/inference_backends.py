@@ -0,0 +1,78 @@
+import fcntl
+import json
+import os
+
+from ultralytics import YOLO
+
+# Бэкенд -> формат экспорта Ultralytics. Для pytorch модель используется как есть (.pt)
+EXPORT_FORMATS = {
+    "pytorch": None,
+    "onnx": "onnx",
+    "openvino": "openvino",
+}
+
+# Динамические оси: детекция подаёт пачки кадров (DETECTION_BATCH_SIZE, тайлы), а без них
+# экспортированная модель принимает только batch=1
+EXPORT_ARGS = {"dynamic": True}
+
+
+def get_artifact_path(model_path, backend):
+    """
+    Returns the path where Ultralytics puts the exported model.
+
+    Parameters:
+        - model_path: str - Path to the model file (.pt).
+        - backend: str - One of EXPORT_FORMATS.
+
+    Returns:
+        - str: model.onnx for ONNX Runtime, model_openvino_model/ for OpenVINO, the .pt file itself for PyTorch.
+    """
+    stem = os.path.splitext(model_path)[0]
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    return model_path
+
+
+def resolve_model_path(model_path, backend="pytorch"):
+    """
+    Returns the model file for the backend, exporting the .pt model once if the artifact is missing or stale.
+
+    Parameters:
+        - model_path: str - Path to the model file (.pt).
+        - backend: str - "pytorch", "onnx" or "openvino".
+
+    Returns:
+        - str: Path that can be passed to YOLO(). The outputs are the same Results objects for every backend.
+    """
+    if backend not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if EXPORT_FORMATS[backend] is None:
+        return model_path
+
+    model_path = os.path.abspath(model_path)
+    artifact_path = get_artifact_path(model_path, backend)
+
+    # Блокировка нужна, чтобы несколько воркеров не экспортировали модель одновременно
+    # и не читали недописанный файл
+    with open(f"{artifact_path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if not _is_fresh(artifact_path, model_path):
+            exported_path = YOLO(model_path).export(format=EXPORT_FORMATS[backend], **EXPORT_ARGS)
+            if os.path.abspath(exported_path) != artifact_path:
+                os.replace(exported_path, artifact_path)
+            with open(f"{artifact_path}.args", "w") as f:
+                json.dump(EXPORT_ARGS, f)
+    return artifact_path
+
+
+def _is_fresh(artifact_path, model_path):
+    if not os.path.exists(artifact_path) or os.path.getmtime(artifact_path) < os.path.getmtime(model_path):
+        return False
+    # Модели, экспортированные с другими параметрами (например, без dynamic), экспортируются заново
+    try:
+        with open(f"{artifact_path}.args") as f:
+            return json.load(f) == EXPORT_ARGS
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+
+class SizedLRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_size, sizeof=len):
+        """Initialize SizedLRUCache
+
+        Args:
+            max_size (int): Maximum total size of the cached values (e.g. bytes)
+            sizeof (callable): Function that returns the size of a value, used when set() gets no explicit size
+
+        Description:
+            The SizedLRUCache class evicts the least recently used entries until the total size fits into max_size.
+            A value larger than max_size is not cached at all.
+        """
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get value and mark it as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def set(self, key, value, size=None):
+        """Store value, evicting the least recently used entries if needed
+
+        Returns:
+            list: Evicted (key, value) pairs
+        """
+        size = self.sizeof(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_size:
+                return []
+            self._entries[key] = (value, size)
+            self.size += size
+            return self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, size = self._entries.pop(key)
+            self.size -= size
+            return value
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def resize(self, max_size):
+        """Change the size limit
+
+        Returns:
+            list: Evicted (key, value) pairs
+        """
+        with self._lock:
+            self.max_size = max_size
+            return self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _evict(self):
+        evicted = []
+        while self.size > self.max_size and self._entries:
+            key, (value, size) = self._entries.popitem(last=False)
+            self.size -= size
+            evicted.append((key, value))
+        return evicted
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,59 +1,170 @@
 import math
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import numpy as np
 from PIL import Image
-import exif
 import rasterio
+from rasterio.io import MemoryFile
 from rasterio.merge import merge
+from rasterio.shutil import copy as copy_dataset
 from rasterio.transform import from_origin
+from rasterio.windows import Window
+from rasterio.windows import bounds as window_bounds
+from rasterio.windows import transform as window_transform
+from rasterio.dtypes import dtype_rev, typename_fwd
+from rasterio.errors import NotGeoreferencedWarning
 import os
+import shutil
+import tempfile
+import warnings
+from xml.sax.saxutils import escape
 from pyproj import Geod
-import pyexiv2
 from osgeo import gdal
+from .image_metadata import MetadataCache, get_image_metadata
+from .progress import ProgressReporter
+
+# Экземпляр GeoTIFFCreator внутри процесса пула (см. GeoTIFFCreator.georeference_images)
+_worker_creator = None
+
+
+def _init_georeference_worker(hfov_degrees, use_vrt, metadata_cache_path):
+    global _worker_creator
+    _worker_creator = GeoTIFFCreator(
+        [], None, None, hfov_degrees, use_vrt=use_vrt, metadata_cache_path=metadata_cache_path
+    )
+
+
+def _georeference_in_worker(jpg_path, scratch_dir):
+    return _worker_creator.georeference_image(jpg_path, scratch_dir)
 
 
 class GeoTIFFCreator:
     """Class for creating a GeoTIFF mosaic from a set of images with GPS data and relative altitude"""
 
-    def __init__(self, image_paths, output_path, obj_counter, hfov_degrees=67):
+    def __init__(
+        self,
+        image_paths,
+        output_path,
+        obj_counter,
+        hfov_degrees=67,
+        block_size=1024,
+        use_vrt=True,
+        workers=1,
+        executor="thread",
+        metadata_cache_path=None,
+        cog=True,
+        compress="deflate",
+        quality=85,
+        progress=None,
+    ):
         """Initialize GeoTIFFCreator
 
         Args:
             image_paths (list): List of image file paths (e.g. ['/path/to/image1.jpg', '/path/to/image2.jpg'])
             output_path (str): Path to output GeoTIFF file (e.g. /path/to/output.tif)
             hfov_degrees (float): Horizontal field of view in degrees
+            block_size (int): Size of the output tiles in pixels (multiple of 16). If None, the whole mosaic is merged in memory
+            use_vrt (bool): Georeference images with VRT files that point to the source JPEG instead of writing temporary GeoTIFFs
+            workers (int): Number of images georeferenced in parallel
+            executor (str): "thread" or "process" pool for the georeferencing stage
+            metadata_cache_path (str): Path to the persistent image metadata cache. If None, headers are always read
+            cog (bool): Write the mosaic as a Cloud-Optimized GeoTIFF with internal tiles and overviews
+            compress (str): Compression of the Cloud-Optimized GeoTIFF: "deflate", "jpeg", "webp" or "lzw"
+            quality (int): Quality of the lossy compressions (jpeg, webp)
+            progress (ProgressReporter): Receives the georeferencing, mosaic and geolocation stages
 
         Description:
             The GeoTIFFCreator class creates a GeoTIFF mosaic from a set of images with GPS data and relative altitude.
         """
         self.image_paths = image_paths
         self.output_path = output_path
+        self.hfov_degrees = hfov_degrees
         self.hfov = math.radians(hfov_degrees)
         self.geod = Geod(ellps="WGS84")
         self.obj_counter = obj_counter
+        self.block_size = block_size
+        self.use_vrt = use_vrt
+        self.workers = workers
+        self.executor = executor
+        self.metadata_cache_path = metadata_cache_path
+        self.metadata_cache = MetadataCache(metadata_cache_path) if metadata_cache_path else None
+        self.cog = cog
+        self.compress = compress
+        self.quality = quality
+        self.progress = progress or ProgressReporter()
+
+    def calc_gps(self, obj_counter, geotransforms):
+        """Calculate GPS coordinates of the detected objects
 
-    def calc_gps(self, obj_counter, geotiff_files):
-        for geotiff_file in geotiff_files:
-            geotiff_filename = os.path.basename(geotiff_file)
-            geotiff_filename_no_ext = os.path.splitext(geotiff_filename)[0]
+        Args:
+            obj_counter (dict): Result of process_images ({class_name: {"count": int, "objects": [ObjectDetails]}})
+            geotransforms (dict): GDAL geotransform of every georeferenced image ({image_path: (c, a, b, f, d, e)})
 
-            for class_name in obj_counter:
-                for i, obj in enumerate(obj_counter[class_name]["objects"]):
-                    obj_filename = os.path.basename(obj.image_path)
-                    obj_filename_no_ext = os.path.splitext(obj_filename)[0]
+        Returns:
+            dict: obj_counter with the gps field of the objects filled in
 
-                    # Проверяем, соответствует ли geotiff_file изображению объекта
-                    if geotiff_filename_no_ext == f"temp_{obj_filename_no_ext}":
-                        x, y = (obj.box[2] + obj.box[0]) / 2, (obj.box[3] + obj.box[1]) / 2
+        Description:
+            The calc_gps method groups objects by source image, then converts the box centers of each image
+            to coordinates in one vectorized operation with the already loaded geotransform.
+        """
+        # Индекс: путь снимка -> список (класс, позиция объекта в списке)
+        objects_by_path = defaultdict(list)
+        for class_name, details in obj_counter.items():
+            for i, obj in enumerate(details["objects"]):
+                objects_by_path[obj.image_path].append((class_name, i))
+
+        objects_by_image = defaultdict(list)
+        for image_path, entries in objects_by_path.items():
+            objects_by_image[self.get_image_key(image_path)].extend(entries)
+
+        self.progress.start("geolocation", len(geotransforms))
+        for image_path, geotransform in geotransforms.items():
+            self.progress.advance()
+            entries = objects_by_image.get(self.get_image_key(image_path))
+            if not entries:
+                continue
 
-                        lat, lon = self.pixel_to_coord(geotiff_file, x, y)
+            class_name, i = entries[0]
+            gps_index = obj_counter[class_name]["objects"][i]._fields.index("gps")
+            boxes = np.array(
+                [obj_counter[class_name]["objects"][i].box for class_name, i in entries],
+                dtype=np.float64,
+            )
+            lats, lons = self.pixels_to_coords(
+                geotransform,
+                (boxes[:, 2] + boxes[:, 0]) / 2,
+                (boxes[:, 3] + boxes[:, 1]) / 2,
+            )
 
-                        # Создаем новый экземпляр с обновленным GPS
-                        new_obj = obj._replace(gps=(lat, lon))
-                        # Обновляем объект в списке
-                        obj_counter[class_name]["objects"][i] = new_obj
+            # _make вместо _replace: без промежуточного словаря на каждый объект
+            for (class_name, i), lat, lon in zip(entries, lats.tolist(), lons.tolist()):
+                objects = obj_counter[class_name]["objects"]
+                values = list(objects[i])
+                values[gps_index] = (lat, lon)
+                objects[i] = objects[i]._make(values)
 
         return obj_counter
 
+    def get_image_key(self, image_path):
+        """Get the key that matches objects with their image (file name without extension)"""
+        return os.path.splitext(os.path.basename(image_path))[0]
+
+    def pixels_to_coords(self, geotransform, xs, ys):
+        """Convert pixel coordinates to geographic coordinates
+
+        Args:
+            geotransform (tuple): GDAL geotransform of the image
+            xs (numpy.ndarray): Pixel columns
+            ys (numpy.ndarray): Pixel rows
+
+        Returns:
+            tuple: latitudes, longitudes (numpy arrays)
+        """
+        x_coords = geotransform[0] + xs * geotransform[1] + ys * geotransform[2]
+        y_coords = geotransform[3] + xs * geotransform[4] + ys * geotransform[5]
+        return y_coords, x_coords
 
     def pixel_to_coord(self, geotiff_file, x, y):
         # Открыть GeoTIFF файл
@@ -63,10 +174,8 @@ class GeoTIFFCreator:
         transform = dataset.GetGeoTransform()
 
         # Получить координаты
-        x_coord = transform[0] + x * transform[1] + y * transform[2]
-        y_coord = transform[3] + x * transform[4] + y * transform[5]
+        return self.pixels_to_coords(transform, x, y)
 
-        return (y_coord, x_coord)
     def get_temp_tif_path(self, jpg_path):
         """Get temporary tif file path
 
@@ -84,39 +193,280 @@ class GeoTIFFCreator:
         temp_output_path = f"temp_{name_without_ext}.tif"
         return temp_output_path
 
-    def create_mosaic(self):
-        """Create a GeoTIFF mosaic from a set of images with GPS data and relative altitude"""
+    def create_mosaic(self, georeferenced=None):
+        """Create a GeoTIFF mosaic from a set of images with GPS data and relative altitude
+
+        Args:
+            georeferenced (list): (image path, georeferenced file path) pairs made beforehand by georeference_images,
+                e.g. in parallel tasks. If None, the images are georeferenced here
+
+        Returns:
+            tuple: Path to the mosaic and obj_counter with GPS coordinates of the objects
+        """
         src_files_to_mosaic = []
-        temp_files = []
-
-        for jpg_path in self.image_paths:
-            (
-                center_lat,
-                center_lon,
-                pixel_width,
-                pixel_height,
-                image_width,
-                image_height,
-            ) = self.process_image(jpg_path)
-            if center_lat is None or center_lon is None:
-                continue
+        # Временные файлы складываем рядом с результатом, а не в текущую директорию
+        scratch_dir = tempfile.mkdtemp(
+            prefix="mosaic_", dir=os.path.dirname(os.path.abspath(self.output_path))
+        )
 
-            temp_output_path = self.get_temp_tif_path(jpg_path)
-            temp_files.append(temp_output_path)
-            self.create_geotiff(
-                jpg_path,
-                temp_output_path,
-                center_lat,
-                center_lon,
-                pixel_width,
-                pixel_height,
-                image_width,
-                image_height,
+        try:
+            if georeferenced is None:
+                georeferenced = self.georeference_images(scratch_dir)
+            for _, temp_output_path in georeferenced:
+                src_files_to_mosaic.append(rasterio.open(temp_output_path))
+
+            # COG пишется копированием готовой мозаики, поэтому сначала собираем её во временный файл
+            mosaic_path = os.path.join(scratch_dir, "mosaic.tif") if self.cog else self.output_path
+            if self.block_size:
+                self.write_mosaic_windowed(src_files_to_mosaic, mosaic_path)
+            else:
+                self.write_mosaic_in_memory(src_files_to_mosaic, mosaic_path)
+            if self.cog:
+                self.write_cog(mosaic_path, self.output_path)
+
+            geotransforms = {
+                jpg_path: src.transform.to_gdal()
+                for (jpg_path, _), src in zip(georeferenced, src_files_to_mosaic)
+            }
+            obj_counter = self.calc_gps(self.obj_counter, geotransforms)
+        finally:
+            for src in src_files_to_mosaic:
+                src.close()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        return self.output_path, obj_counter
+
+    def create_quicklook(self, scale=8):
+        """Create a low-resolution preview mosaic
+
+        Args:
+            scale (int): Reduction of every image: 2, 4 or 8 (decoded in the DCT domain, see read_reduced_image)
+
+        Returns:
+            str: Path to the preview mosaic (output_path), or None if no image has GPS data
+
+        Description:
+            The create_quicklook method georeferences the reduced images with the same math as the full mosaic
+            (process_image and get_transform with the pixel size scaled up), merges them in memory and writes
+            a small Cloud-Optimized GeoTIFF. The file is replaced atomically, so readers never see a partial file.
+        """
+        self.progress.start("quicklook", len(self.image_paths))
+        if self.workers > 1 and len(self.image_paths) > 1:
+            # Декодирование JPEG в PIL отпускает GIL, потоков достаточно
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                images = []
+                for image in pool.map(self.read_quicklook_image, self.image_paths, repeat(scale)):
+                    images.append(image)
+                    self.progress.advance()
+        else:
+            images = []
+            for jpg_path in self.image_paths:
+                images.append(self.read_quicklook_image(jpg_path, scale))
+                self.progress.advance()
+
+        memfiles = []
+        try:
+            for data, transform in filter(None, images):
+                memfile = MemoryFile()
+                with memfile.open(
+                    driver="GTiff",
+                    height=data.shape[0],
+                    width=data.shape[1],
+                    count=data.shape[2],
+                    dtype=data.dtype,
+                    crs="+proj=latlong",
+                    transform=transform,
+                ) as dst:
+                    dst.write(np.moveaxis(data, 2, 0))
+                memfiles.append(memfile)
+            if not memfiles:
+                return None
+
+            sources = [memfile.open() for memfile in memfiles]
+            try:
+                mosaic, mosaic_transform = merge(sources)
+                meta = sources[0].meta.copy()
+            finally:
+                for src in sources:
+                    src.close()
+            meta.update(
+                {
+                    "driver": "GTiff",
+                    "height": mosaic.shape[1],
+                    "width": mosaic.shape[2],
+                    "transform": mosaic_transform,
+                }
             )
-            src_files_to_mosaic.append(rasterio.open(temp_output_path))
 
-        mosaic, out_trans = merge(src_files_to_mosaic)
-        out_meta = src_files_to_mosaic[0].meta.copy()
+            temp_path = f"{self.output_path}.tmp"
+            with MemoryFile() as mosaic_file:
+                with mosaic_file.open(**meta) as dst:
+                    dst.write(mosaic)
+                with mosaic_file.open() as src:
+                    copy_dataset(src, temp_path, driver="COG", compress="DEFLATE", overviews="AUTO")
+            os.replace(temp_path, self.output_path)
+        finally:
+            for memfile in memfiles:
+                memfile.close()
+        return self.output_path
+
+    def read_quicklook_image(self, jpg_path, scale):
+        """Read the reduced image and its transform
+
+        Args:
+            jpg_path (str): Path to image file (e.g. /path/to/image.jpg)
+            scale (int): Reduction of the image
+
+        Returns:
+            tuple: Image (height, width, 3) and its Affine transform, or None if the image has no GPS data
+        """
+        (
+            center_lat,
+            center_lon,
+            pixel_width,
+            pixel_height,
+            image_width,
+            image_height,
+        ) = self.process_image(jpg_path)
+        if center_lat is None or center_lon is None:
+            return None
+
+        data = self.read_reduced_image(jpg_path, scale)
+        height, width = data.shape[:2]
+        # Тот же охват на земле меньшим числом пикселей
+        transform = self.get_transform(
+            center_lat,
+            center_lon,
+            pixel_width * image_width / width,
+            pixel_height * image_height / height,
+            width,
+            height,
+        )
+        return data, transform
+
+    def read_reduced_image(self, jpg_path, scale):
+        """Decode the image at a reduced resolution
+
+        Args:
+            jpg_path (str): Path to image file (e.g. /path/to/image.jpg)
+            scale (int): Reduction of the image: 2, 4 or 8
+
+        Returns:
+            numpy.ndarray: RGB image (height, width, 3)
+
+        Description:
+            JPEG draft mode makes libjpeg scale the image while decoding the DCT blocks (1/2, 1/4 or 1/8),
+            which is several times faster than decoding the full image. Other formats are decoded fully and reduced.
+        """
+        with Image.open(jpg_path) as img:
+            target = (max(1, img.width // scale), max(1, img.height // scale))
+            img.draft("RGB", target)
+            img = img.convert("RGB")
+        factor = img.width // target[0]
+        if factor > 1:
+            img = img.reduce(factor)
+        return np.asarray(img)
+
+    def georeference_images(self, scratch_dir):
+        """Georeference all images, in parallel if workers > 1
+
+        Args:
+            scratch_dir (str): Directory for the georeferenced files
+
+        Returns:
+            list: (image path, georeferenced file path) pairs in the order of image_paths (images without GPS data are skipped)
+
+        Description:
+            The georeference_images method runs georeference_image for every image in a thread or process pool.
+            Results keep the order of image_paths, so the mosaic does not depend on which worker finishes first.
+            Daemon processes (e.g. Celery prefork workers) cannot start a process pool, so threads are used there.
+        """
+        # Метаданные снимков читаются здесь же, поэтому отдельного этапа для них нет
+        self.progress.start("georeferencing", len(self.image_paths))
+        if self.workers <= 1 or len(self.image_paths) <= 1:
+            results = []
+            for jpg_path in self.image_paths:
+                results.append(self.georeference_image(jpg_path, scratch_dir))
+                self.progress.advance()
+        else:
+            results = self.georeference_images_parallel(scratch_dir)
+
+        return [
+            (jpg_path, path)
+            for jpg_path, path in zip(self.image_paths, results)
+            if path is not None
+        ]
+
+    def georeference_images_parallel(self, scratch_dir):
+        """Run georeference_image for every image in a pool, keeping the order of image_paths"""
+        if self.executor == "process" and not multiprocessing.current_process().daemon:
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_georeference_worker,
+                initargs=(self.hfov_degrees, self.use_vrt, self.metadata_cache_path),
+            )
+            worker = _georeference_in_worker
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.workers)
+            worker = self.georeference_image
+
+        results = []
+        with pool:
+            for result in pool.map(worker, self.image_paths, repeat(scratch_dir)):
+                results.append(result)
+                self.progress.advance()
+        return results
+
+    def georeference_image(self, jpg_path, scratch_dir):
+        """Georeference one image
+
+        Args:
+            jpg_path (str): Path to image file (e.g. /path/to/image.jpg)
+            scratch_dir (str): Directory for the georeferenced file
+
+        Returns:
+            str: Path to the georeferenced VRT or GeoTIFF file, or None if the image has no GPS data
+        """
+        (
+            center_lat,
+            center_lon,
+            pixel_width,
+            pixel_height,
+            image_width,
+            image_height,
+        ) = self.process_image(jpg_path)
+        if center_lat is None or center_lon is None:
+            return None
+
+        temp_output_path = os.path.join(scratch_dir, self.get_temp_tif_path(jpg_path))
+        create_georeferenced = self.create_geotiff
+        if self.use_vrt:
+            temp_output_path = os.path.splitext(temp_output_path)[0] + ".vrt"
+            create_georeferenced = self.create_vrt
+        create_georeferenced(
+            jpg_path,
+            temp_output_path,
+            center_lat,
+            center_lon,
+            pixel_width,
+            pixel_height,
+            image_width,
+            image_height,
+        )
+        return temp_output_path
+
+    def write_mosaic_in_memory(self, sources, output_path):
+        """Merge all sources in memory and write the mosaic in one go
+
+        Args:
+            sources (list): List of opened rasterio datasets
+            output_path (str): Path to output GeoTIFF file (e.g. /path/to/output.tif)
+
+        Description:
+            The write_mosaic_in_memory method keeps the whole mosaic as one array, so memory grows with the flight size.
+        """
+        self.progress.start("mosaic", 1)
+        mosaic, out_trans = merge(sources)
+        out_meta = sources[0].meta.copy()
         out_meta.update(
             {
                 "driver": "GTiff",
@@ -126,16 +476,161 @@ class GeoTIFFCreator:
             }
         )
 
-        with rasterio.open(self.output_path, "w", **out_meta) as dest:
+        with rasterio.open(output_path, "w", **out_meta) as dest:
             dest.write(mosaic)
+        self.progress.advance()
 
-        obj_counter = self.calc_gps(self.obj_counter, temp_files)
+    def get_mosaic_grid(self, sources):
+        """Compute the output grid of the mosaic
 
-        for src in src_files_to_mosaic:
-            src.close()
-        for temp_file in temp_files:
-            os.remove(temp_file)
-        return self.output_path, obj_counter
+        Args:
+            sources (list): List of opened rasterio datasets
+
+        Returns:
+            tuple: transform, width, height
+
+        Description:
+            The get_mosaic_grid method uses the union of the source bounds and the resolution of the first source, the same way rasterio.merge does.
+        """
+        left = min(src.bounds.left for src in sources)
+        bottom = min(src.bounds.bottom for src in sources)
+        right = max(src.bounds.right for src in sources)
+        top = max(src.bounds.top for src in sources)
+        res_x, res_y = sources[0].res
+
+        transform = from_origin(left, top, res_x, res_y)
+        width = max(1, int(round((right - left) / res_x)))
+        height = max(1, int(round((top - bottom) / res_y)))
+        return transform, width, height
+
+    def write_mosaic_windowed(self, sources, output_path):
+        """Write the mosaic block by block into a tiled GeoTIFF
+
+        Args:
+            sources (list): List of opened rasterio datasets
+            output_path (str): Path to output GeoTIFF file (e.g. /path/to/output.tif)
+
+        Description:
+            The write_mosaic_windowed method computes the output grid up front and merges every block only from
+            the sources that overlap it, so peak memory depends on block_size and not on the number of images.
+        """
+        transform, width, height = self.get_mosaic_grid(sources)
+
+        out_meta = sources[0].meta.copy()
+        out_meta.update(
+            {
+                "driver": "GTiff",
+                "height": height,
+                "width": width,
+                "transform": transform,
+                "tiled": True,
+                "blockxsize": self.block_size,
+                "blockysize": self.block_size,
+            }
+        )
+
+        # Границы источников в одном массиве, чтобы быстро находить пересечения с блоком
+        src_bounds = np.array([tuple(src.bounds) for src in sources])
+
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(
+            output_path, "w", **out_meta
+        ) as dest:
+            windows = [window for _, window in dest.block_windows(1)]
+            self.progress.start("mosaic", len(windows))
+            for window in windows:
+                self.progress.advance()
+                left, bottom, right, top = window_bounds(window, transform)
+                overlaps = np.flatnonzero(
+                    (src_bounds[:, 0] < right)
+                    & (src_bounds[:, 2] > left)
+                    & (src_bounds[:, 1] < top)
+                    & (src_bounds[:, 3] > bottom)
+                )
+                if len(overlaps) == 0:
+                    continue
+
+                block_sources = [sources[i] for i in overlaps]
+                data, filled = self.read_block(
+                    block_sources, window_transform(window, transform), window.height, window.width
+                )
+                dest.write(data, window=window)
+                # Маска отделяет пустые области от чёрных пикселей, в том числе после сжатия JPEG
+                dest.write_mask(filled.astype(np.uint8) * 255, window=window)
+
+    def write_cog(self, src_path, output_path):
+        """Write Cloud-Optimized GeoTIFF
+
+        Args:
+            src_path (str): Path to the mosaic GeoTIFF
+            output_path (str): Path to output GeoTIFF file (e.g. /path/to/output.tif)
+
+        Description:
+            The write_cog method copies the mosaic with the GDAL COG driver: internal 512x512 tiles, the selected
+            compression and an overview pyramid, so any zoom level can be read with a few range requests.
+        """
+        options = {
+            "compress": self.compress.upper(),
+            "blocksize": 512,
+            "overviews": "AUTO",
+            "overview_resampling": "AVERAGE",
+            "bigtiff": "IF_SAFER",
+        }
+        if self.compress.lower() in ("jpeg", "webp"):
+            options["quality"] = self.quality
+        elif self.compress.lower() in ("deflate", "lzw"):
+            options["predictor"] = 2
+
+        self.progress.start("cog", 1)
+        copy_dataset(src_path, output_path, driver="COG", **options)
+        self.progress.advance()
+
+    def read_block(self, sources, block_transform, height, width):
+        """Sample one output block from the overlapping sources
+
+        Args:
+            sources (list): List of opened rasterio datasets that overlap the block
+            block_transform (Affine): Transform of the block
+            height (int): Block height in pixels
+            width (int): Block width in pixels
+
+        Returns:
+            tuple: block data with shape (bands, height, width), mask of the covered pixels with shape (height, width)
+
+        Description:
+            The read_block method takes every output pixel from the source pixel under its center (nearest neighbour).
+            The first source covering a pixel wins, like the default "first" method of rasterio.merge. Sampling does not
+            depend on the block grid, so neighbouring blocks line up without seams.
+        """
+        data = np.zeros((sources[0].count, height, width), dtype=sources[0].dtypes[0])
+        filled = np.zeros((height, width), dtype=bool)
+
+        # Координаты центров пикселей блока
+        xs = block_transform.c + (np.arange(width) + 0.5) * block_transform.a
+        ys = block_transform.f + (np.arange(height) + 0.5) * block_transform.e
+
+        for src in sources:
+            cols = np.floor((xs - src.transform.c) / src.transform.a).astype(np.int64)
+            rows = np.floor((ys - src.transform.f) / src.transform.e).astype(np.int64)
+            col_idx = np.flatnonzero((cols >= 0) & (cols < src.width))
+            row_idx = np.flatnonzero((rows >= 0) & (rows < src.height))
+            if len(col_idx) == 0 or len(row_idx) == 0:
+                continue
+
+            cols, rows = cols[col_idx], rows[row_idx]
+            src_window = Window(
+                cols[0], rows[0], cols[-1] - cols[0] + 1, rows[-1] - rows[0] + 1
+            )
+            src_data = src.read(window=src_window)
+            patch = src_data[:, rows - rows[0]][:, :, cols - cols[0]]
+
+            dst_rows = slice(row_idx[0], row_idx[-1] + 1)
+            dst_cols = slice(col_idx[0], col_idx[-1] + 1)
+            target = data[:, dst_rows, dst_cols]
+            empty = ~filled[dst_rows, dst_cols]
+            target[:, empty] = patch[:, empty]
+            filled[dst_rows, dst_cols] = True
+
+        return data, filled
 
     def process_image(self, img_path):
         """Process image to get GPS data and pixel size in degrees and image dimensions
@@ -149,13 +644,13 @@ class GeoTIFFCreator:
         Description:
             The process_image method processes the image to get GPS data and pixel size in degrees and image dimensions.
         """
-        center_lat, center_lon = self.get_gps(img_path)
-        h = self.get_relative_alt(img_path)
-        if h is None:
+        metadata = self.get_metadata(img_path)
+        center_lat, center_lon = metadata.lat, metadata.lon
+        h = metadata.relative_alt
+        if h is None or center_lat is None or center_lon is None:
             return None, None, None, None, None, None
 
-        image = Image.open(img_path)
-        image_dims = image.size
+        image_dims = (metadata.width, metadata.height)
         pixel_width, pixel_height = self.calc_pixel_size_degrees(
             h, center_lat, center_lon, image_dims
         )
@@ -168,6 +663,21 @@ class GeoTIFFCreator:
             image_dims[1],
         )
 
+    def get_metadata(self, img_path):
+        """Get image metadata
+
+        Args:
+            img_path (str): Path to image file (e.g. /path/to/image.jpg)
+
+        Returns:
+            ImageMetadata: GPS coordinates, relative altitude, dimensions, gimbal angles and timestamp
+
+        Description:
+            The get_metadata method reads the image header once and keeps the result in the persistent cache,
+            so a re-run of the project does not parse headers again.
+        """
+        return get_image_metadata(img_path, self.metadata_cache)
+
     def get_gps(self, img_path):
         """Get GPS coordinates from image EXIF data
 
@@ -176,27 +686,9 @@ class GeoTIFFCreator:
 
         Returns:
             tuple: latitude, longitude
-
-        Description:
-            The get_gps method gets GPS coordinates from image EXIF data.
         """
-        try:
-            with open(img_path, "rb") as f:
-                my_image = exif.Image(f)
-                lat = (
-                    my_image.gps_latitude[0]
-                    + my_image.gps_latitude[1] / 60
-                    + my_image.gps_latitude[2] / 3600
-                )
-                lon = (
-                    my_image.gps_longitude[0]
-                    + my_image.gps_longitude[1] / 60
-                    + my_image.gps_longitude[2] / 3600
-                )
-            return lat, lon
-        except Exception as e:
-            print(f"Error getting GPS data from {img_path}: {e}")
-            return None, None
+        metadata = self.get_metadata(img_path)
+        return metadata.lat, metadata.lon
 
     def get_relative_alt(self, img_path):
         """Get relative altitude from image XMP data
@@ -206,17 +698,8 @@ class GeoTIFFCreator:
 
         Returns:
             float: Relative altitude
-
-        Description:
-            The get_relative_alt method gets relative altitude from image XMP data.
         """
-        try:
-            metadata = pyexiv2.Image(img_path)
-            xmp_metadata = metadata.read_xmp()
-            return float(xmp_metadata.get("Xmp.drone-dji.RelativeAltitude", 0))
-        except Exception as e:
-            print(f"Error getting altitude from {img_path}: {e}")
-            return None
+        return self.get_metadata(img_path).relative_alt
 
 
     def calc_pixel_size_meters(self, h, image_dims):
@@ -306,11 +789,8 @@ class GeoTIFFCreator:
         img = Image.open(jpg_path)
         data = np.array(img)
 
-        transform = from_origin(
-            center_lon - pixel_width * image_width / 2,
-            center_lat + pixel_height * image_height / 2,
-            pixel_width,
-            pixel_height,
+        transform = self.get_transform(
+            center_lat, center_lon, pixel_width, pixel_height, image_width, image_height
         )
 
         with rasterio.open(
@@ -329,3 +809,89 @@ class GeoTIFFCreator:
                     dst.write(data[:, :, i], i + 1)
             else:  # For grayscale images
                 dst.write(data, 1)
+
+    def create_vrt(
+        self,
+        jpg_path,
+        output_path,
+        center_lat,
+        center_lon,
+        pixel_width,
+        pixel_height,
+        image_width,
+        image_height,
+    ):
+        """Create VRT file that georeferences the image without copying its pixels
+
+        Args:
+            jpg_path (str): Path to image file (e.g. /path/to/image.jpg)
+            output_path (str): Path to output VRT file (e.g. /path/to/output.vrt)
+            center_lat (float): Center latitude
+            center_lon (float): Center longitude
+            pixel_width (float): Pixel width in degrees
+            pixel_height (float): Pixel height in degrees
+            image_width (int): Image width
+            image_height (int): Image height
+
+        Description:
+            The create_vrt method writes a small VRT file with the computed geotransform. Its bands point to the source
+            image, so the JPEG is decoded only when the mosaic reads it and no pixel data is written to disk.
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", NotGeoreferencedWarning)
+            with rasterio.open(jpg_path) as src:
+                dtypes = src.dtypes
+                colorinterp = [ci.name.capitalize() for ci in src.colorinterp]
+
+        transform = self.get_transform(
+            center_lat, center_lon, pixel_width, pixel_height, image_width, image_height
+        )
+        source_filename = escape(os.path.abspath(jpg_path))
+
+        bands = []
+        for i, dtype in enumerate(dtypes, start=1):
+            bands.append(
+                f'''  <VRTRasterBand dataType="{typename_fwd[dtype_rev[dtype]]}" band="{i}">
+    <ColorInterp>{colorinterp[i - 1]}</ColorInterp>
+    <SimpleSource>
+      <SourceFilename relativeToVRT="0">{source_filename}</SourceFilename>
+      <SourceBand>{i}</SourceBand>
+      <SrcRect xOff="0" yOff="0" xSize="{image_width}" ySize="{image_height}"/>
+      <DstRect xOff="0" yOff="0" xSize="{image_width}" ySize="{image_height}"/>
+    </SimpleSource>
+  </VRTRasterBand>'''
+            )
+
+        geotransform = ", ".join(repr(value) for value in transform.to_gdal())
+        with open(output_path, "w") as f:
+            f.write(
+                f'''<VRTDataset rasterXSize="{image_width}" rasterYSize="{image_height}">
+  <SRS>{escape("+proj=latlong")}</SRS>
+  <GeoTransform>{geotransform}</GeoTransform>
+{chr(10).join(bands)}
+</VRTDataset>
+'''
+            )
+
+    def get_transform(
+        self, center_lat, center_lon, pixel_width, pixel_height, image_width, image_height
+    ):
+        """Get affine transform of the image
+
+        Args:
+            center_lat (float): Center latitude
+            center_lon (float): Center longitude
+            pixel_width (float): Pixel width in degrees
+            pixel_height (float): Pixel height in degrees
+            image_width (int): Image width
+            image_height (int): Image height
+
+        Returns:
+            Affine: Transform from pixel to geographic coordinates
+        """
+        return from_origin(
+            center_lon - pixel_width * image_width / 2,
+            center_lat + pixel_height * image_height / 2,
+            pixel_width,
+            pixel_height,
+        )
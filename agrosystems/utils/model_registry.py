@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+from ultralytics import YOLO
+
+from .inference_backends import resolve_model_path
+from .lru import SizedLRUCache
+
+# Модели живут в процессе воркера между задачами; ключ - (путь к файлу бэкенда, mtime, режим трекинга)
+_models = SizedLRUCache(max_size=1024 ** 3)
+
+
+def configure(max_bytes):
+    """
+    Sets the memory limit of the registry.
+
+    Parameters:
+        - max_bytes: int - Maximum estimated size of the cached models in bytes.
+    """
+    _models.resize(max_bytes)
+
+
+def get_model(model_path, tracking=False, warmup=True, backend="pytorch"):
+    """
+    Returns a YOLO model for the file, loading it only on the first call in this process.
+
+    Parameters:
+        - model_path: str - Path to the model file (.pt) to use.
+        - tracking: bool - Whether the model is used with model.track. Ultralytics keeps tracker callbacks
+          on the model, so tracking and plain prediction use separate instances.
+        - warmup: bool - Run one inference on a blank frame right after loading.
+        - backend: str - "pytorch", "onnx" or "openvino". Non-PyTorch backends are exported from the .pt file once.
+
+    Returns:
+        - YOLO: Loaded model. Models are not thread-safe: one model should serve one task at a time.
+    """
+    path = os.path.abspath(resolve_model_path(model_path, backend))
+    key = (path, os.path.getmtime(path), tracking)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    model = YOLO(path, task="detect")
+    if warmup:
+        warm_up(model)
+
+    # Файл модели изменился - старые экземпляры больше не нужны
+    for old_key in _models.keys():
+        if old_key[0] == path and old_key[1] != key[1]:
+            _models.pop(old_key)
+    _models.set(key, model, size=estimate_model_size(model, path))
+    return model
+
+
+def warm_up(model, imgsz=640):
+    """
+    Runs one inference on a blank frame, so the first real call does not pay for lazy initialization.
+
+    Parameters:
+        - model: YOLO - Loaded model.
+        - imgsz: int - Size of the blank frame.
+    """
+    model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+
+
+def reset_trackers(model):
+    """
+    Resets tracker state left by the previous task, so track IDs start from scratch.
+
+    Parameters:
+        - model: YOLO - Model used with model.track.
+    """
+    for tracker in getattr(model.predictor, "trackers", None) or []:
+        tracker.reset()
+
+
+def estimate_model_size(model, model_path):
+    """
+    Estimates memory used by the model: size of its parameters, or the file size if they are not available.
+
+    Parameters:
+        - model: YOLO - Loaded model.
+        - model_path: str - Path to the model file.
+
+    Returns:
+        - int: Size in bytes.
+    """
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except AttributeError:
+        # Экспортированные модели: OpenVINO - директория, ONNX - файл
+        if os.path.isdir(model_path):
+            return sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(model_path)
+                for name in names
+            )
+        return os.path.getsize(model_path)
+
+
+def preload_models(model_paths, tracking=False, backend="pytorch"):
+    """
+    Loads and warms up the models, e.g. when a worker process starts.
+
+    Parameters:
+        - model_paths: list - Paths to the model files.
+        - tracking: bool - Load the instances used with model.track.
+        - backend: str - Inference backend to load.
+    """
+    for model_path in model_paths:
+        try:
+            get_model(model_path, tracking=tracking, backend=backend)
+        except Exception as e:
+            print(f"Error preloading model {model_path}: {e}")
+
+
+def cache_stats():
+    """
+    Returns:
+        - dict: Number of cached models, their estimated size and cache hits/misses.
+    """
+    return {
+        "models": len(_models),
+        "size": _models.size,
+        "max_size": _models.max_size,
+        "hits": _models.hits,
+        "misses": _models.misses,
+    }
@@ -1,6 +1,11 @@
 import cv2
-from ultralytics import YOLO
+import numpy as np
+import queue
+import threading
+from itertools import count, islice
 from collections import defaultdict, namedtuple
+from .model_registry import get_model, reset_trackers
+from .progress import ProgressReporter
 
 # Используем namedtuple для определения структуры данных объекта с его характеристиками.
 ObjectDetails = namedtuple(
@@ -8,47 +13,396 @@ ObjectDetails = namedtuple(
 )
 
 
-def process_images(images_path, model_path):
+def iter_in_background(items, prefetch=4):
+    """
+    Consumes an iterator on a background thread through a bounded queue, so producing the items
+    (decoding frames) overlaps with their processing.
+
+    Parameters:
+        - items: iterator - Items to produce; a generator is closed when the consumer stops early.
+        - prefetch: int - Maximum number of items waiting in the queue.
+
+    Returns:
+        - generator: The items in their original order.
+    """
+    buffer = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                put(item)
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+            put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Останавливаем поток, если генератор закрыли раньше времени
+        stop.set()
+        thread.join()
+
+
+def prefetch_frames(images_path, prefetch=4):
+    """
+    Decodes images on a background thread, so decoding overlaps with inference.
+
+    Parameters:
+        - images_path: list - Paths to the images.
+        - prefetch: int - Maximum number of decoded frames waiting in the queue.
+
+    Returns:
+        - generator: (image_path, frame) pairs in the order of images_path. Frames are BGR numpy arrays.
+    """
+
+    def decode():
+        for path in images_path:
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"Error reading image {path}")
+                continue
+            yield path, frame
+
+    return iter_in_background(decode(), prefetch)
+
+
+def read_video_frames(video_path, stride=1, motion_threshold=None, motion_size=64):
+    """
+    Reads the frames of a video that are worth running the model on.
+
+    Every stride-th frame is a candidate; the frames in between are only grabbed, not decoded.
+    With motion_threshold a candidate is also skipped while the scene has hardly changed since
+    the last returned frame (for example, while the drone hovers).
+
+    Parameters:
+        - video_path: str - The path to the video file.
+        - stride: int - Take every stride-th frame.
+        - motion_threshold: float - Minimum mean absolute difference of the grayscale frames (0..255)
+          from the last returned frame. None - no motion check.
+        - motion_size: int - Side of the downscaled frame used for the motion check, in pixels.
+
+    Returns:
+        - generator: (frame_index, frame) pairs, frames are BGR numpy arrays.
+    """
+    stride = max(1, stride)
+    cap = cv2.VideoCapture(video_path)
+    previous = None
+    try:
+        for index in count():
+            if index % stride:
+                if not cap.grab():
+                    break
+                continue
+            success, frame = cap.read()
+            if not success:
+                break
+            if motion_threshold is not None:
+                small = cv2.resize(
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                    (motion_size, motion_size),
+                    interpolation=cv2.INTER_AREA,
+                )
+                # Сравниваем с последним взятым кадром, чтобы медленное движение тоже накапливалось
+                if previous is not None and cv2.absdiff(small, previous).mean() < motion_threshold:
+                    continue
+                previous = small
+            yield index, frame
+    finally:
+        cap.release()
+
+
+def iter_detections(
+    images_path,
+    model_path,
+    batch_size=1,
+    prefetch=4,
+    track=True,
+    backend="pytorch",
+    tile_size=None,
+    tile_overlap=0.2,
+    tile_batch=8,
+    tile_nms_threshold=0.5,
+):
+    """
+    Runs the YOLO model over the images and yields the detected objects image by image.
+
+    Parameters:
+        - images_path: list - Paths to the images.
+        - model_path: str - Path to the model file (.pt) to use.
+        - batch_size: int - Number of frames per inference call. Only used when track is False,
+          because the tracker has to see the frames one by one.
+        - prefetch: int - Number of frames decoded ahead on a background thread.
+        - track: bool - Use model.track and its track IDs; otherwise model.predict, and every detection gets its own ID.
+        - backend: str - Inference backend: "pytorch", "onnx" or "openvino".
+        - tile_size: int - Cut every frame into tiles of this size (pixels) and detect on the tiles.
+          Tiled inference always runs without the tracker. None - detect on the whole frame.
+        - tile_overlap: float - Overlap of neighbouring tiles (0..1).
+        - tile_batch: int - Number of tiles per inference call.
+        - tile_nms_threshold: float - Boxes from different tiles that overlap more than this are merged.
+
+    Returns:
+        - generator: (image_path, [ObjectDetails]) pairs in the order of images_path.
+    """
+    track = track and not tile_size
+    model = get_model(model_path, tracking=track, backend=backend)
+    frames = prefetch_frames(images_path, prefetch)
+
+    if track:
+        reset_trackers(model)
+        for path, frame in frames:
+            results = model.track(frame, persist=True, verbose=False)
+            yield path, extract_objects(results[0], path)
+        return
+
+    detection_ids = count(1)
+    if tile_size:
+        for path, frame in frames:
+            names, classes, boxes = detect_tiled(
+                model, frame, tile_size, tile_overlap, tile_batch, tile_nms_threshold
+            )
+            track_ids = [next(detection_ids) for _ in range(len(boxes))]
+            yield path, make_objects(names, classes, track_ids, boxes, path)
+        return
+
+    while True:
+        batch = list(islice(frames, max(1, batch_size)))
+        if not batch:
+            break
+        paths = [path for path, _ in batch]
+        results = model.predict([frame for _, frame in batch], verbose=False)
+        for path, result in zip(paths, results):
+            yield path, extract_objects(result, path, detection_ids)
+
+
+def get_tile_offsets(length, tile_size, overlap):
+    """
+    Returns start offsets of the tiles along one side of the frame. The last tile is aligned to the edge.
+    """
+    if length <= tile_size:
+        return [0]
+    step = max(1, int(tile_size * (1 - overlap)))
+    offsets = list(range(0, length - tile_size, step))
+    offsets.append(length - tile_size)
+    return offsets
+
+
+def slice_frame(frame, tile_size, overlap=0.2):
+    """
+    Cuts the frame into overlapping tiles.
+
+    Parameters:
+        - frame: numpy.ndarray - Image (height, width, channels).
+        - tile_size: int - Tile size in pixels.
+        - overlap: float - Overlap of neighbouring tiles (0..1).
+
+    Returns:
+        - list: (x_offset, y_offset, tile) tuples. Tiles are views of the frame, not copies.
+    """
+    height, width = frame.shape[:2]
+    return [
+        (x, y, frame[y : y + tile_size, x : x + tile_size])
+        for y in get_tile_offsets(height, tile_size, overlap)
+        for x in get_tile_offsets(width, tile_size, overlap)
+    ]
+
+
+def merge_tile_boxes(boxes, scores, classes, threshold=0.5):
+    """
+    Cross-tile NMS: keeps the best box of every group of same-class boxes that overlap.
+
+    Overlap is measured as intersection over the smaller box, so an object cut by a tile border
+    is merged with the full box from the neighbouring tile.
+
+    Parameters:
+        - boxes: numpy.ndarray - Boxes (N, 4) as x1, y1, x2, y2 in frame coordinates.
+        - scores: numpy.ndarray - Confidences (N,).
+        - classes: numpy.ndarray - Class IDs (N,).
+        - threshold: float - Boxes overlapping more than this are merged.
+
+    Returns:
+        - numpy.ndarray: Indexes of the kept boxes, best first.
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(
+            np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None
+        )
+        height = np.clip(
+            np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None
+        )
+        overlap = width * height / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+        order = rest[(overlap <= threshold) | (classes[rest] != classes[best])]
+    return np.array(keep, dtype=np.int64)
+
+
+def detect_tiled(model, frame, tile_size, overlap=0.2, tile_batch=8, nms_threshold=0.5):
+    """
+    Detects objects on overlapping tiles of the frame and merges them back into frame coordinates.
+
+    Parameters:
+        - model: YOLO - Loaded model.
+        - frame: numpy.ndarray - Image (BGR).
+        - tile_size: int - Tile size in pixels.
+        - overlap: float - Overlap of neighbouring tiles (0..1).
+        - tile_batch: int - Number of tiles per inference call.
+        - nms_threshold: float - Threshold of the cross-tile NMS.
+
+    Returns:
+        - tuple: class names (dict), class IDs (N,), boxes (N, 4) in frame coordinates.
+    """
+    tiles = slice_frame(frame, tile_size, overlap)
+    names = {}
+    boxes, scores, classes = [], [], []
+
+    for start in range(0, len(tiles), max(1, tile_batch)):
+        chunk = tiles[start : start + max(1, tile_batch)]
+        results = model.predict([tile for _, _, tile in chunk], verbose=False)
+        for (x, y, _), result in zip(chunk, results):
+            names = result.names
+            if len(result.boxes) == 0:
+                continue
+            boxes.append(np.asarray(result.boxes.xyxy.cpu().tolist()) + [x, y, x, y])
+            scores.append(np.asarray(result.boxes.conf.cpu().tolist()))
+            classes.append(np.asarray(result.boxes.cls.cpu().tolist()))
+
+    if not boxes:
+        return names, np.empty(0), np.empty((0, 4))
+
+    boxes, scores, classes = np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes)
+    keep = merge_tile_boxes(boxes, scores, classes, nms_threshold)
+    return names, classes[keep], boxes[keep]
+
+
+def extract_objects(result, image_path, detection_ids=None):
+    """
+    Converts one YOLO result into a list of ObjectDetails.
+
+    Parameters:
+        - result: ultralytics.engine.results.Results - Result for one frame.
+        - image_path: str - Path to the frame.
+        - detection_ids: iterator - Source of IDs when the result has no track IDs (model.predict).
+
+    Returns:
+        - list: ObjectDetails of the frame with gps set to (0, 0).
+    """
+    boxes = result.boxes
+    if detection_ids is None:
+        if boxes.id is None:  # Трекер ещё не присвоил ID ни одному объекту
+            return []
+        track_ids = boxes.id.int().cpu().tolist()
+    else:
+        track_ids = [next(detection_ids) for _ in range(len(boxes))]
+
+    return make_objects(
+        result.names, boxes.cls.cpu().tolist(), track_ids, boxes.xyxy.cpu().tolist(), image_path
+    )
+
+
+def make_objects(names, classes, track_ids, boxes, image_path):
+    """
+    Builds ObjectDetails from detection arrays.
+
+    Parameters:
+        - names: dict - Class names by class ID.
+        - classes: list - Class IDs.
+        - track_ids: list - Track (or detection) IDs.
+        - boxes: list - Boxes as x1, y1, x2, y2.
+        - image_path: str - Path to the frame.
+
+    Returns:
+        - list: ObjectDetails with gps set to (0, 0).
+    """
+    objects = []
+    for cls, track_id, box in zip(classes, track_ids, boxes):
+        objects.append(
+            ObjectDetails(
+                class_name=names[int(cls)],
+                track_id=track_id,
+                box=tuple(float(value) for value in box),
+                gps=(0, 0),
+                image_path=image_path,
+            )
+        )
+    return objects
+
+
+def process_images(
+    images_path,
+    model_path,
+    batch_size=1,
+    prefetch=4,
+    track=True,
+    backend="pytorch",
+    tile_size=None,
+    tile_overlap=0.2,
+    tile_batch=8,
+    tile_nms_threshold=0.5,
+    progress=None,
+):
     """
     Processes all images in the specified directory using the YOLO model,
     supporting a variety of case-insensitive image formats.
 
     Parameters:
-        - directory_path: str - Path to the directory with images.
+        - images_path: list - Paths to the images.
         - model_path: str - Path to the model file (.pt) to use.
+        - batch_size: int - Number of frames per inference call (only without tracking).
+        - prefetch: int - Number of frames decoded ahead on a background thread.
+        - track: bool - Count unique objects by tracker IDs.
+        - backend: str - Inference backend: "pytorch", "onnx" or "openvino".
+        - tile_size, tile_overlap, tile_batch, tile_nms_threshold - Sliced inference, see iter_detections.
+        - progress: ProgressReporter - Receives the detection stage, one item per image.
 
     Returns:
         - dict: A dictionary with objects, including the number of unique tracking identifiers per class and box details.
     """
-    model = YOLO(model_path)
     unique_objects = defaultdict(set)
+    progress = progress or ProgressReporter()
+    progress.start("detection", len(images_path))
 
-    for frame in images_path:
-        results = model.track(frame, persist=True)
-        for cls, track_id, box in zip(
-            results[
-                0
-            ].boxes.cls,  # Class ID предполагаем, что это свойство результатов модели
-            results[0]
-            .boxes.id.int()
-            .cpu()
-            .tolist(),  # Track ID предполагаем, что это свойство результатов модели
-            results[
-                0
-            ].boxes.xyxy,  # Bounding Box предполагаем, что это свойство результатов модели
-        ):
-            # Преобразуем bounding box к тьюплу для возможности сохранения в set
-            box_tuple = tuple(box.cpu().tolist())
-            class_name = results[0].names[int(cls)]
-            # Создаем объект с деталями для сохранения в set
-            object_details = ObjectDetails(
-                class_name=class_name,
-                track_id=track_id,
-                box=box_tuple,
-                gps=(0, 0),
-                image_path=frame,
-            )
-            unique_objects[class_name].add(object_details)
+    detections = iter_detections(
+        images_path,
+        model_path,
+        batch_size=batch_size,
+        prefetch=prefetch,
+        track=track,
+        backend=backend,
+        tile_size=tile_size,
+        tile_overlap=tile_overlap,
+        tile_batch=tile_batch,
+        tile_nms_threshold=tile_nms_threshold,
+    )
+    for _, objects in detections:
+        for object_details in objects:
+            unique_objects[object_details.class_name].add(object_details)
+        progress.advance()
 
     # Подготавливаем и возвращаем результат
     result = {
@@ -64,34 +418,99 @@ def process_images(images_path, model_path):
     return result
 
 
-def process_video(video_path, model_path):
+def merge_object_counters(obj_counters):
+    """
+    Merges results of process_images over several chunks of images.
+
+    Without tracking every chunk numbers its detections from 1, so the IDs of each chunk are shifted
+    past the IDs of the previous chunks. Track IDs of different chunks are never the same object anyway:
+    the tracker does not see across chunks.
+
+    Parameters:
+        - obj_counters: list - Results of process_images in the order of the chunks. Objects can be plain lists
+          (after a JSON round trip through the Celery result backend).
+
+    Returns:
+        - dict: A dictionary with objects, including the number of unique identifiers per class and box details.
+    """
+    unique_objects = defaultdict(list)
+    offset = 0
+    for obj_counter in obj_counters:
+        max_id = 0
+        for details in obj_counter.values():
+            for obj in details["objects"]:
+                class_name, track_id, box, gps, image_path = obj
+                max_id = max(max_id, track_id)
+                unique_objects[class_name].append(
+                    ObjectDetails(class_name, track_id + offset, tuple(box), tuple(gps), image_path)
+                )
+        offset += max_id
+
+    return {
+        class_name: {
+            "count": len(set(obj.track_id for obj in objects)),
+            "objects": objects,
+        }
+        for class_name, objects in unique_objects.items()
+    }
+
+
+def process_video(
+    video_path,
+    model_path,
+    backend="pytorch",
+    batch_size=1,
+    prefetch=4,
+    stride=1,
+    motion_threshold=None,
+    progress=None,
+):
     """
     Processes video using the specified YOLO model to track objects.
 
+    Frames are decoded on a background thread (see read_video_frames for the frame sampling)
+    and passed to model.track in batches; the frames of a batch go to the tracker in order.
+
     Parameters:
         - video_path: str - The path to the video file.
         - model_path: str - Path to the model file (.pt) to use.
+        - backend: str - Inference backend: "pytorch", "onnx" or "openvino".
+        - batch_size: int - Number of frames per inference call.
+        - prefetch: int - Number of frames decoded ahead on a background thread.
+        - stride: int - Take every stride-th frame of the video.
+        - motion_threshold: float - Skip frames that barely differ from the last processed one, see read_video_frames.
+        - progress: ProgressReporter - Receives the video stage, one item per frame of the video
+          (skipped frames included), so its rate is the throughput in frames per second.
 
     Returns:
         - dict: A dictionary with the number of unique tracking IDs for each class.
     """
-    model = YOLO(model_path)
+    model = get_model(model_path, tracking=True, backend=backend)
+    reset_trackers(model)
     cap = cv2.VideoCapture(video_path)
-    unique_track_ids_by_class = defaultdict(set)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    progress = progress or ProgressReporter()
+    progress.start("video", total)
 
-    while cap.isOpened():
-        success, frame = cap.read()
-        if not success:
+    frames = iter_in_background(read_video_frames(video_path, stride, motion_threshold), prefetch)
+    unique_track_ids_by_class = defaultdict(set)
+    position = 0
+    while True:
+        batch = list(islice(frames, max(1, batch_size)))
+        if not batch:
             break
+        results = model.track([frame for _, frame in batch], persist=True, verbose=False)
+        for result in results:
+            for obj in extract_objects(result, video_path):
+                unique_track_ids_by_class[obj.class_name].add(obj.track_id)
+        # Пропущенные кадры тоже пройдены
+        last_index = batch[-1][0] + 1
+        progress.advance(last_index - position)
+        position = last_index
 
-        results = model.track(frame, persist=True)
-        for cls, track_id in zip(
-            results[0].boxes.cls, results[0].boxes.id.int().cpu().tolist()
-        ):
-            class_name = results[0].names[int(cls)]
-            unique_track_ids_by_class[class_name].add(track_id)
-
-    cap.release()
+    if position < total:
+        progress.advance(total - position)
     return {
         class_name: len(track_ids)
         for class_name, track_ids in unique_track_ids_by_class.items()
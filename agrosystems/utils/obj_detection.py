@@ -1,7 +1,7 @@
-from ultralytics import YOLO
+from .model_registry import get_model
 
 
-def detect_objects(image_path, model_path):
+def detect_objects(image_path, model_path, backend="pytorch"):
     """
     Performs object detection in the image using the YOLOv8 model and returns the coordinates,
     bounding boxes, center coordinates, and class of each detected object.
@@ -9,12 +9,13 @@ def detect_objects(image_path, model_path):
     Parameters:
         - image_path: str - The path to the image to be detected.
         - model_path: str - The path to the YOLOv8 model file (.pt).
+        - backend: str - Inference backend: "pytorch", "onnx" or "openvino".
 
     Returns:
         - detections: list of dictionaries with the center coordinates (x, y), class, confidence and bounding box (bbox) of each detected object.
     """
-    # Model loading
-    model = YOLO(model_path)
+    # Model loading (cached in the worker process)
+    model = get_model(model_path, backend=backend)
 
     # Image loading and processing
     results = model.predict(image_path)[0]
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes.
+
+    Reads /proc/self/statm on Linux; elsewhere falls back to the peak RSS of the process (ru_maxrss).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss в килобайтах на Linux и в байтах на macOS
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class PeakMemory:
+    """Samples the RSS of the process on a background thread and keeps the peak"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+        return False
+
+    def reset(self):
+        """Start a new measurement without restarting the sampling thread"""
+        self.start_rss = self.peak_rss = current_rss()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+
+def measure(func, *args, **kwargs):
+    """
+    Calls the function and measures its wall time and peak memory.
+
+    Parameters:
+        - func: callable - Function to measure.
+        - args, kwargs - Its arguments.
+
+    Returns:
+        - tuple: (result, {"wall_time": seconds, "peak_rss": bytes, "rss_delta": bytes}).
+          rss_delta is the growth of the peak over the RSS before the call. Memory of child processes
+          (GEOREF_EXECUTOR = "process") is not included.
+    """
+    with PeakMemory() as memory:
+        started_at = time.perf_counter()
+        result = func(*args, **kwargs)
+        wall_time = time.perf_counter() - started_at
+    return result, {
+        "wall_time": wall_time,
+        "peak_rss": memory.peak_rss,
+        "rss_delta": memory.peak_rss - memory.start_rss,
+    }
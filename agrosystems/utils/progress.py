@@ -0,0 +1,112 @@
+import threading
+import time
+import traceback
+
+from .profiling import PeakMemory
+
+
+class ProgressReporter:
+    """Reports progress of the processing stages through Celery's update_state"""
+
+    def __init__(self, task=None, min_interval=1.0, track_memory=False, memory_interval=0.1):
+        """Initialize ProgressReporter
+
+        Args:
+            task (celery.Task): Bound task whose state is updated. If None, progress is only tracked locally
+            min_interval (float): Minimum time between two updates in seconds, so the result backend is not flooded
+            track_memory (bool): Sample the RSS of the process on a background thread to record the peak of every stage.
+                The sampling stops in finish()
+            memory_interval (float): Time between two RSS samples in seconds
+
+        Description:
+            Every update is a PROGRESS state with meta {"stage", "done", "total", "rate"}, rate is items per second
+            since the start of the stage. Stages call start() once and advance() for every processed item.
+            A record of every finished stage is kept in stages: {"name", "started_at", "duration", "items", "total",
+            "peak_rss", "error", "traceback"}; fail() attaches an exception to the current stage.
+        """
+        self.task = task
+        self.min_interval = min_interval
+        self.stage = None
+        self.done = 0
+        self.total = 0
+        self.started_at = time.monotonic()
+        self.stages = []
+        self.error = ""
+        self.traceback = ""
+        self._record = None
+        self._sent_at = 0
+        self._lock = threading.Lock()
+        self._memory = PeakMemory(memory_interval).__enter__() if track_memory else None
+
+    @property
+    def meta(self):
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "rate": round(self.done / elapsed, 2) if elapsed > 0 else 0,
+        }
+
+    def start(self, stage, total):
+        """Start a new stage and report it right away"""
+        with self._lock:
+            self._close_stage()
+            self.stage = stage
+            self.done = 0
+            self.total = total
+            self.started_at = time.monotonic()
+            self._record = {
+                "name": stage,
+                "started_at": time.time(),
+                "duration": 0,
+                "items": 0,
+                "total": total,
+                "peak_rss": None,
+                "error": "",
+                "traceback": "",
+            }
+            if self._memory is not None:
+                self._memory.reset()
+            self._send()
+
+    def advance(self, count=1):
+        """Mark count items of the current stage as done; safe to call from several threads"""
+        with self._lock:
+            self.done += count
+            if self.done >= self.total or time.monotonic() - self._sent_at >= self.min_interval:
+                self._send()
+
+    def fail(self, exc):
+        """Attach the exception and its traceback to the current stage (the first failure is also kept in error)"""
+        text = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        with self._lock:
+            if self._record is not None:
+                self._record["error"] = repr(exc)
+                self._record["traceback"] = text
+            if not self.error:
+                self.error = repr(exc)
+                self.traceback = text
+
+    def finish(self):
+        """Close the current stage and stop the memory sampling"""
+        with self._lock:
+            self._close_stage()
+            if self._memory is not None:
+                self._memory.__exit__(None, None, None)
+                self._memory = None
+
+    def _close_stage(self):
+        if self._record is None:
+            return
+        self._record["duration"] = time.monotonic() - self.started_at
+        self._record["items"] = self.done
+        if self._memory is not None:
+            self._record["peak_rss"] = max(self._memory.peak_rss, self._memory.start_rss)
+        self.stages.append(self._record)
+        self._record = None
+
+    def _send(self):
+        self._sent_at = time.monotonic()
+        if self.task is not None:
+            self.task.update_state(state="PROGRESS", meta=self.meta)
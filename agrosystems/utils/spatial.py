@@ -0,0 +1,52 @@
+import math
+
+
+def grid_cell(lat, lon, cell_degrees):
+    """
+    Returns the grid cell of the point, used as a spatial index of the detections.
+
+    Parameters:
+        - lat: float - Latitude in degrees.
+        - lon: float - Longitude in degrees.
+        - cell_degrees: float - Cell size in degrees.
+
+    Returns:
+        - tuple: (grid_x, grid_y) cell numbers.
+    """
+    return math.floor(lon / cell_degrees), math.floor(lat / cell_degrees)
+
+
+def parse_bbox(value):
+    """
+    Parses a "west,south,east,north" string (the format of Leaflet's LatLngBounds.toBBoxString()).
+
+    Parameters:
+        - value: str - Bounding box in degrees.
+
+    Returns:
+        - tuple: (west, south, east, north).
+
+    Raises:
+        - ValueError: If the string is not four numbers or the box is empty.
+    """
+    west, south, east, north = (float(part) for part in value.split(","))
+    if west > east or south > north:
+        raise ValueError(f"Invalid bbox: {value}")
+    return west, south, east, north
+
+
+def bbox_cells(bbox, cell_degrees):
+    """
+    Returns ranges of the grid cells that cover the bounding box.
+
+    Parameters:
+        - bbox: tuple - (west, south, east, north) in degrees.
+        - cell_degrees: float - Cell size in degrees.
+
+    Returns:
+        - tuple: ((min_x, max_x), (min_y, max_y)), both ends inclusive.
+    """
+    west, south, east, north = bbox
+    min_x, min_y = grid_cell(south, west, cell_degrees)
+    max_x, max_y = grid_cell(north, east, cell_degrees)
+    return (min_x, max_x), (min_y, max_y)
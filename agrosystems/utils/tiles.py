@@ -0,0 +1,184 @@
+import io
+import os
+from functools import lru_cache
+
+import numpy as np
+import rasterio
+from PIL import Image
+from pyproj import Geod
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+
+from .lru import SizedLRUCache
+
+TILE_SIZE = 256
+# Половина длины экватора в Web Mercator (EPSG:3857), м
+WEB_MERCATOR_ORIGIN = 20037508.342789244
+
+# Готовые PNG-тайлы; ключ - (путь, mtime, z, x, y), поэтому новая мозаика не отдаёт старые тайлы
+_tile_cache = SizedLRUCache(max_size=256 * 1024 ** 2)
+
+
+def configure(max_bytes):
+    """
+    Sets the memory limit of the tile cache.
+
+    Parameters:
+        - max_bytes: int - Maximum total size of the cached PNG tiles in bytes.
+    """
+    _tile_cache.resize(max_bytes)
+
+
+def tile_bounds(z, x, y):
+    """
+    Returns bounds of the XYZ tile in Web Mercator meters (left, bottom, right, top).
+    """
+    size = 2 * WEB_MERCATOR_ORIGIN / 2 ** z
+    left = -WEB_MERCATOR_ORIGIN + x * size
+    top = WEB_MERCATOR_ORIGIN - y * size
+    return left, top - size, left + size, top
+
+
+@lru_cache(maxsize=64)
+def _mosaic_grid(path, mtime):
+    with rasterio.open(path) as src:
+        return transform_bounds(src.crs, "EPSG:3857", *src.bounds), src.crs, src.res[0], src.overviews(1)
+
+
+def select_overview_level(tile_res, source_res, overviews):
+    """
+    Returns the overview level to read a tile from.
+
+    Parameters:
+        - tile_res: float - Size of a tile pixel in units of the mosaic CRS.
+        - source_res: float - Size of a full-resolution mosaic pixel.
+        - overviews: list - Overview decimation factors of the mosaic (src.overviews(1)).
+
+    Returns:
+        - int: Index of the coarsest overview that is still at least as detailed as the tile, or None
+          to read the full resolution.
+    """
+    level = None
+    for i, factor in enumerate(overviews):
+        if factor * source_res <= tile_res:
+            level = i
+    return level
+
+
+def render_tile(path, z, x, y, tile_size=TILE_SIZE):
+    """
+    Renders one XYZ tile of the mosaic as PNG.
+
+    Parameters:
+        - path: str - Path to the mosaic GeoTIFF.
+        - z, x, y: int - Tile coordinates.
+        - tile_size: int - Tile size in pixels.
+
+    Returns:
+        - bytes: RGBA PNG. Pixels outside the mosaic and empty (black) pixels are transparent.
+    """
+    left, bottom, right, top = tile_bounds(z, x, y)
+    mosaic_bounds, crs, source_res, overviews = _mosaic_grid(path, os.path.getmtime(path))
+    m_left, m_bottom, m_right, m_top = mosaic_bounds
+    if left >= m_right or right <= m_left or bottom >= m_top or top <= m_bottom:
+        rgba = np.zeros((tile_size, tile_size, 4), dtype=np.uint8)
+    else:
+        transform = from_bounds(left, bottom, right, top, tile_size, tile_size)
+        # WarpedVRT с преобразованием тайла читает полное разрешение, поэтому уровень обзоров
+        # выбираем сами по размеру пикселя тайла в системе координат мозаики
+        t_left, _, t_right, _ = transform_bounds("EPSG:3857", crs, left, bottom, right, top)
+        level = select_overview_level((t_right - t_left) / tile_size, source_res, overviews)
+        open_options = {} if level is None else {"overview_level": level}
+        with rasterio.open(path, **open_options) as src, WarpedVRT(
+            src,
+            crs="EPSG:3857",
+            transform=transform,
+            width=tile_size,
+            height=tile_size,
+            resampling=Resampling.bilinear,
+            add_alpha=True,
+        ) as vrt:
+            data = vrt.read()
+        rgb = data[:3] if len(data) > 2 else np.repeat(data[:1], 3, axis=0)
+        alpha = data[-1]
+        # Как и раньше на клиенте: чёрные пиксели мозаики без маски считаются пустыми
+        alpha[(rgb == 0).all(axis=0)] = 0
+        rgba = np.dstack([*rgb, alpha])
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def get_tile(path, z, x, y):
+    """
+    Returns the PNG tile from the cache, rendering it on a miss.
+
+    Parameters:
+        - path: str - Path to the mosaic GeoTIFF.
+        - z, x, y: int - Tile coordinates.
+
+    Returns:
+        - bytes: RGBA PNG.
+    """
+    key = (path, os.path.getmtime(path), z, x, y)
+    png = _tile_cache.get(key)
+    if png is None:
+        png = render_tile(path, z, x, y)
+        _tile_cache.set(key, png)
+    return png
+
+
+def cache_stats():
+    """
+    Returns:
+        - dict: Number of cached tiles, their size and cache hits/misses.
+    """
+    return {
+        "tiles": len(_tile_cache),
+        "size": _tile_cache.size,
+        "max_size": _tile_cache.max_size,
+        "hits": _tile_cache.hits,
+        "misses": _tile_cache.misses,
+    }
+
+
+@lru_cache(maxsize=64)
+def _mosaic_info(path, mtime, max_size):
+    geod = Geod(ellps="WGS84")
+    with rasterio.open(path) as src:
+        west, south, east, north = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        # Маску читаем в уменьшенном виде (из обзоров), этого достаточно для оценки площади
+        scale = max(1, max(src.width, src.height) / max_size)
+        out_shape = (max(1, int(src.height / scale)), max(1, int(src.width / scale)))
+        mask = src.dataset_mask(out_shape=out_shape)
+        data = src.read(out_shape=(src.count, *out_shape), resampling=Resampling.nearest)
+
+    valid = (mask > 0) & ~(data == 0).all(axis=0)
+    center_lat = (south + north) / 2
+    center_lon = (west + east) / 2
+    _, _, width_m = geod.inv(west, center_lat, east, center_lat)
+    _, _, height_m = geod.inv(center_lon, south, center_lon, north)
+
+    return {
+        "bounds": [[south, west], [north, east]],
+        "width_m": width_m,
+        "height_m": height_m,
+        "area_m2": width_m * height_m * float(valid.mean()),
+    }
+
+
+def mosaic_info(path, max_size=1024):
+    """
+    Returns geographic bounds, size and covered area of the mosaic.
+
+    Parameters:
+        - path: str - Path to the mosaic GeoTIFF.
+        - max_size: int - Size (pixels) of the downsampled mask used to estimate the area.
+
+    Returns:
+        - dict: bounds ([[south, west], [north, east]]), width_m, height_m, area_m2.
+    """
+    return _mosaic_info(path, os.path.getmtime(path), max_size)
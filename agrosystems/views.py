@@ -1,27 +1,59 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect, JsonResponse
-from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.conf import settings
 from django.contrib.staticfiles import finders
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.apps import apps
 from django.http import Http404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.views import PasswordChangeView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from pathlib import Path
 from django.contrib.auth import logout
+from django.utils.dateparse import parse_datetime
 from django.utils.timezone import now
+from django.db import transaction
+from django.db.models import Count
+from collections import defaultdict
+import asyncio
+import json
 import random
-from celery.result import AsyncResult
+import time
+from celery import current_app
+from celery.result import AsyncResult, GroupResult
+from prometheus_client import CONTENT_TYPE_LATEST
 import os
 import shutil
 from .forms import UserRegisterForm, AddProjectForm
-from .models import Project, ObjectDetail, CeleryTask
-from .tasks import process_project
+from .models import (
+    Project,
+    ObjectDetail,
+    CeleryTask,
+    DetectionCluster,
+    ProcessingRun,
+    UploadSession,
+)
+from .storage import (
+    append_chunk,
+    delete_stale_uploads,
+    delete_unused_blobs,
+    delete_upload,
+    get_user_blobs,
+    link_project_images,
+    store_uploaded_file,
+)
+from . import metrics, result_cache
+from .tasks import (
+    get_result_options,
+    restore_cached_result,
+    start_project_processing,
+)
+from .utils import clusters, tiles
+from .utils.spatial import bbox_cells, parse_bbox
 
 class CustomPasswordChangeView(LoginRequiredMixin, PasswordChangeView):
     success_url = reverse_lazy('password_change_done')
@@ -64,57 +96,136 @@ def get_model_path(model_type):
         raise ImproperlyConfigured(f"The model {model_type} does not exist")
 
 
-def save_objects_to_db(project_id, objects_data):
-    try:
-        for data in objects_data[
-            :-2
-        ]:  # Исключаем последние два элемента ('output.tif' и 'Complete')
-            for class_name, details in data.items():
-                for obj in details["objects"]:
-                    ObjectDetail.objects.create(
-                        project_id=project_id,
-                        class_name=class_name,
-                        track_id=obj[1],
-                        box_x1=obj[2][0],
-                        box_y1=obj[2][1],
-                        box_x2=obj[2][2],
-                        box_y2=obj[2][3],
-                        gps_lat=obj[3][0],
-                        gps_lon=obj[3][1],
-                        image_path=obj[4],
-                    )
-    except Exception as e:
-        print(f"Ошибка при сохранении в базу данных: {e}")
-
-
+@login_required
 def check_task_status(request, task_id):
+    # Результат сохраняет сам воркер (последний шаг конвейера), здесь только чтение
+    task = get_object_or_404(
+        CeleryTask.objects.select_related("project"), task_id=task_id, project__user=request.user
+    )
+    if task.project.status != "Not complete":
+        return JsonResponse({"status": task.project.status})
+
     task_result = AsyncResult(task_id)
-    if task_result.ready():
-        status = task_result.result[2]
-        if status != "Error":
-            # Получаем результат выполнения задачи
-            result = task_result.result
-
-            # Получаем экземпляр CeleryTask и связанный с ним проект
-            task = CeleryTask.objects.get(task_id=task_id)
-            project = Project.objects.get(id=task.project_id)
-            # Обновляем статус проекта на 'Complete'
-            project.status = status
-            project.save()
-            objects_data = result
-            save_objects_to_db(project.id, objects_data)
-
-            return JsonResponse({"status": "Complete"})
-        else:
-            # В случае ошибки обновляем статус проекта на 'Error'
-            task = CeleryTask.objects.get(task_id=task_id)
-            project = Project.objects.get(id=task.project_id)
-            project.status = status
-            project.save()
+    # Этап, обработано/всего и скорость, если задача уже сообщила прогресс
+    meta = task_result.info if task_result.state == "PROGRESS" else {}
+    return JsonResponse({"status": "PROGRESS", **meta})
+
+
+def get_task_progress(task):
+    result = AsyncResult(task.task_id)
+    progress = {"state": result.state}
+    if result.state == "PROGRESS":
+        # Работает финальная задача (или весь проект одной задачей)
+        progress.update(result.info)
+        return progress
+
+    group = GroupResult.restore(task.group_id) if task.group_id else None
+    if group is None:
+        return progress
+
+    # Задачи-части конвейера: сколько завершено и суммарный прогресс выполняющихся по этапам
+    stages = defaultdict(lambda: {"done": 0, "total": 0, "rate": 0})
+    for child in group.results:
+        if child.state == "PROGRESS":
+            stage = stages[child.info["stage"]]
+            for key in ("done", "total", "rate"):
+                stage[key] += child.info[key]
+    progress["chunks"] = {
+        "done": sum(child.ready() for child in group.results),
+        "total": len(group.results),
+    }
+    progress["stages"] = dict(stages)
+    return progress
 
-            return JsonResponse({"status": "Error"})
-    else:
-        return JsonResponse({"status": "PROGRESS"})
+
+def get_cached_task_progress(task):
+    # Один опрос бэкенда Celery на проект за PROGRESS_CACHE_TTL, сколько бы клиентов ни спрашивали
+    key = f"task_progress:{task.task_id}"
+    progress = cache.get(key)
+    if progress is None:
+        progress = get_task_progress(task)
+        cache.set(key, progress, settings.PROGRESS_CACHE_TTL)
+    return progress
+
+
+@login_required
+def project_progress(request, project_id):
+    task = (
+        CeleryTask.objects.select_related("project")
+        .filter(project_id=project_id, project__user=request.user)
+        .order_by("-id")
+        .first()
+    )
+    if task is None:
+        raise Http404("Project does not exist")
+
+    data = {"status": task.project.status}
+    if task.project.status == "Not complete":
+        data["progress"] = get_cached_task_progress(task)
+    return JsonResponse(data)
+
+
+def serialize_run(run):
+    return {
+        "id": run.id,
+        "project_id": run.project_id,
+        "task_id": run.task_id,
+        "status": run.status,
+        "cached": run.cached,
+        "image_count": run.image_count,
+        "started_at": run.started_at.isoformat(),
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "duration": (run.finished_at - run.started_at).total_seconds() if run.finished_at else None,
+        "error": run.error,
+        "traceback": run.traceback,
+        "stages": [
+            {
+                "name": stage.name,
+                "task_id": stage.task_id,
+                "started_at": stage.started_at.isoformat(),
+                "duration": stage.duration,
+                "items": stage.items,
+                "total": stage.total,
+                "peak_rss": stage.peak_rss,
+                "error": stage.error,
+                "traceback": stage.traceback,
+            }
+            for stage in run.stages.all()
+        ],
+    }
+
+
+@login_required
+def processing_runs(request):
+    """
+    Processing runs with their stage records, newest first. Staff users see the runs of all projects.
+    Query parameters: project (ID), status, since (ISO datetime of the run start), limit.
+    """
+    try:
+        project_id = int(request.GET["project"]) if "project" in request.GET else None
+        limit = max(1, min(int(request.GET.get("limit", 100)), 1000))
+        since = parse_datetime(request.GET["since"]) if "since" in request.GET else None
+        if "since" in request.GET and since is None:
+            raise ValueError("since must be an ISO datetime")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    runs = ProcessingRun.objects.all()
+    if not request.user.is_staff:
+        runs = runs.filter(project__user=request.user)
+    if project_id is not None:
+        runs = runs.filter(project_id=project_id)
+    if "status" in request.GET:
+        runs = runs.filter(status=request.GET["status"])
+    if since is not None:
+        runs = runs.filter(started_at__gte=since)
+    runs = runs.order_by("-started_at").prefetch_related("stages")[:limit]
+    return JsonResponse({"runs": [serialize_run(run) for run in runs]})
+
+
+def metrics_view(request):
+    # Метрики в текстовом формате Prometheus: процессы веб-сервера и длина очереди Celery
+    return HttpResponse(metrics.render(current_app), content_type=CONTENT_TYPE_LATEST)
 
 
 def register(request):
@@ -149,20 +260,39 @@ def user_login(request):
 def read_root(request):
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
         projects = Project.objects.filter(user_id=request.user.id).values()
-        # Получаем все задачи пользователя
-        tasks = CeleryTask.objects.filter(user=request.user)
-        for task in tasks:
-            # Получаем проект, связанный с этой задачей
-            project = task.project
-            if project.status == "Not complete":
-                # Вызываем метод check_task_status для этой задачи
-                check_task_status(request, task.task_id)
-        return JsonResponse({"projects": list(projects)})
+        return JsonResponse({"projects": list(projects), "timestamp": now().isoformat()})
 
     models = scan_models_directory()
     return render(request, "agrosystems/index.html", {"models": models})
 
 
+@login_required
+async def project_changes(request):
+    """
+    Long poll: answers as soon as any project of the user changes after ?since= (ISO timestamp),
+    or with an empty list after LONG_POLL_TIMEOUT seconds. Every check is one indexed query.
+
+    The view is async: under ASGI (agrosystem.asgi, e.g. uvicorn or daphne) a waiting request does not
+    hold a worker. Under WSGI (gunicorn sync workers) every open page still holds a worker thread
+    for up to LONG_POLL_TIMEOUT seconds.
+    """
+    since = parse_datetime(request.GET.get("since", ""))
+    if since is None:
+        return JsonResponse({"error": "Invalid since"}, status=400)
+
+    user = await request.auser()
+    projects = Project.objects.filter(user_id=user.id)
+    deadline = time.monotonic() + settings.LONG_POLL_TIMEOUT
+    while True:
+        timestamp = now()
+        if await projects.filter(updated_at__gt=since).aexists() or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(settings.LONG_POLL_INTERVAL)
+
+    changed = [project async for project in projects.filter(updated_at__gt=since).values()]
+    return JsonResponse({"projects": changed, "timestamp": timestamp.isoformat()})
+
+
 @login_required
 def add_project(request):
     if request.method == "POST":
@@ -172,7 +302,16 @@ def add_project(request):
             model_type = form.cleaned_data["model_type"]
             images = request.FILES.getlist("images")  # Получаем список файлов
             hfov = form.cleaned_data["hfov"]
+            inference_backend = form.cleaned_data["inference_backend"] or settings.INFERENCE_BACKEND
             user = request.user
+            # Снимки, уже загруженные по частям: список {"sha256", "name"} в JSON
+            try:
+                uploaded = [
+                    (str(item["sha256"]), str(item["name"]))
+                    for item in json.loads(form.cleaned_data["image_blobs"] or "[]")
+                ]
+            except (ValueError, KeyError, TypeError) as e:
+                return JsonResponse({"error": f"Invalid image_blobs: {e}"}, status=400)
             # Проверяем, существует ли уже проект с таким именем для данного пользователя
             existing_project = Project.objects.filter(user=user, project_name=project_name).exists()
             if existing_project:
@@ -190,29 +329,76 @@ def add_project(request):
             # Определяем путь к выходному файлу
             output_file = os.path.join(project_directory, "output.tif")
 
-            file_paths = []
-            for image in images:
-                fs = FileSystemStorage(location=project_directory)
-                filename = fs.save(image.name, image)
-                file_path = fs.path(filename)
-                file_paths.append(file_path)
-
-            file_paths = sorted(file_paths)
-            # Запуск задачи Celery
-            task = process_project.delay(
-                file_paths, get_model_path(model_path), output_file, hfov
+            # Снимки, загруженные по частям, и снимки из самой формы хранятся по хэшу содержимого,
+            # в директории проекта только ссылки на них. Файлы пишутся до транзакции, чтобы не держать
+            # блокировку базы на время записи; только что сохранённые снимки delete_unused_blobs
+            # не трогает (UNUSED_BLOB_MIN_AGE)
+            stored = [(store_uploaded_file(image), image.name) for image in images]
+            with transaction.atomic():
+                blobs = get_user_blobs(user, [sha256 for sha256, _ in uploaded])
+                blobs_with_names = [
+                    (blobs[sha256], name) for sha256, name in uploaded if sha256 in blobs
+                ]
+                blobs_with_names += stored
+
+                project = Project.objects.create(
+                    project_name=project_name,
+                    model_type=model_type,
+                    status="Not complete",
+                    output_path=output_file,
+                    hfov=hfov,
+                    inference_backend=inference_backend,
+                    user=request.user,  # Использование текущего пользователя
+                )
+                file_paths = sorted(link_project_images(project, blobs_with_names, project_directory))
+                # Завершённые загрузки больше не нужны: снимки теперь держит проект
+                UploadSession.objects.filter(
+                    user=user, blob__in=[blob for blob, _ in blobs_with_names]
+                ).delete()
+            # Ключ кэша результатов: хэши снимков в порядке обработки, хэш модели, hfov и настройки
+            hashes = dict(project.images.values_list("name", "blob__sha256"))
+            cache_key = result_cache.make_cache_key(
+                [hashes[os.path.basename(path)] for path in file_paths],
+                get_model_path(model_path),
+                hfov,
+                get_result_options(inference_backend),
             )
-            project = Project.objects.create(
-                project_name=project_name,
-                model_type=model_type,
-                status="Not complete",
-                output_path=output_file,
-                hfov=hfov,
-                user=request.user,  # Использование текущего пользователя
+            cached = result_cache.get_cached_result(cache_key) is not None
+            metrics.RESULT_CACHE_LOOKUPS.labels(result="hit" if cached else "miss").inc()
+            run = ProcessingRun.objects.create(
+                project=project, cached=cached, image_count=len(file_paths)
             )
+            # Запуск задачи Celery; результат и статус проекта сохраняет воркер
+            if cached:
+                task = restore_cached_result.delay(
+                    cache_key,
+                    output_file,
+                    project.id,
+                    file_paths,
+                    get_model_path(model_path),
+                    hfov,
+                    inference_backend,
+                    run_id=run.id,
+                )
+            else:
+                task = start_project_processing(
+                    file_paths,
+                    get_model_path(model_path),
+                    output_file,
+                    hfov,
+                    inference_backend,
+                    project_id=project.id,
+                    cache_key=cache_key,
+                    run_id=run.id,
+                )
+            # update(), чтобы не затереть статус, если воркер уже завершил запуск
+            ProcessingRun.objects.filter(pk=run.pk).update(task_id=task.id)
 
             CeleryTask.objects.create(
-                task_id=task.id, user=request.user, project=project
+                task_id=task.id,
+                group_id=task.parent.id if task.parent is not None else "",
+                user=request.user,
+                project=project,
             )
             # Перенаправление пользователя на страницу с индикатором выполнения задачи
             return HttpResponseRedirect("/")
@@ -244,6 +430,9 @@ def delete_project(request, project_id):
     # Удаляем директорию проекта, если она существует
     if os.path.exists(project_dir):
         shutil.rmtree(project_dir)
+    # Брошенные загрузки и снимки, которые больше не нужны ни одному проекту
+    delete_stale_uploads()
+    delete_unused_blobs()
 
     return JsonResponse(
         {
@@ -253,34 +442,253 @@ def delete_project(request, project_id):
 
 
 @login_required
-def view_map(request, project_id):
-    project = Project.objects.get(pk=project_id)
+def create_upload(request):
+    """
+    Starts a resumable upload of one file. POST JSON: filename, size and optionally sha256.
+    If the user has already uploaded a file with this sha256, nothing has to be uploaded.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        data = json.loads(request.body)
+        filename = os.path.basename(str(data["filename"]))
+        size = int(data["size"])
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({"error": f"Invalid parameters: {e}"}, status=400)
+
+    # Без загрузки обходятся только файлы, которые этот пользователь уже загружал
+    sha256 = str(data.get("sha256") or "")
+    blob = get_user_blobs(request.user, [sha256]).get(sha256)
+    if blob is not None and os.path.isfile(blob.path):
+        return JsonResponse({"sha256": blob.sha256, "complete": True})
+
+    session = UploadSession.objects.create(user=request.user, filename=filename, size=size)
+    return JsonResponse(
+        {
+            "upload_id": str(session.id),
+            "offset": 0,
+            "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+            "complete": False,
+        }
+    )
 
-    object_details = ObjectDetail.objects.filter(project_id=project_id)
-    object_details_data = [
+
+@login_required
+def upload_chunk(request, upload_id):
+    """
+    GET - current offset of the upload (to resume after a dropped connection).
+    PUT ?offset= - the next chunk as the raw request body. 409 if the offset does not match.
+    DELETE - cancel the upload.
+    """
+    try:
+        session = UploadSession.objects.get(pk=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        raise Http404("Upload does not exist")
+
+    if request.method == "DELETE":
+        delete_upload(session)
+        return JsonResponse({"message": "Upload deleted"})
+    if request.method == "PUT":
+        try:
+            offset = int(request.GET["offset"])
+        except (KeyError, ValueError):
+            return JsonResponse({"error": "Invalid offset"}, status=400)
+        if not append_chunk(session, offset, request):
+            return JsonResponse({"error": "Offset mismatch", "offset": session.received}, status=409)
+
+    return JsonResponse(
         {
-            "id": obj.id,
-            "class_name": obj.class_name,
-            "track_id": obj.track_id,
-            "box_x1": obj.box_x1,
-            "box_y1": obj.box_y1,
-            "box_x2": obj.box_x2,
-            "box_y2": obj.box_y2,
-            "gps_lat": obj.gps_lat,
-            "gps_lon": obj.gps_lon,
-            "image_path": obj.image_path,
+            "upload_id": str(session.id),
+            "offset": session.received,
+            "complete": session.blob_id is not None,
+            "sha256": session.blob.sha256 if session.blob_id is not None else None,
         }
-        for obj in object_details
-    ] if object_details.exists() else []
+    )
+
+
+def get_project_mosaic(project):
+    # Полная мозаика, когда проект готов; до этого - предварительная, если она уже построена
+    if project.status == "Complete" and os.path.isfile(project.output_path):
+        return project.output_path
+    if project.quicklook_path and os.path.isfile(project.quicklook_path):
+        return project.quicklook_path
+    return None
+
+
+@login_required
+def view_map(request, project_id):
+    try:
+        project = Project.objects.get(pk=project_id, user=request.user)
+    except Project.DoesNotExist:
+        raise Http404("Project does not exist")
+    mosaic_path = get_project_mosaic(project)
+
+    # Сами объекты карта запрашивает по видимой области через project_objects
+    class_counts = {
+        row["class_name"]: row["count"]
+        for row in ObjectDetail.objects.filter(project_id=project_id)
+        .values("class_name")
+        .annotate(count=Count("id"))
+        .order_by("class_name")
+    }
+
+    # Размеры и площадь поля считаются на сервере по уменьшенной маске мозаики
+    mosaic_info = None
+    if mosaic_path is not None:
+        mosaic_info = tiles.mosaic_info(mosaic_path)
 
     context = {
         "settings": settings,
         "project": project,
-        "object_details": object_details_data,
+        "class_counts": class_counts,
+        "objects_url": reverse("project_objects", args=[project.id]),
+        "clusters_url": reverse("project_clusters", args=[project.id]),
+        "cluster_max_zoom": settings.CLUSTER_MAX_ZOOM,
+        "mosaic_info": mosaic_info,
+        # Версия в адресе тайлов: браузер не покажет из своего кэша тайлы предварительной мозаики
+        "tile_url": reverse("project_tile", args=[project.id, 0, 0, 0]).replace(
+            "/0/0/0.png", "/{z}/{x}/{y}.png"
+        )
+        + (f"?v={os.stat(mosaic_path).st_mtime_ns}" if mosaic_path else ""),
+        "is_preview": mosaic_path is not None and mosaic_path != project.output_path,
+        "progress_url": reverse("project_progress", args=[project.id]),
     }
 
     return render(request, "agrosystems/map.html", context)
 
+
+@login_required
+def project_objects(request, project_id):
+    """
+    Returns detections of the project as GeoJSON, page by page.
+
+    Query parameters: bbox=west,south,east,north (optional), class_name (optional, can be repeated),
+    cursor (next_cursor of the previous page) and limit.
+    """
+    if not Project.objects.filter(pk=project_id, user=request.user).exists():
+        raise Http404("Project does not exist")
+
+    try:
+        cursor = int(request.GET.get("cursor", 0))
+        limit = max(
+            1,
+            min(
+                int(request.GET.get("limit", settings.OBJECT_API_PAGE_SIZE)),
+                settings.OBJECT_API_MAX_PAGE_SIZE,
+            ),
+        )
+        bbox = parse_bbox(request.GET["bbox"]) if "bbox" in request.GET else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    objects = ObjectDetail.objects.filter(project_id=project_id, id__gt=cursor)
+    if bbox:
+        # Сначала отбор по ячейкам сетки (индекс), затем точная проверка координат
+        (min_x, max_x), (min_y, max_y) = bbox_cells(bbox, settings.OBJECT_GRID_CELL_DEGREES)
+        west, south, east, north = bbox
+        objects = objects.filter(
+            grid_x__range=(min_x, max_x),
+            grid_y__range=(min_y, max_y),
+            gps_lon__range=(west, east),
+            gps_lat__range=(south, north),
+        )
+    class_names = request.GET.getlist("class_name")
+    if class_names:
+        objects = objects.filter(class_name__in=class_names)
+
+    rows = list(
+        objects.order_by("id").values_list(
+            "id", "class_name", "track_id", "gps_lat", "gps_lon", "image_path"
+        )[: limit + 1]
+    )
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+
+    return JsonResponse(
+        {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": obj_id,
+                    "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                    "properties": {
+                        "class_name": class_name,
+                        "track_id": track_id,
+                        "image_path": image_path,
+                    },
+                }
+                for obj_id, class_name, track_id, lat, lon, image_path in rows[:limit]
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@login_required
+def project_clusters(request, project_id):
+    """
+    Returns precomputed clusters of the zoom level as GeoJSON points with the number of objects.
+
+    Query parameters: zoom (required), bbox=west,south,east,north (optional), class_name (optional, can be repeated).
+    """
+    if not Project.objects.filter(pk=project_id, user=request.user).exists():
+        raise Http404("Project does not exist")
+
+    try:
+        zoom = int(request.GET["zoom"])
+        bbox = parse_bbox(request.GET["bbox"]) if "bbox" in request.GET else None
+    except (KeyError, ValueError) as e:
+        return JsonResponse({"error": f"Invalid parameters: {e}"}, status=400)
+    # На мелком масштабе показываем самые крупные кластеры, на крупном карта запрашивает сами объекты
+    zoom = min(max(zoom, settings.CLUSTER_MIN_ZOOM), settings.CLUSTER_MAX_ZOOM)
+
+    project_clusters = DetectionCluster.objects.filter(project_id=project_id, zoom=zoom)
+    if bbox:
+        (min_x, max_x), (min_y, max_y) = clusters.bbox_cells(
+            bbox, zoom, settings.CLUSTER_CELL_PIXELS
+        )
+        project_clusters = project_clusters.filter(
+            cell_x__range=(min_x, max_x), cell_y__range=(min_y, max_y)
+        )
+    class_names = request.GET.getlist("class_name")
+    if class_names:
+        project_clusters = project_clusters.filter(class_name__in=class_names)
+
+    return JsonResponse(
+        {
+            "type": "FeatureCollection",
+            "zoom": zoom,
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                    "properties": {"class_name": class_name, "count": count},
+                }
+                for class_name, count, lat, lon in project_clusters.values_list(
+                    "class_name", "count", "gps_lat", "gps_lon"
+                )
+            ],
+        }
+    )
+
+
+@login_required
+def project_tile(request, project_id, z, x, y):
+    try:
+        project = Project.objects.get(pk=project_id, user=request.user)
+    except Project.DoesNotExist:
+        raise Http404("Project does not exist")
+
+    mosaic_path = get_project_mosaic(project)
+    if mosaic_path is None:
+        raise Http404("Mosaic does not exist")
+
+    response = HttpResponse(tiles.get_tile(mosaic_path, z, x, y), content_type="image/png")
+    # Тайлы меняются только при пересоздании мозаики
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
+
+
 @login_required
 def user_profile(request):
     # Assuming you want to display information of the logged-in user